@@ -0,0 +1,178 @@
+"""Aggregate the validation errors of a batch of records, for triaging a broken feed.
+
+Errors are grouped by ErrorKey: (version, JSON path, keyword, $comment of the rule). Each group
+counts the invalid records that have the error, and keeps the ids of the first few of them, so
+an aggregator takes the same memory whether it has seen a thousand records or a billion.
+
+A record is only checked against the versions its discriminators (eg. input_schema_version)
+allow, when there are any: errors of the version a record claims to be are what's interesting,
+not the rejections of every other version.
+"""
+import functools
+import json
+from typing import IO, Any, Dict, Iterable, List, NamedTuple, Optional
+
+from raven_schemas import discriminators, validate
+
+DEFAULT_MAX_EXAMPLES = 5
+DEFAULT_MAX_GROUPS = 10_000
+# Schema paths whose $comment is remembered
+COMMENT_CACHE_SIZE = 4096
+
+
+class ErrorKey(NamedTuple):
+    version: str
+    # eg. '$.survey.systems.primary_heating.functional'
+    json_path: str
+    keyword: str
+    # $comment of the innermost subschema holding the failing keyword
+    comment: Optional[str]
+
+
+# Keys of the records that aren't JSON, and of those nested too deeply to validate
+INVALID_JSON = ErrorKey("-", "$", "json", None)
+TOO_DEEP = ErrorKey("-", "$", "depth", None)
+
+
+def schema_comment(schema_name: str, version: str, schema_path: str) -> Optional[str]:
+    """$comment of the innermost subschema (other than the root) on a schema path,
+    eg. '#/properties/survey/allOf/0/then/properties/functional/const'
+    """
+    return _schema_comment(
+        schema_name,
+        version,
+        validate.registry.schema_hash(schema_name, version),
+        schema_path,
+    )
+
+
+@functools.lru_cache(maxsize=COMMENT_CACHE_SIZE)
+def _schema_comment(
+    schema_name: str, version: str, schema_hash: str, schema_path: str
+) -> Optional[str]:
+    # Keyed by the hash of the registry's schema, so a validator rebuilt from an edited file
+    # doesn't get the comments of the one before it
+    schema: Any = validate.registry.get(schema_name, version).schema
+    comment = None
+    for part in schema_path.split("/")[1:]:
+        if isinstance(schema, dict):
+            schema = schema.get(part)
+        elif isinstance(schema, list) and part.isdigit() and int(part) < len(schema):
+            schema = schema[int(part)]
+        else:
+            break
+        if isinstance(schema, dict) and isinstance(schema.get("$comment"), str):
+            comment = schema["$comment"]
+    return comment
+
+
+def error_keys(json_data: Any, schema_name: str, versions: List[str]) -> List[ErrorKey]:
+    """Every distinct ErrorKey of a document, for the versions it claims to be (see above).
+    Empty if the document is valid for one of them.
+    """
+    if not isinstance(json_data, dict):
+        candidates = list(versions)
+    else:
+        candidates, _ = discriminators.get_discriminator_index(schema_name).partition(
+            json_data, versions
+        )
+    report = validate.check_versions(
+        json_data, schema_name, list(candidates) or list(versions), max_errors=None
+    )
+    if report.valid_versions:
+        return []
+    keys = (
+        ErrorKey(
+            detail.version,
+            detail.json_path,
+            detail.keyword,
+            schema_comment(schema_name, detail.version, detail.schema_path),
+        )
+        for details in report.errors.values()
+        for detail in details
+    )
+    return list(dict.fromkeys(keys))
+
+
+class ErrorAggregator:
+    """Counts of invalid records by ErrorKey, with the ids of the first few of each.
+
+    At most max_groups keys are counted; errors with a key beyond them are only counted in
+    `dropped`.
+    """
+
+    def __init__(
+        self,
+        max_examples: int = DEFAULT_MAX_EXAMPLES,
+        max_groups: int = DEFAULT_MAX_GROUPS,
+    ):
+        self.max_examples = max_examples
+        self.max_groups = max_groups
+        self.records = 0
+        self.counts: Dict[ErrorKey, int] = {}
+        self.examples: Dict[ErrorKey, List[str]] = {}
+        self.dropped = 0
+
+    def add(self, record_id: str, keys: Iterable[ErrorKey]) -> None:
+        """Fold in the errors of an invalid record"""
+        self.records += 1
+        for key in keys:
+            self._count(key, 1, [record_id])
+
+    def _count(self, key: ErrorKey, count: int, record_ids: List[str]) -> None:
+        if key not in self.counts:
+            if len(self.counts) >= self.max_groups:
+                self.dropped += count
+                return
+            self.counts[key] = 0
+            self.examples[key] = []
+        self.counts[key] += count
+        examples = self.examples[key]
+        examples.extend(record_ids[: self.max_examples - len(examples)])
+
+    def merge(self, other: "ErrorAggregator") -> None:
+        """Fold in the counts of another aggregator, eg. of another batch"""
+        self.records += other.records
+        self.dropped += other.dropped
+        for key, count in other.counts.items():
+            self._count(key, count, other.examples[key])
+
+    def groups(self) -> List[Dict[str, Any]]:
+        """Groups, the most frequent first"""
+        return [
+            dict(key._asdict(), count=count, examples=self.examples[key])
+            for key, count in sorted(
+                self.counts.items(), key=lambda item: (-item[1], item[0].version)
+            )
+        ]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "invalid_records": self.records,
+            "dropped_errors": self.dropped,
+            "groups": self.groups(),
+        }
+
+    def write_json(self, stream: IO[str]) -> None:
+        json.dump(self.to_dict(), stream, indent=2)
+        stream.write("\n")
+
+    def render(self, limit: Optional[int] = 10) -> str:
+        """The most frequent groups, one per line"""
+        groups = self.groups()
+        lines = [f"Errors of {self.records} invalid records, most frequent first:"]
+        for group in groups[:limit]:
+            line = (
+                f"  {group['count']:>8}  {group['version']} {group['json_path']} "
+                f"({group['keyword']})"
+            )
+            if group["comment"]:
+                line += f": {group['comment']}"
+            lines.append(f"{line}  eg. records {', '.join(group['examples'])}")
+        if limit is not None and len(groups) > limit:
+            lines.append(f"  ... and {len(groups) - limit} more groups")
+        if self.dropped:
+            lines.append(
+                f"  {self.dropped} errors beyond the first {self.max_groups} groups"
+            )
+        return "\n".join(lines)
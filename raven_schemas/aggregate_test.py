@@ -0,0 +1,135 @@
+import io
+import json
+
+import pytest
+
+from raven_schemas import aggregate as module
+from raven_schemas import validate
+from raven_schemas.constants import PACKAGE_DIR
+
+VERSIONS = ["1.0.0", "1.1.0", "2.0.0"]
+NO_FUEL = "Fuel_type set to None, but ducted_heating, functional, over_age, furnace_vent, system and insulated_ducts aren't null"  # noqa: E501
+
+
+@pytest.fixture
+def valid_2_0_0_modeling_json():
+    with open(
+        PACKAGE_DIR / "schemas/modeling_input_2_0_0_sample_valid.json"
+    ) as modeling_input:
+        return json.load(modeling_input)
+
+
+def test_schema_comment():
+    # The innermost comment on the path
+    assert (
+        module.schema_comment(
+            "modeling_input", "2.0.0", "#/properties/roofMaterial/enum"
+        )
+        is not None
+    )
+    assert module.schema_comment("modeling_input", "2.0.0", "#/required") is None
+    assert module.schema_comment("modeling_input", "2.0.0", "#/no/such/0") is None
+
+
+def test_schema_comment__schema_edited(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        validate, "registry", validate.ValidatorRegistry(prebuilt=False)
+    )
+    path = "#/properties/roofMaterial/enum"
+    before = module.schema_comment("modeling_input", "2.0.0", path)
+    schema = validate.schemas.load_schema("modeling_input", "2.0.0")
+    schema["properties"]["roofMaterial"]["$comment"] = "Edited"
+    edited = tmp_path / "modeling_input_2_0_0_schema.json"
+    edited.write_text(json.dumps(schema))
+    monkeypatch.setattr(validate.schemas, "get_schema_path", lambda *args: edited)
+    # The registry keeps its validator until it's cleared
+    assert module.schema_comment("modeling_input", "2.0.0", path) == before
+    validate.registry.clear()
+    assert module.schema_comment("modeling_input", "2.0.0", path) == "Edited"
+
+
+def test_error_keys(valid_2_0_0_modeling_json):
+    assert (
+        module.error_keys(valid_2_0_0_modeling_json, "modeling_input", VERSIONS) == []
+    )
+    valid_2_0_0_modeling_json["survey"]["systems"]["primary_heating"][
+        "fuel_type"
+    ] = "None"
+    keys = module.error_keys(valid_2_0_0_modeling_json, "modeling_input", VERSIONS)
+    # Only the version the document claims to be
+    assert {key.version for key in keys} == {"2.0.0"}
+    assert (
+        module.ErrorKey(
+            "2.0.0", "$.survey.systems.primary_heating.functional", "const", NO_FUEL
+        )
+        in keys
+    )
+    assert len(set(keys)) == len(keys)
+
+
+def test_error_keys__no_candidates():
+    keys = module.error_keys([], "modeling_input", VERSIONS)
+    assert keys == [module.ErrorKey(version, "$", "type", None) for version in VERSIONS]
+
+
+def test_validate_record__details(valid_2_0_0_modeling_json):
+    valid_2_0_0_modeling_json["roofMaterial"] = "Straw"
+    verdict = validate.validate_record(
+        valid_2_0_0_modeling_json, "modeling_input", VERSIONS, details=True
+    )
+    assert [(key.json_path, key.keyword) for key in verdict.errors] == [
+        ("$.roofMaterial", "enum")
+    ]
+    assert (
+        validate.validate_record(
+            valid_2_0_0_modeling_json, "modeling_input", VERSIONS
+        ).errors
+        == ()
+    )
+    assert validate.validate_record(
+        b"{bad", "modeling_input", VERSIONS, details=True
+    ).errors == (module.INVALID_JSON,)
+
+
+def test_error_aggregator():
+    a = module.ErrorKey("2.0.0", "$.a", "enum", None)
+    b = module.ErrorKey("2.0.0", "$.b", "const", "b must be null")
+    aggregator = module.ErrorAggregator(max_examples=2)
+    for record_id in range(5):
+        aggregator.add(str(record_id), [a, b] if record_id % 2 else [a])
+    assert aggregator.records == 5
+    assert aggregator.groups() == [
+        dict(a._asdict(), count=5, examples=["0", "1"]),
+        dict(b._asdict(), count=2, examples=["1", "3"]),
+    ]
+    rendered = aggregator.render()
+    assert "2.0.0 $.b (const): b must be null  eg. records 1, 3" in rendered
+    assert "more groups" not in rendered
+    assert "... and 1 more groups" in aggregator.render(limit=1)
+
+
+def test_error_aggregator__merge():
+    a = module.ErrorKey("2.0.0", "$.a", "enum", None)
+    b = module.ErrorKey("2.0.0", "$.b", "enum", None)
+    first, second = module.ErrorAggregator(2), module.ErrorAggregator(2)
+    first.add("1", [a])
+    second.add("2", [a, b])
+    second.add("3", [a])
+    first.merge(second)
+    assert first.records == 3
+    assert first.counts == {a: 3, b: 1}
+    assert first.examples == {a: ["1", "2"], b: ["2"]}
+
+
+def test_error_aggregator__max_groups():
+    aggregator = module.ErrorAggregator(max_groups=2)
+    for index in range(5):
+        aggregator.add(
+            str(index), [module.ErrorKey("2.0.0", f"$.{index}", "enum", None)]
+        )
+    assert len(aggregator.counts) == 2
+    assert aggregator.dropped == 3
+    report = io.StringIO()
+    aggregator.write_json(report)
+    assert json.loads(report.getvalue())["dropped_errors"] == 3
+    assert "3 errors beyond the first 2 groups" in aggregator.render()
@@ -0,0 +1,202 @@
+"""asyncio front end to validation, for services that can't block their event loop.
+
+Validation is CPU-bound, so it is run in an executor:
+- "thread" (the default) keeps the event loop responsive with the least overhead, but
+  validations share the GIL with the loop
+- "process" validates in parallel in warm worker processes, at the cost of pickling each record
+
+validate_many_async applies backpressure: at most `max_in_flight` records are being validated
+at once, and the input isn't read any further until the oldest of them is done.
+Cancelling the consumer cancels the pending validations.
+"""
+import asyncio
+import functools
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import AsyncIterable, AsyncIterator, Iterable, List, Optional, Union
+
+from raven_schemas import schemas, validate
+from raven_schemas.validate import Record, Verdict
+
+EXECUTOR_KINDS = ["thread", "process"]
+
+# End of input marker on the in-flight queue
+_DONE = object()
+
+
+def make_executor(
+    schema_name: str,
+    versions: Optional[List[str]] = None,
+    kind: str = "thread",
+    workers: Optional[int] = None,
+) -> Executor:
+    """An executor whose workers have the schema's validators built ahead of time"""
+    if versions is None:
+        versions = schemas.get_known_schemas_and_versions()[schema_name]
+    if kind == "thread":
+        # Threads share this process' validator registry
+        validate.warm_worker(schema_name, list(versions))
+        return ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="raven-schemas"
+        )
+    if kind == "process":
+        return ProcessPoolExecutor(
+            max_workers=workers or os.cpu_count(),
+            initializer=validate.warm_worker,
+            initargs=(schema_name, list(versions)),
+        )
+    raise ValueError(f"Unknown executor {kind}, expected one of {EXECUTOR_KINDS}")
+
+
+async def validate_async(
+    json_data: dict,
+    schema_name: str,
+    versions: List[str],
+    executor: Optional[Executor] = None,
+) -> List[str]:
+    """Awaitable validate.find_valid_versions, run in the executor (the loop's default one if None)
+    @raises validate.ValidationError if none of the versions validate.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        executor,
+        functools.partial(
+            validate.find_valid_versions, json_data, schema_name, list(versions)
+        ),
+    )
+
+
+async def validate_record_async(
+    record: Record,
+    schema_name: str,
+    versions: List[str],
+    executor: Optional[Executor] = None,
+) -> Verdict:
+    """Awaitable validate.validate_record: raw JSON is parsed in the executor too"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        executor,
+        functools.partial(
+            validate.validate_record, record, schema_name, list(versions)
+        ),
+    )
+
+
+async def _aiter(
+    records: Union[Iterable[Record], AsyncIterable[Record]]
+) -> AsyncIterator[Record]:
+    if isinstance(records, AsyncIterable):
+        async for record in records:
+            yield record
+    else:
+        for record in records:
+            yield record
+
+
+async def validate_many_async(
+    records: Union[Iterable[Record], AsyncIterable[Record]],
+    schema_name: str,
+    versions: Optional[List[str]] = None,
+    executor: Optional[Executor] = None,
+    max_in_flight: int = 64,
+) -> AsyncIterator[Verdict]:
+    """Validate a (sync or async) stream of records, yielding one Verdict per record, in order"""
+    if max_in_flight < 1:
+        raise ValueError(f"max_in_flight must be at least 1, got {max_in_flight}")
+    if versions is None:
+        versions = schemas.get_known_schemas_and_versions()[schema_name]
+    versions = list(versions)
+    loop = asyncio.get_running_loop()
+    # Futures of the records being validated, oldest first. put() waits while it is full.
+    in_flight: asyncio.Queue = asyncio.Queue(maxsize=max_in_flight)
+
+    async def produce():
+        async for record in _aiter(records):
+            future = loop.run_in_executor(
+                executor,
+                functools.partial(
+                    validate.validate_record, record, schema_name, versions
+                ),
+            )
+            await in_flight.put(future)
+        await in_flight.put(_DONE)
+
+    producer = asyncio.ensure_future(produce())
+    try:
+        while True:
+            getter = asyncio.ensure_future(in_flight.get())
+            # Surface errors reading the input instead of waiting forever
+            await asyncio.wait([getter, producer], return_when=asyncio.FIRST_COMPLETED)
+            if not getter.done():
+                getter.cancel()
+                producer.result()
+                getter = asyncio.ensure_future(in_flight.get())
+            future = await getter
+            if future is _DONE:
+                break
+            yield await future
+    finally:
+        producer.cancel()
+        while not in_flight.empty():
+            future = in_flight.get_nowait()
+            if future is not _DONE:
+                future.cancel()
+        # Let the producer see its cancellation before the loop moves on
+        await asyncio.gather(producer, return_exceptions=True)
+
+
+class AsyncValidator:
+    """Owns a warm executor for one schema; use as `async with AsyncValidator(...) as validator:`"""
+
+    def __init__(
+        self,
+        schema_name: str,
+        versions: Optional[List[str]] = None,
+        executor: str = "thread",
+        workers: Optional[int] = None,
+        max_in_flight: int = 64,
+    ):
+        if versions is None:
+            versions = schemas.get_known_schemas_and_versions()[schema_name]
+        self.schema_name = schema_name
+        self.versions = list(versions)
+        self.max_in_flight = max_in_flight
+        self.executor = make_executor(schema_name, self.versions, executor, workers)
+
+    async def __aenter__(self) -> "AsyncValidator":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            None,
+            functools.partial(self.executor.shutdown, wait=True, cancel_futures=True),
+        )
+
+    async def validate(
+        self, json_data: dict, versions: Optional[List[str]] = None
+    ) -> List[str]:
+        """@raises validate.ValidationError if none of the versions validate."""
+        return await validate_async(
+            json_data, self.schema_name, versions or self.versions, self.executor
+        )
+
+    async def validate_record(self, record: Record) -> Verdict:
+        return await validate_record_async(
+            record, self.schema_name, self.versions, self.executor
+        )
+
+    def validate_many(
+        self,
+        records: Union[Iterable[Record], AsyncIterable[Record]],
+    ) -> AsyncIterator[Verdict]:
+        return validate_many_async(
+            records,
+            self.schema_name,
+            self.versions,
+            self.executor,
+            self.max_in_flight,
+        )
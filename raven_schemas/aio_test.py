@@ -0,0 +1,115 @@
+import asyncio
+import json
+
+import pytest
+
+from raven_schemas import aio as module
+from raven_schemas import validate
+from raven_schemas.constants import PACKAGE_DIR
+
+
+@pytest.fixture
+def valid_1_0_0_modeling_json():
+    with open(
+        PACKAGE_DIR / "schemas/modeling_input_1_0_0_sample_valid.json"
+    ) as modeling_input:
+        return json.load(modeling_input)
+
+
+def test_validate_async(valid_1_0_0_modeling_json):
+    async def main():
+        assert await module.validate_async(
+            valid_1_0_0_modeling_json, "modeling_input", ["1.0.0", "2.0.0"]
+        ) == ["1.0.0"]
+        with pytest.raises(validate.ValidationError):
+            await module.validate_async(
+                valid_1_0_0_modeling_json, "modeling_input", ["2.0.0"]
+            )
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("executor", module.EXECUTOR_KINDS)
+def test_async_validator__validate_many(valid_1_0_0_modeling_json, executor):
+    good = json.dumps(valid_1_0_0_modeling_json)
+    records = [good, "{not json", valid_1_0_0_modeling_json, {"invalid": "data"}] * 5
+
+    async def main():
+        async with module.AsyncValidator(
+            "modeling_input", ["1.0.0"], executor=executor, workers=2, max_in_flight=3
+        ) as validator:
+            verdicts = [v async for v in validator.validate_many(records)]
+            single = await validator.validate_record(good)
+        return verdicts, single
+
+    verdicts, single = asyncio.run(main())
+    assert [v.valid_versions for v in verdicts] == [["1.0.0"], [], ["1.0.0"], []] * 5
+    assert single.valid_versions == ["1.0.0"]
+
+
+def test_validate_many_async__backpressure(valid_1_0_0_modeling_json):
+    read = 0
+
+    async def records():
+        nonlocal read
+        for _ in range(100):
+            read += 1
+            yield valid_1_0_0_modeling_json
+
+    async def main():
+        verdicts = module.validate_many_async(
+            records(), "modeling_input", ["1.0.0"], max_in_flight=4
+        )
+        first = await verdicts.__anext__()
+        # Give the producer a chance to run ahead
+        await asyncio.sleep(0.05)
+        # At most max_in_flight queued, plus the one waiting to be put
+        assert read <= 1 + 4 + 1
+        await verdicts.aclose()
+        return first
+
+    assert asyncio.run(main()).is_valid
+
+
+def test_validate_many_async__input_errors_propagate():
+    async def records():
+        yield {"invalid": "data"}
+        raise RuntimeError("broken input")
+
+    async def main():
+        return [
+            v
+            async for v in module.validate_many_async(
+                records(), "modeling_input", ["1.0.0"]
+            )
+        ]
+
+    with pytest.raises(RuntimeError, match="broken input"):
+        asyncio.run(main())
+
+
+def test_validate_many_async__cancellation(valid_1_0_0_modeling_json):
+    async def records():
+        while True:
+            yield valid_1_0_0_modeling_json
+            await asyncio.sleep(0)
+
+    async def consume():
+        async for _ in module.validate_many_async(
+            records(), "modeling_input", ["1.0.0"], max_in_flight=2
+        ):
+            pass
+
+    async def main():
+        task = asyncio.ensure_future(consume())
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+
+
+def test_make_executor__unknown_kind():
+    with pytest.raises(ValueError):
+        module.make_executor("modeling_input", ["1.0.0"], kind="fibers")
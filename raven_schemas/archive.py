@@ -0,0 +1,307 @@
+"""Re-validate slices of large NDJSON archives without re-reading the whole file.
+
+The archive is memory-mapped, and the offset of every line is kept in an index file next to it
+(<archive>.idx). The index is built on first use, and rebuilt when the archive's size or
+modification time no longer match the ones it was built for. After that, reading a record
+slices its line out of the mapping: only the selected records are copied out of the file.
+
+Records are identified by their line number, as with `validate-ndjson`, so the failures of a
+previous run (see failed_record_ids) can be validated again on their own. Worker processes map
+the archive themselves: each one is only sent the line numbers it validates, never the records.
+"""
+import array
+import csv
+import json
+import mmap
+import os
+import struct
+import sys
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from raven_schemas import schemas, validate
+from raven_schemas.constants import DEFAULT_CHUNKSIZE
+
+INDEX_FORMAT = 1
+INDEX_SUFFIX = ".idx"
+MAGIC = b"RSNDJIDX"
+# magic, format, (padding), archive size, archive mtime in ns, number of lines.
+# 40 bytes, so that the offsets that follow are 8-byte aligned
+_HEADER = struct.Struct("<8sIIQQQ")
+
+
+def default_index_path(path: Union[str, Path]) -> Path:
+    path = Path(path)
+    return path.with_name(path.name + INDEX_SUFFIX)
+
+
+def _line_offsets(mapping: Optional[mmap.mmap], size: int) -> "array.array[int]":
+    """Start of every line, then the end of the file"""
+    offsets = array.array("Q")
+    if size:
+        offsets.append(0)
+        position = mapping.find(b"\n")
+        while position != -1 and position + 1 < size:
+            offsets.append(position + 1)
+            position = mapping.find(b"\n", position + 1)
+    offsets.append(size)
+    return offsets
+
+
+def build_index(
+    path: Union[str, Path], index_path: Optional[Union[str, Path]] = None
+) -> Path:
+    """Write the line-offset index of an archive
+    @returns the path of the index
+    """
+    path = Path(path)
+    index_path = Path(index_path) if index_path else default_index_path(path)
+    with open(path, "rb") as f:
+        stat = os.fstat(f.fileno())
+        mapping = (
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else None
+        )
+        try:
+            offsets = _line_offsets(mapping, stat.st_size)
+        finally:
+            if mapping is not None:
+                mapping.close()
+    header = _HEADER.pack(
+        MAGIC, INDEX_FORMAT, 0, stat.st_size, stat.st_mtime_ns, len(offsets) - 1
+    )
+    # Write then rename, so that a reader never sees a partial index
+    partial = index_path.with_name(f"{index_path.name}.{os.getpid()}.partial")
+    with open(partial, "wb") as f:
+        f.write(header)
+        # Offsets are stored little-endian
+        if sys.byteorder != "little":
+            offsets.byteswap()
+        offsets.tofile(f)
+    partial.replace(index_path)
+    return index_path
+
+
+class NdjsonArchive:
+    """A memory-mapped NDJSON file, with the offsets of its lines.
+
+    Line numbers start at 1. Blank lines are counted, but aren't records.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        index_path: Optional[Union[str, Path]] = None,
+        rebuild: bool = True,
+    ):
+        """@raises ValueError if the index is missing or out of date, and rebuild is False"""
+        self.path = Path(path)
+        self.index_path = (
+            Path(index_path) if index_path else default_index_path(self.path)
+        )
+        # Whether the index was (re)built when opening the archive
+        self.built = False
+        self._file = open(self.path, "rb")
+        self._mapping: Optional[mmap.mmap] = None
+        self._index_mapping: Optional[mmap.mmap] = None
+        try:
+            stat = os.fstat(self._file.fileno())
+            if stat.st_size:
+                self._mapping = mmap.mmap(
+                    self._file.fileno(), 0, access=mmap.ACCESS_READ
+                )
+            self._offsets = self._load_index(stat)
+            if self._offsets is None:
+                if not rebuild:
+                    raise ValueError(
+                        f"Index {self.index_path} of {self.path} is missing or out of date"
+                    )
+                build_index(self.path, self.index_path)
+                self.built = True
+                self._offsets = self._load_index(stat)
+            if self._offsets is None:
+                raise ValueError(f"{self.path} changed while it was being indexed")
+        except BaseException:
+            self.close()
+            raise
+
+    def _load_index(self, stat: os.stat_result) -> Optional[Sequence[int]]:
+        try:
+            with open(self.index_path, "rb") as f:
+                index_mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        if len(index_mapping) >= _HEADER.size:
+            magic, version, _, size, mtime_ns, lines = _HEADER.unpack_from(
+                index_mapping
+            )
+            if (
+                magic == MAGIC
+                and version == INDEX_FORMAT
+                and (size, mtime_ns) == (stat.st_size, stat.st_mtime_ns)
+                and len(index_mapping) == _HEADER.size + 8 * (lines + 1)
+            ):
+                if sys.byteorder != "little":
+                    offsets = array.array("Q", index_mapping[_HEADER.size :])
+                    offsets.byteswap()
+                    index_mapping.close()
+                    return offsets
+                # Offsets are read in place, from the mapping
+                self._index_mapping = index_mapping
+                return memoryview(index_mapping)[_HEADER.size :].cast("Q")
+        index_mapping.close()
+        return None
+
+    def __len__(self) -> int:
+        """Number of lines, blank ones included"""
+        return len(self._offsets) - 1
+
+    def line(self, line_number: int) -> bytes:
+        """The raw line, with its line break
+        @raises IndexError if there's no such line
+        """
+        if not 1 <= line_number <= len(self):
+            raise IndexError(f"{self.path} has no line {line_number}")
+        return self._mapping[
+            self._offsets[line_number - 1] : self._offsets[line_number]
+        ]
+
+    def records(
+        self, line_numbers: Optional[Iterable[int]] = None
+    ) -> Iterator[Tuple[str, bytes]]:
+        """Yield (line number, raw line) for the given lines (default: all of them),
+        skipping blank ones. A range of lines is read in one sequential pass.
+        @raises IndexError if a line doesn't exist
+        """
+        if line_numbers is None:
+            line_numbers = range(1, len(self) + 1)
+        for line_number in line_numbers:
+            line = self.line(line_number)
+            if line.strip():
+                yield str(line_number), line
+
+    def close(self) -> None:
+        # The offsets view must be released before the mapping it points into
+        offsets = getattr(self, "_offsets", None)
+        if isinstance(offsets, memoryview):
+            offsets.release()
+        for mapping in (self._mapping, self._index_mapping):
+            if mapping is not None:
+                mapping.close()
+        self._mapping = self._index_mapping = None
+        self._file.close()
+
+    def __enter__(self) -> "NdjsonArchive":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def failed_record_ids(results_path: Union[str, Path]) -> List[int]:
+    """Line numbers of the invalid records in the results of a bulk validation
+    (`validate-ndjson -o`, NDJSON or CSV)
+    """
+    failed = []
+    with open(results_path, newline="") as f:
+        first = f.readline()
+        f.seek(0)
+        if first.startswith("{"):
+            rows: Iterable[dict] = (json.loads(line) for line in f if line.strip())
+            failed = [int(row["record_id"]) for row in rows if not row["valid"]]
+        else:
+            failed = [
+                int(row["record_id"])
+                for row in csv.DictReader(f)
+                if row["valid"] != "True"
+            ]
+    return failed
+
+
+# The archive each worker process validates
+_worker_archive: Optional[NdjsonArchive] = None
+
+
+def _open_worker(
+    path: Path, index_path: Path, schema_name: str, versions: List[str]
+) -> None:
+    global _worker_archive
+    _worker_archive = NdjsonArchive(path, index_path, rebuild=False)
+    validate.warm_worker(schema_name, versions)
+
+
+def _validate_lines(
+    archive: NdjsonArchive,
+    line_numbers: Iterable[int],
+    schema_name: str,
+    versions: List[str],
+    details: bool = False,
+) -> List[Tuple[str, validate.Verdict]]:
+    return [
+        (record_id, validate.validate_record(record, schema_name, versions, details))
+        for record_id, record in archive.records(line_numbers)
+    ]
+
+
+def _validate_worker_lines(
+    line_numbers: Sequence[int],
+    schema_name: str,
+    versions: List[str],
+    details: bool = False,
+) -> List[Tuple[str, validate.Verdict]]:
+    return _validate_lines(
+        _worker_archive, line_numbers, schema_name, versions, details
+    )
+
+
+def _split(line_numbers: Iterable[int], chunksize: int) -> Iterator[Sequence[int]]:
+    """Chunks of line numbers; ranges are split into ranges, which pickle in constant size"""
+    if isinstance(line_numbers, range):
+        for start in range(0, len(line_numbers), chunksize):
+            yield line_numbers[start : start + chunksize]
+        return
+    yield from validate.chunked(line_numbers, chunksize)
+
+
+def validate_archive(
+    archive: NdjsonArchive,
+    schema_name: str,
+    versions: Optional[List[str]] = None,
+    line_numbers: Optional[Iterable[int]] = None,
+    workers: Optional[int] = None,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    max_in_flight: Optional[int] = None,
+    details: bool = False,
+) -> Iterator[Tuple[str, validate.Verdict]]:
+    """Validate the records on the given lines of an archive (default: all of them) with
+    find_valid_versions, yielding (record id, Verdict) in order. Blank lines are skipped.
+
+    Lines are split into chunks of `chunksize` and validated across a pool of worker processes,
+    as in validate.validate_many; with workers <= 1 everything runs in this process.
+    details is passed on to validate.validate_record.
+    @raises IndexError if a line doesn't exist
+    """
+    if versions is None:
+        versions = schemas.get_known_schemas_and_versions()[schema_name]
+    versions = list(versions)
+    if line_numbers is None:
+        line_numbers = range(1, len(archive) + 1)
+    if chunksize < 1:
+        raise ValueError(f"chunksize must be at least 1, got {chunksize}")
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if workers <= 1:
+        validate.warm_worker(schema_name, versions)
+        for chunk in _split(line_numbers, chunksize):
+            yield from _validate_lines(archive, chunk, schema_name, versions, details)
+        return
+
+    yield from validate.map_chunks(
+        _validate_worker_lines,
+        _split(line_numbers, chunksize),
+        (schema_name, versions, details),
+        workers,
+        max_in_flight,
+        initializer=_open_worker,
+        initargs=(archive.path, archive.index_path, schema_name, versions),
+    )
@@ -0,0 +1,142 @@
+import io
+import json
+import os
+
+import pytest
+
+from raven_schemas import archive as module
+from raven_schemas import bulk
+from raven_schemas.constants import SCHEMA_DIR
+
+
+@pytest.fixture
+def ndjson_file(tmp_path):
+    valid = json.loads(
+        (SCHEMA_DIR / "modeling_input_1_0_0_sample_valid.json").read_text()
+    )
+    path = tmp_path / "records.ndjson"
+    lines = [json.dumps(valid), "", json.dumps({"invalid": "data"}), "{bad"]
+    path.write_text("\n".join(lines * 3) + "\n")
+    return path
+
+
+def test_index__built_once(ndjson_file):
+    with module.NdjsonArchive(ndjson_file) as archive:
+        assert archive.built
+        assert archive.index_path == ndjson_file.with_name("records.ndjson.idx")
+        assert len(archive) == 12
+    with module.NdjsonArchive(ndjson_file) as archive:
+        assert not archive.built
+        assert archive.line(2) == b"\n"
+        assert archive.line(4) == b"{bad\n"
+
+
+def test_index__out_of_date(ndjson_file):
+    module.build_index(ndjson_file)
+    with open(ndjson_file, "a") as f:
+        f.write("{}")
+    with pytest.raises(ValueError, match="out of date"):
+        module.NdjsonArchive(ndjson_file, rebuild=False)
+    with module.NdjsonArchive(ndjson_file) as archive:
+        assert archive.built
+        # Without a final line break
+        assert archive.line(13) == b"{}"
+        with pytest.raises(IndexError):
+            archive.line(14)
+        with pytest.raises(IndexError):
+            archive.line(0)
+
+
+def test_index__empty_file(tmp_path):
+    path = tmp_path / "empty.ndjson"
+    path.write_bytes(b"")
+    with module.NdjsonArchive(path, tmp_path / "index") as archive:
+        assert len(archive) == 0
+        assert list(archive.records()) == []
+    assert (tmp_path / "index").exists()
+
+
+def test_records__same_as_iter_ndjson(ndjson_file):
+    with module.NdjsonArchive(ndjson_file) as archive:
+        assert list(archive.records()) == list(bulk.iter_ndjson(ndjson_file))
+        assert [record_id for record_id, _ in archive.records([9, 6, 7])] == [
+            "9",
+            "7",
+        ]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_validate_archive(ndjson_file, workers):
+    expected = io.StringIO()
+    bulk.validate_stream(
+        bulk.iter_ndjson(ndjson_file),
+        "modeling_input",
+        ["1.0.0", "2.0.0"],
+        bulk.VerdictWriter(expected),
+        workers=1,
+    )
+    expected_rows = [json.loads(line) for line in expected.getvalue().splitlines()]
+    with module.NdjsonArchive(ndjson_file) as archive:
+        results = io.StringIO()
+        verdicts = module.validate_archive(
+            archive,
+            "modeling_input",
+            ["1.0.0", "2.0.0"],
+            workers=workers,
+            chunksize=2,
+        )
+        bulk.summarize(verdicts, bulk.VerdictWriter(results))
+        assert [
+            json.loads(line) for line in results.getvalue().splitlines()
+        ] == expected_rows
+
+        verdicts = module.validate_archive(
+            archive,
+            "modeling_input",
+            ["1.0.0", "2.0.0"],
+            range(4, 10),
+            workers=workers,
+            chunksize=2,
+        )
+        assert [(record_id, v.is_valid) for record_id, v in verdicts] == [
+            ("4", False),
+            ("5", True),
+            ("7", False),
+            ("8", False),
+            ("9", True),
+        ]
+
+
+def test_failed_record_ids(ndjson_file, tmp_path):
+    for output_format in ["ndjson", "csv"]:
+        results = tmp_path / f"results.{output_format}"
+        with open(results, "w", newline="") as stream:
+            bulk.validate_stream(
+                bulk.iter_ndjson(ndjson_file),
+                "modeling_input",
+                ["1.0.0"],
+                bulk.VerdictWriter(stream, output_format),
+                workers=1,
+            )
+        failed = module.failed_record_ids(results)
+        assert failed == [3, 4, 7, 8, 11, 12]
+    with module.NdjsonArchive(ndjson_file) as archive:
+        verdicts = module.validate_archive(
+            archive, "modeling_input", ["1.0.0"], failed, workers=1
+        )
+        assert not any(verdict.is_valid for _, verdict in verdicts)
+
+
+def test_index__format(ndjson_file):
+    index_path = module.build_index(ndjson_file)
+    stat = os.stat(ndjson_file)
+    header = module._HEADER.unpack_from(index_path.read_bytes())
+    assert header == (
+        module.MAGIC,
+        module.INDEX_FORMAT,
+        0,
+        stat.st_size,
+        stat.st_mtime_ns,
+        12,
+    )
+    assert index_path.stat().st_size == module._HEADER.size + 8 * 13
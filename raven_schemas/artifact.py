@@ -0,0 +1,174 @@
+"""Prebuilt validators, for short-lived processes that can't afford to build them at startup.
+
+`raven-schemas build-artifact` writes every known schema version into one file: each schema
+already checked against its metaschema, its optimized form (see optimize.py), and the bytecode
+of its compiled validators (see codegen), serialized with marshal. Loading the artifact is a
+single read, and building a validator from it skips reading, checking and optimizing the schema.
+
+Each version is stored with the sha256 of its schema file, and is only used while that matches
+the file's contents: a schema edited since the artifact was built is read from its JSON file
+instead, whether or not the manifest was rebuilt.
+The whole artifact is ignored if it was built by another Python version (bytecode isn't
+portable) or by other versions of the modules that produce its contents.
+"""
+import functools
+import hashlib
+import importlib.metadata
+import importlib.util
+import marshal
+from pathlib import Path
+from types import CodeType
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import jsonschema
+
+from raven_schemas import codegen, optimize, schemas
+from raven_schemas.constants import PACKAGE_DIR
+
+ARTIFACT_FORMAT = 1
+DEFAULT_ARTIFACT_PATH = PACKAGE_DIR / "validators.artifact"
+MAGIC = b"raven-schemas artifact\n"
+
+# (schema_name, versions, memoize) -> bytecode of codegen.compile_schema_source
+CodeKey = Tuple[str, Tuple[str, ...], bool]
+
+
+def _builder_fingerprint() -> str:
+    """Identifies the interpreter and the code that produce an artifact's contents"""
+    digest = hashlib.sha256(importlib.util.MAGIC_NUMBER)
+    digest.update(importlib.metadata.version("jsonschema").encode())
+    for module in (codegen, optimize):
+        digest.update(Path(module.__file__).read_bytes())
+    return digest.hexdigest()
+
+
+class Artifact:
+    """The prebuilt contents of an artifact file that are still up to date"""
+
+    def __init__(self, payload: Dict[str, Any]):
+        # (schema_name, version) -> (schema, optimized schema, sha256 of the schema file)
+        self._schemas: Dict[Tuple[str, str], Tuple[dict, dict, str]] = {}
+        self.stale: List[Tuple[str, str]] = []
+        for schema_name, versions in payload["schemas"].items():
+            for version, entry in versions.items():
+                try:
+                    fresh = entry["sha256"] == schemas.get_file_hash(
+                        schema_name, version
+                    )
+                except ValueError:
+                    fresh = False
+                if fresh:
+                    self._schemas[(schema_name, version)] = (
+                        entry["schema"],
+                        entry["optimized"],
+                        entry["sha256"],
+                    )
+                else:
+                    self.stale.append((schema_name, version))
+        self._code: Dict[CodeKey, CodeType] = {
+            (schema_name, tuple(versions), memoize): code
+            for schema_name, versions, memoize, code in payload["code"]
+            if all((schema_name, version) in self._schemas for version in versions)
+        }
+
+    def __len__(self) -> int:
+        return len(self._schemas)
+
+    def schema(
+        self, schema_name: str, version: str, optimized: bool = False
+    ) -> Optional[dict]:
+        """The checked (and optionally optimized) schema, or None if it isn't up to date"""
+        entry = self._schemas.get((schema_name, version))
+        if entry is None:
+            return None
+        return entry[1] if optimized else entry[0]
+
+    def schema_hash(self, schema_name: str, version: str) -> Optional[str]:
+        """sha256 of the schema file the prebuilt schema was read from"""
+        entry = self._schemas.get((schema_name, version))
+        return entry[2] if entry is not None else None
+
+    def code(
+        self, schema_name: str, versions: Tuple[str, ...], memoize: bool = False
+    ) -> Optional[CodeType]:
+        """Bytecode of the compiled validators of these versions, or None if it isn't up to date"""
+        return self._code.get((schema_name, tuple(versions), memoize))
+
+
+def _code_keys(schema_name: str) -> List[CodeKey]:
+    """The compiled modules that codegen.load_validators builds for the library's own callers"""
+    versions = tuple(schemas.get_known_schemas_and_versions()[schema_name])
+    return [
+        (schema_name, versions, False),
+        (schema_name, versions, True),
+        *((schema_name, (version,), False) for version in versions),
+    ]
+
+
+def build_artifact(path: Union[str, Path] = DEFAULT_ARTIFACT_PATH) -> Path:
+    """Build the validators of every known schema version and write them to an artifact file"""
+    schema_entries: Dict[str, Dict[str, Any]] = {}
+    code = []
+    for schema_name, versions in schemas.get_known_schemas_and_versions().items():
+        schema_entries[schema_name] = {}
+        for version in versions:
+            schema, schema_hash = schemas.load_schema_and_hash(schema_name, version)
+            jsonschema.validators.validator_for(
+                schema, default=jsonschema.Draft202012Validator
+            ).check_schema(schema)
+            schema_entries[schema_name][version] = {
+                "sha256": schema_hash,
+                "schema": schema,
+                "optimized": optimize.optimize_schema(schema),
+            }
+        for name, key_versions, memoize in _code_keys(schema_name):
+            source = codegen.compile_schema_source(name, list(key_versions), memoize)
+            code.append(
+                (
+                    name,
+                    list(key_versions),
+                    memoize,
+                    compile(source, f"<compiled {name}>", "exec"),
+                )
+            )
+    payload = {
+        "format": ARTIFACT_FORMAT,
+        "builder": _builder_fingerprint(),
+        "schemas": schema_entries,
+        "code": code,
+    }
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write then rename, so that a concurrent reader never sees a partial file
+    partial = path.with_name(path.name + ".partial")
+    partial.write_bytes(MAGIC + marshal.dumps(payload))
+    partial.replace(path)
+    return path
+
+
+def load_artifact(path: Union[str, Path] = DEFAULT_ARTIFACT_PATH) -> Optional[Artifact]:
+    """Read an artifact file, or None if it's missing, unreadable or was built by other code"""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    if not data.startswith(MAGIC):
+        return None
+    try:
+        payload = marshal.loads(memoryview(data)[len(MAGIC) :])
+    except (EOFError, ValueError, TypeError):
+        return None
+    if (
+        not isinstance(payload, dict)
+        or payload.get("format") != ARTIFACT_FORMAT
+        or payload.get("builder") != _builder_fingerprint()
+    ):
+        return None
+    return Artifact(payload)
+
+
+@functools.cache
+def default_artifact() -> Optional[Artifact]:
+    """The artifact at DEFAULT_ARTIFACT_PATH, loaded once per process"""
+    return load_artifact(DEFAULT_ARTIFACT_PATH)
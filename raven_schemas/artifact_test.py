@@ -0,0 +1,122 @@
+import json
+
+import pytest
+
+from raven_schemas import artifact as module
+from raven_schemas import codegen, optimize, schemas, validate
+from raven_schemas.constants import PACKAGE_DIR
+
+VERSIONS = schemas.get_known_schemas_and_versions()["modeling_input"]
+
+
+@pytest.fixture(scope="module")
+def artifact_path(tmp_path_factory):
+    return module.build_artifact(tmp_path_factory.mktemp("artifact") / "validators")
+
+
+@pytest.fixture
+def valid_2_0_0_modeling_json():
+    with open(
+        PACKAGE_DIR / "schemas/modeling_input_2_0_0_sample_valid.json"
+    ) as modeling_input:
+        return json.load(modeling_input)
+
+
+def test_load_artifact(artifact_path, valid_2_0_0_modeling_json):
+    prebuilt = module.load_artifact(artifact_path)
+    assert len(prebuilt) == len(VERSIONS)
+    assert prebuilt.stale == []
+    for version in VERSIONS:
+        schema = schemas.load_schema("modeling_input", version)
+        assert prebuilt.schema("modeling_input", version) == schema
+        assert prebuilt.schema(
+            "modeling_input", version, optimized=True
+        ) == optimize.optimize_schema(schema)
+    assert prebuilt.schema("modeling_input", "9.9.9") is None
+
+    namespace = {}
+    exec(prebuilt.code("modeling_input", tuple(VERSIONS)), namespace)
+    assert namespace["VALIDATORS"]["2.0.0"](valid_2_0_0_modeling_json) is None
+    assert namespace["VALIDATORS"]["1.0.0"](valid_2_0_0_modeling_json) is not None
+    assert prebuilt.code("modeling_input", ("2.0.0",), memoize=False) is not None
+    assert prebuilt.code("modeling_input", ("1.0.0", "2.0.0")) is None
+
+
+def test_load_artifact__stale_versions(artifact_path, tmp_path, monkeypatch):
+    # 1.0.0 was edited since the artifact was built, and the manifest not rebuilt
+    edited = tmp_path / "modeling_input_1_0_0_schema.json"
+    edited.write_bytes(
+        schemas.get_schema_path("modeling_input", "1.0.0").read_bytes() + b"\n"
+    )
+    get_schema_path = schemas.get_schema_path
+    monkeypatch.setattr(
+        module.schemas,
+        "get_schema_path",
+        lambda name, version: edited
+        if version == "1.0.0"
+        else get_schema_path(name, version),
+    )
+    prebuilt = module.load_artifact(artifact_path)
+    assert prebuilt.stale == [("modeling_input", "1.0.0")]
+    assert prebuilt.schema("modeling_input", "1.0.0") is None
+    assert prebuilt.schema("modeling_input", "2.0.0") is not None
+    # Code that includes the stale version is dropped with it
+    assert prebuilt.code("modeling_input", tuple(VERSIONS)) is None
+    assert prebuilt.code("modeling_input", ("1.0.0",)) is None
+    assert prebuilt.code("modeling_input", ("2.0.0",)) is not None
+
+
+def test_load_artifact__unusable(artifact_path, tmp_path, monkeypatch):
+    assert module.load_artifact(tmp_path / "missing") is None
+    garbage = tmp_path / "garbage"
+    garbage.write_bytes(b"not an artifact")
+    assert module.load_artifact(garbage) is None
+    truncated = tmp_path / "truncated"
+    truncated.write_bytes(artifact_path.read_bytes()[:1000])
+    assert module.load_artifact(truncated) is None
+
+    monkeypatch.setattr(module, "_builder_fingerprint", lambda: "other code")
+    assert module.load_artifact(artifact_path) is None
+    monkeypatch.undo()
+    monkeypatch.setattr(module, "ARTIFACT_FORMAT", module.ARTIFACT_FORMAT + 1)
+    assert module.load_artifact(artifact_path) is None
+
+
+def test_registry__uses_the_artifact(
+    artifact_path, monkeypatch, valid_2_0_0_modeling_json
+):
+    prebuilt = module.load_artifact(artifact_path)
+    monkeypatch.setattr(module, "default_artifact", lambda: prebuilt)
+
+    def load_schema_and_hash(*args):
+        raise AssertionError("schema read from its JSON file")
+
+    monkeypatch.setattr(validate.schemas, "load_schema_and_hash", load_schema_and_hash)
+    for optimize_schemas in [True, False]:
+        registry = validate.ValidatorRegistry(optimize=optimize_schemas)
+        validator = registry.get("modeling_input", "2.0.0")
+        assert registry.schema_hash("modeling_input", "2.0.0") == prebuilt.schema_hash(
+            "modeling_input", "2.0.0"
+        )
+        assert validator.schema == prebuilt.schema(
+            "modeling_input", "2.0.0", optimize_schemas
+        )
+        assert validator.is_valid(valid_2_0_0_modeling_json)
+    with pytest.raises(AssertionError):
+        validate.ValidatorRegistry(prebuilt=False).get("modeling_input", "2.0.0")
+
+
+def test_load_validators__uses_the_artifact(artifact_path, monkeypatch):
+    prebuilt = module.load_artifact(artifact_path)
+    monkeypatch.setattr(module, "default_artifact", lambda: prebuilt)
+
+    def compile_schema_source(*args):
+        raise AssertionError("schema compiled")
+
+    monkeypatch.setattr(codegen, "compile_schema_source", compile_schema_source)
+    codegen.load_validators.cache_clear()
+    try:
+        assert list(codegen.load_validators("modeling_input")) == VERSIONS
+        assert list(codegen.load_validators("modeling_input", ("2.0.0",))) == ["2.0.0"]
+    finally:
+        codegen.load_validators.cache_clear()
@@ -0,0 +1,261 @@
+"""Benchmarks of the validation paths on synthetic modeling_input workloads.
+
+Workloads are built lazily from the shipped sample files:
+- valid: the valid sample(s) of a version
+- invalid: the invalid samples of a version, plus single-field breakages of its valid sample
+- mixed: the valid samples of every version, validated against every version
+
+Results are plain JSON so that runs can be stored and compared with `compare`.
+"""
+import copy
+import itertools
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from raven_schemas import multiversion, schemas, validate
+from raven_schemas.constants import PACKAGE_DIR, SCHEMA_DIR
+
+WORKLOADS = ["valid", "invalid", "mixed"]
+DEFAULT_SIZES = [1_000, 100_000, 1_000_000]
+DEFAULT_THRESHOLD = 0.1
+# Memory is measured on a prefix of the workload, tracemalloc slows everything down
+MEMORY_SAMPLE_SIZE = 1_000
+
+ENGINES: Dict[str, Callable[[dict, str, List[str]], Any]] = {
+    "jsonschema": validate.find_valid_versions,
+    "multiversion": multiversion.find_valid_versions,
+}
+
+COLD_START_SCRIPT = """
+import json, sys
+from raven_schemas import validate
+validate.find_valid_versions(json.loads(sys.argv[1]), sys.argv[2], sys.argv[3:])
+"""
+
+
+def _samples(schema_name: str, version: str, kind: str) -> List[dict]:
+    pattern = f"{schema_name}_{version.replace('.', '_')}_sample_{kind}*.json"
+    return [json.loads(path.read_text()) for path in sorted(SCHEMA_DIR.glob(pattern))]
+
+
+def _breakages(document: dict) -> Iterator[dict]:
+    """Copies of a valid document with one field broken"""
+    for path, value in [
+        (["roofMaterial"], "bogus"),
+        (["survey", "systems", "cooling", "type"], "bogus"),
+        (["bedroomCount"], "four"),
+    ]:
+        broken = copy.deepcopy(document)
+        node = broken
+        for key in path[:-1]:
+            node = node.get(key, {})
+        node[path[-1]] = value
+        yield broken
+    dropped = copy.deepcopy(document)
+    dropped.pop("city", None)
+    yield dropped
+
+
+def workload_documents(
+    schema_name: str, workload: str, version: Optional[str] = None
+) -> List[dict]:
+    """The distinct documents a workload cycles through"""
+    if workload == "valid":
+        return _samples(schema_name, version, "valid")
+    if workload == "invalid":
+        documents = _samples(schema_name, version, "invalid")
+        for document in _samples(schema_name, version, "valid"):
+            documents.extend(_breakages(document))
+        return documents
+    if workload == "mixed":
+        return [
+            document
+            for v in schemas.get_known_schemas_and_versions()[schema_name]
+            for document in _samples(schema_name, v, "valid")
+        ]
+    raise ValueError(f"Unknown workload {workload}, expected one of {WORKLOADS}")
+
+
+def iter_workload(documents: List[dict], records: int) -> Iterator[dict]:
+    return itertools.islice(itertools.cycle(documents), records)
+
+
+def _percentile(sorted_values: List[int], fraction: float) -> float:
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def run_one(
+    engine: str,
+    schema_name: str,
+    workload: str,
+    version: Optional[str],
+    records: int,
+) -> Dict[str, Any]:
+    """Time `records` validations of a workload, one at a time"""
+    check = ENGINES[engine]
+    all_versions = schemas.get_known_schemas_and_versions()[schema_name]
+    versions = all_versions if workload == "mixed" else [version]
+    documents = workload_documents(schema_name, workload, version)
+    # Warm up caches, so that we measure the steady state
+    for document in documents:
+        try:
+            check(document, schema_name, versions)
+        except validate.ValidationError:
+            pass
+
+    latencies = []
+    clock = time.perf_counter_ns
+    started = clock()
+    for document in iter_workload(documents, records):
+        before = clock()
+        try:
+            check(document, schema_name, versions)
+        except validate.ValidationError:
+            pass
+        latencies.append(clock() - before)
+    elapsed_s = (clock() - started) / 1e9
+
+    tracemalloc.start()
+    for document in iter_workload(documents, min(records, MEMORY_SAMPLE_SIZE)):
+        try:
+            check(document, schema_name, versions)
+        except validate.ValidationError:
+            pass
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "engine": engine,
+        "schema_name": schema_name,
+        "workload": workload,
+        "version": version or "all",
+        "records": records,
+        "p50_us": _percentile(latencies, 0.5) / 1e3,
+        "p99_us": _percentile(latencies, 0.99) / 1e3,
+        "mean_us": statistics.fmean(latencies) / 1e3,
+        "throughput_rps": records / elapsed_s if elapsed_s else 0.0,
+        "peak_memory_bytes": peak_memory,
+    }
+
+
+def cold_start(schema_name: str, version: str) -> float:
+    """Seconds for a fresh interpreter to import the library and validate one document"""
+    document = workload_documents(schema_name, "valid", version)[0]
+    started = time.perf_counter()
+    subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            COLD_START_SCRIPT,
+            json.dumps(document),
+            schema_name,
+            version,
+        ],
+        check=True,
+        # So that this copy of the package is the one imported
+        cwd=PACKAGE_DIR.parent,
+    )
+    return time.perf_counter() - started
+
+
+def run_benchmarks(
+    schema_name: str,
+    versions: Optional[List[str]] = None,
+    sizes: Optional[List[int]] = None,
+    workloads: Optional[List[str]] = None,
+    engines: Optional[List[str]] = None,
+    measure_cold_start: bool = True,
+) -> Dict[str, Any]:
+    if versions is None:
+        versions = schemas.get_known_schemas_and_versions()[schema_name]
+    sizes = sizes or DEFAULT_SIZES
+    workloads = workloads or WORKLOADS
+    engines = engines or list(ENGINES)
+
+    results = []
+    for engine, workload, records in itertools.product(engines, workloads, sizes):
+        for version in [None] if workload == "mixed" else versions:
+            if not workload_documents(schema_name, workload, version):
+                continue
+            results.append(run_one(engine, schema_name, workload, version, records))
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "cold_start_s": (
+            {version: cold_start(schema_name, version) for version in versions}
+            if measure_cold_start
+            else {}
+        ),
+        "results": results,
+    }
+
+
+def _result_key(result: Dict[str, Any]) -> tuple:
+    return (
+        result["engine"],
+        result["schema_name"],
+        result["workload"],
+        result["version"],
+        result["records"],
+    )
+
+
+def compare(
+    baseline: Dict[str, Any],
+    current: Dict[str, Any],
+    threshold: float = DEFAULT_THRESHOLD,
+) -> List[str]:
+    """Describe every measurement of `current` that is worse than `baseline` by more than threshold
+    (a fraction, eg. 0.1 for 10%). Measurements missing from either run are ignored.
+    """
+    regressions = []
+    baseline_results = {_result_key(r): r for r in baseline.get("results", [])}
+    for result in current.get("results", []):
+        key = _result_key(result)
+        before = baseline_results.get(key)
+        if before is None:
+            continue
+        name = "/".join(str(part) for part in key)
+        if result["throughput_rps"] < before["throughput_rps"] * (1 - threshold):
+            regressions.append(
+                f"{name}: throughput {before['throughput_rps']:.0f} -> {result['throughput_rps']:.0f} records/s"
+            )
+        if result["p99_us"] > before["p99_us"] * (1 + threshold):
+            regressions.append(
+                f"{name}: p99 {before['p99_us']:.1f} -> {result['p99_us']:.1f} us"
+            )
+    for version, seconds in current.get("cold_start_s", {}).items():
+        before_seconds = baseline.get("cold_start_s", {}).get(version)
+        if before_seconds is not None and seconds > before_seconds * (1 + threshold):
+            regressions.append(
+                f"cold start {version}: {before_seconds:.3f} -> {seconds:.3f} s"
+            )
+    return regressions
+
+
+def render(report: Dict[str, Any]) -> str:
+    lines = [
+        f"{'engine':<13}{'workload':<9}{'version':<8}{'records':>9}"
+        f"{'p50 us':>10}{'p99 us':>10}{'records/s':>12}{'peak KiB':>10}"
+    ]
+    for r in report["results"]:
+        lines.append(
+            f"{r['engine']:<13}{r['workload']:<9}{r['version']:<8}{r['records']:>9}"
+            f"{r['p50_us']:>10.1f}{r['p99_us']:>10.1f}{r['throughput_rps']:>12.0f}"
+            f"{r['peak_memory_bytes'] / 1024:>10.0f}"
+        )
+    for version, seconds in report["cold_start_s"].items():
+        lines.append(f"cold start {version}: {seconds:.3f}s")
+    return "\n".join(lines)
@@ -0,0 +1,56 @@
+import copy
+
+import pytest
+
+from raven_schemas import bench as module
+
+
+@pytest.fixture(scope="module")
+def report():
+    return module.run_benchmarks(
+        "modeling_input", versions=["2.0.0"], sizes=[20], measure_cold_start=False
+    )
+
+
+def test_run_benchmarks(report):
+    assert {(r["engine"], r["workload"], r["version"]) for r in report["results"]} == {
+        (engine, workload, version)
+        for engine in module.ENGINES
+        for workload, version in [
+            ("valid", "2.0.0"),
+            ("invalid", "2.0.0"),
+            ("mixed", "all"),
+        ]
+    }
+    for result in report["results"]:
+        assert result["records"] == 20
+        assert 0 < result["p50_us"] <= result["p99_us"]
+        assert result["throughput_rps"] > 0
+
+
+def test_workload_documents():
+    validator = module.validate.registry.get("modeling_input", "1.1.0")
+    assert all(
+        validator.is_valid(d)
+        for d in module.workload_documents("modeling_input", "valid", "1.1.0")
+    )
+    assert not any(
+        validator.is_valid(d)
+        for d in module.workload_documents("modeling_input", "invalid", "1.1.0")
+    )
+
+
+def test_compare__flags_regressions(report):
+    slower = copy.deepcopy(report)
+    slower["results"][0]["throughput_rps"] /= 2
+    slower["results"][1]["p99_us"] *= 2
+    slower["cold_start_s"] = {"2.0.0": 2.0}
+    baseline = copy.deepcopy(report)
+    baseline["cold_start_s"] = {"2.0.0": 1.0}
+    regressions = module.compare(baseline, slower)
+    assert len(regressions) == 3
+    assert module.compare(report, report) == []
+
+
+def test_cold_start():
+    assert module.cold_start("modeling_input", "1.0.0") > 0
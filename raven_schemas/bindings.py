@@ -0,0 +1,384 @@
+"""Generate typed record classes for each schema version: Python bindings of the schemas.
+
+Every object schema with `properties` becomes a frozen, slotted dataclass, named after its
+property (the root after the schema): `ModelingInput`, `Survey`, `PrimaryHeating`, ... Records
+hold no per-instance dict, which takes several times less memory than the parsed JSON.
+
+- Enum and const strings are annotated with Literal types, and replaced by a shared copy of the
+  value: the millions of "Gas" in a cache of records are a single string object.
+- Properties that aren't required default to ABSENT, which to_dict leaves out again.
+- Objects that allow other properties keep them in `extra`, as (name, value) pairs.
+
+from_dict doesn't validate: it trusts its input to be valid for the version, eg. a document that
+find_valid_versions already accepted. to_dict builds the document back. Generated modules
+only import the standard library, so they can be copied into consumers of the schemas.
+"""
+import functools
+import keyword
+import re
+import sys
+import types
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from raven_schemas import schemas
+
+# Types whose values can be Literal arguments
+LITERAL_TYPES = (str, bool, int, type(None))
+TYPE_ANNOTATIONS = {
+    "string": "str",
+    "integer": "int",
+    "number": "float",
+    "boolean": "bool",
+    "null": "None",
+    "object": "Dict[str, Any]",
+    "array": "List[Any]",
+}
+# Names properties can't have as attributes: the generated class bodies use them
+RESERVED_NAMES = {"from_dict", "to_dict", "extra", "field", "ABSENT"}
+
+PRELUDE = '''from dataclasses import dataclass, field
+from typing import Any, Dict, List, Literal, Optional, Tuple, Union
+
+
+class _Absent:
+    """Value of the properties a document doesn't have"""
+
+    __slots__ = ()
+
+    def __repr__(self):
+        return "ABSENT"
+
+    def __reduce__(self):
+        return "ABSENT"
+
+
+ABSENT: Any = _Absent()
+'''
+
+
+def _class_name(name: str) -> str:
+    words = re.split(r"[^0-9a-zA-Z]+", name)
+    class_name = "".join(word[:1].upper() + word[1:] for word in words)
+    return class_name if class_name.isidentifier() else f"_{class_name}"
+
+
+def _attribute_name(name: str, taken: List[str]) -> str:
+    attribute = re.sub(r"\W", "_", name)
+    if not attribute.isidentifier():
+        attribute = f"_{attribute}"
+    while (
+        keyword.iskeyword(attribute)
+        or attribute in RESERVED_NAMES
+        or attribute in taken
+    ):
+        attribute += "_"
+    return attribute
+
+
+def _literal(values: List[Any]) -> Optional[str]:
+    if not values or not all(value.__class__ in LITERAL_TYPES for value in values):
+        return None
+    return f"Literal[{', '.join(repr(value) for value in values)}]"
+
+
+def _union(annotations: List[str]) -> str:
+    annotations = list(dict.fromkeys(annotations))
+    if "Any" in annotations:
+        return "Any"
+    if len(annotations) == 1:
+        return annotations[0]
+    if len(annotations) == 2 and "None" in annotations:
+        annotations.remove("None")
+        return f"Optional[{annotations[0]}]"
+    return f"Union[{', '.join(annotations)}]"
+
+
+class _Field:
+    def __init__(self, key: str, attribute: str, required: bool):
+        self.key = key
+        self.attribute = attribute
+        self.required = required
+        self.annotation = "Any"
+        # Class of the values that are objects
+        self.record_class: Optional[str] = None
+        # Whether every value that's an object is a record, and nothing else is allowed
+        self.always_record = False
+        self.interned = False
+
+
+class BindingsGenerator:
+    """Collects the record classes of a schema version, children before their parents"""
+
+    def __init__(self, schema_name: str, version: str):
+        self.schema_name = schema_name
+        self.version = version
+        self.classes: List[str] = []
+        self.class_names: List[str] = []
+        # Enum and const strings, in the order they were found
+        self.strings: Dict[str, None] = {}
+
+    def _new_class_name(self, name: str, parent: Optional[str]) -> str:
+        class_name = _class_name(name)
+        if class_name in self.class_names and parent is not None:
+            class_name = parent + class_name
+        while class_name in self.class_names:
+            class_name += "_"
+        self.class_names.append(class_name)
+        return class_name
+
+    def _annotation(self, schema: Any, field: _Field, top: bool = True) -> str:
+        if not isinstance(schema, dict):
+            return "Any"
+        if "const" in schema or "enum" in schema:
+            values = [schema["const"]] if "const" in schema else list(schema["enum"])
+            literal = _literal(values)
+            if literal is None:
+                return "Any"
+            # Values allowed by other branches may not be hashable
+            if top and any(isinstance(value, str) for value in values):
+                field.interned = True
+                self.strings.update(
+                    (value, None) for value in values if isinstance(value, str)
+                )
+            return literal
+        if isinstance(schema.get("properties"), dict) and field.record_class:
+            types_ = schema.get("type")
+            other = (
+                [t for t in types_ if t != "object"] if isinstance(types_, list) else []
+            )
+            return _union(
+                [field.record_class] + [TYPE_ANNOTATIONS.get(t, "Any") for t in other]
+            )
+        for combinator in ("oneOf", "anyOf"):
+            if isinstance(schema.get(combinator), list):
+                return _union(
+                    [
+                        self._annotation(branch, field, top=False)
+                        for branch in schema[combinator]
+                    ]
+                )
+        types_ = schema.get("type")
+        if isinstance(types_, str):
+            return TYPE_ANNOTATIONS.get(types_, "Any")
+        if isinstance(types_, list):
+            return _union([TYPE_ANNOTATIONS.get(t, "Any") for t in types_])
+        return "Any"
+
+    def add_class(
+        self, schema: dict, name: str, path: Tuple[str, ...], parent: Optional[str]
+    ) -> str:
+        """Generate the record class of an object schema and of the objects it holds
+        @returns the name of the class
+        """
+        class_name = self._new_class_name(name, parent)
+        required = schema.get("required", [])
+        fields: List[_Field] = []
+        for key, subschema in schema["properties"].items():
+            field = _Field(
+                key,
+                _attribute_name(key, [f.attribute for f in fields]),
+                key in required,
+            )
+            if isinstance(subschema, dict) and isinstance(
+                subschema.get("properties"), dict
+            ):
+                field.record_class = self.add_class(
+                    subschema, key, path + (key,), class_name
+                )
+                field.always_record = (
+                    field.required and subschema.get("type") == "object"
+                )
+            field.annotation = self._annotation(subschema, field)
+            fields.append(field)
+        open_object = schema.get("additionalProperties", True) is not False
+        self.classes.append(self._class_source(class_name, path, fields, open_object))
+        return class_name
+
+    def _class_source(
+        self,
+        class_name: str,
+        path: Tuple[str, ...],
+        fields: List[_Field],
+        open_object: bool,
+    ) -> str:
+        description = ".".join(path) if path else f"{self.schema_name} {self.version}"
+        lines = []
+        if open_object:
+            keys = ", ".join(repr(field.key) for field in fields)
+            lines += [f"_KEYS_{class_name} = frozenset([{keys}])", "", ""]
+        lines += [
+            "@dataclass(frozen=True, slots=True, kw_only=True)",
+            f"class {class_name}:",
+            f'    """{description}"""',
+            "",
+        ]
+        for field in fields:
+            default = "" if field.required else " = ABSENT"
+            lines.append(f"    {field.attribute}: {field.annotation}{default}")
+        if open_object:
+            lines.append("    # Properties the schema doesn't name")
+            # Values can be lists or objects, so they're left out of the hash
+            lines.append(
+                "    extra: Tuple[Tuple[str, Any], ...] = field(default=(), hash=False)"
+            )
+
+        lines += [
+            "",
+            "    @classmethod",
+            f'    def from_dict(cls, data: Dict[str, Any]) -> "{class_name}":',
+            '        """Build from a valid document: nothing is checked"""',
+            "        return cls(",
+        ]
+        for field in fields:
+            lines.append(f"            {field.attribute}={self._from_json(field)},")
+        if open_object:
+            lines.append(
+                f"            extra=() if data.keys() <= _KEYS_{class_name} "
+                f"else tuple(i for i in data.items() if i[0] not in _KEYS_{class_name}),"
+            )
+        lines.append("        )")
+
+        lines += ["", "    def to_dict(self) -> Dict[str, Any]:"]
+        leading = []
+        for field in fields:
+            if not field.required:
+                break
+            leading.append(field)
+        if leading:
+            lines.append("        data: Dict[str, Any] = {")
+            for field in leading:
+                lines.append(f"            {field.key!r}: {self._to_json(field)},")
+            lines.append("        }")
+        else:
+            lines.append("        data: Dict[str, Any] = {}")
+        for field in fields[len(leading) :]:
+            if field.required:
+                lines.append(f"        data[{field.key!r}] = {self._to_json(field)}")
+            else:
+                lines.append(f"        if self.{field.attribute} is not ABSENT:")
+                lines.append(
+                    f"            data[{field.key!r}] = {self._to_json(field)}"
+                )
+        if open_object:
+            lines.append("        data.update(self.extra)")
+        lines.append("        return data")
+        return "\n".join(lines)
+
+    @staticmethod
+    def _from_json(field: _Field) -> str:
+        value = (
+            f"data[{field.key!r}]"
+            if field.required
+            else f"data.get({field.key!r}, ABSENT)"
+        )
+        if field.record_class is not None:
+            if field.always_record:
+                return f"{field.record_class}.from_dict({value})"
+            return (
+                f"{field.record_class}.from_dict(v) "
+                f"if (v := {value}).__class__ is dict else v"
+            )
+        if field.interned:
+            return f"_STRINGS.get(v := {value}, v)"
+        return value
+
+    @staticmethod
+    def _to_json(field: _Field) -> str:
+        value = f"self.{field.attribute}"
+        if field.record_class is None:
+            return value
+        if field.always_record:
+            return f"{value}.to_dict()"
+        return f"v.to_dict() if (v := {value}).__class__ is {field.record_class} else v"
+
+    def source(self, root: str) -> str:
+        strings = ", ".join(repr(value) for value in self.strings)
+        header = (
+            f'"""Generated by `raven-schemas bindings` from the {self.schema_name} '
+            f'{self.version} schema. Do not edit."""\n'
+        )
+        body = [
+            f"SCHEMA_NAME = {self.schema_name!r}",
+            f"VERSION = {self.version!r}",
+            "# The copy of each enum string that records hold",
+            f"_STRINGS = {{value: value for value in [{strings}]}}",
+            "",
+            "",
+            "\n\n\n".join(self.classes),
+            "",
+            "",
+            f"ROOT = {root}",
+            "",
+        ]
+        return header + PRELUDE + "\n\n" + "\n".join(body)
+
+
+def bindings_source(schema_name: str, version: str) -> str:
+    """Python source of the record classes of a schema version. ROOT is the document's class.
+    @raises ValueError if the schema isn't an object with properties
+    """
+    schema = schemas.load_schema(schema_name, version)
+    if not isinstance(schema, dict) or not isinstance(schema.get("properties"), dict):
+        raise ValueError(f"{schema_name} {version} doesn't describe an object")
+    generator = BindingsGenerator(schema_name, version)
+    root = generator.add_class(schema, schema_name, (), None)
+    return generator.source(root)
+
+
+def module_name(schema_name: str, version: str) -> str:
+    return f"{schema_name}_{version.replace('.', '_')}"
+
+
+@functools.cache
+def load_bindings(schema_name: str, version: str) -> types.ModuleType:
+    """The record classes of a schema version, generated in memory"""
+    name = f"{__name__}.{module_name(schema_name, version)}"
+    module = types.ModuleType(name)
+    # dataclasses and pickle look record classes up by module
+    sys.modules[name] = module
+    exec(compile(bindings_source(schema_name, version), name, "exec"), module.__dict__)
+    return module
+
+
+def from_document(
+    document: dict,
+    schema_name: str,
+    version: Optional[str] = None,
+    validated: bool = False,
+) -> Any:
+    """The record of a document, as an instance of its version's ROOT class.
+
+    Unless validated is True, the document is first validated with find_valid_versions (against
+    `version`, or every version) and its record is built for the version it's valid for.
+    @raises validate.ValidationError if the document isn't valid
+    @raises ValueError if validated is True without a version
+    """
+    if validated:
+        if version is None:
+            raise ValueError("The version of a validated document is required")
+    else:
+        # Imported here: the generated classes don't need jsonschema
+        from raven_schemas import validate
+
+        versions = (
+            [version]
+            if version is not None
+            else schemas.get_known_schemas_and_versions()[schema_name]
+        )
+        version = validate.find_valid_versions(document, schema_name, versions)[-1]
+    return load_bindings(schema_name, version).ROOT.from_dict(document)
+
+
+def write_modules(schema_name: str, output_dir: Path) -> List[Path]:
+    """Write the record classes of every known version of a schema to
+    <output_dir>/<schema_name>_<version>.py
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for version in schemas.get_known_schemas_and_versions()[schema_name]:
+        path = output_dir / f"{module_name(schema_name, version)}.py"
+        path.write_text(bindings_source(schema_name, version))
+        paths.append(path)
+    return paths
@@ -0,0 +1,123 @@
+import dataclasses
+import importlib
+import json
+import pickle
+import sys
+from typing import Literal, Optional
+
+import pytest
+
+from raven_schemas import bindings as module
+from raven_schemas import generator, schemas, validate
+from raven_schemas.constants import PACKAGE_DIR, SCHEMA_DIR
+
+VERSIONS = schemas.get_known_schemas_and_versions()["modeling_input"]
+
+
+@pytest.fixture
+def valid_2_0_0_modeling_json():
+    with open(
+        PACKAGE_DIR / "schemas/modeling_input_2_0_0_sample_valid.json"
+    ) as modeling_input:
+        return json.load(modeling_input)
+
+
+@pytest.mark.parametrize("version", VERSIONS)
+def test_round_trip(version):
+    bindings = module.load_bindings("modeling_input", version)
+    documents = generator.DocumentGenerator("modeling_input", version, seed=0)
+    for _ in range(50):
+        document = documents.document()
+        record = bindings.ROOT.from_dict(document)
+        assert record.to_dict() == document
+        assert pickle.loads(pickle.dumps(record)) == record
+
+
+def test_record(valid_2_0_0_modeling_json):
+    bindings = module.load_bindings("modeling_input", "2.0.0")
+    record = bindings.ROOT.from_dict(valid_2_0_0_modeling_json)
+    assert isinstance(record, bindings.ModelingInput)
+    heating = record.survey.systems.primary_heating
+    assert isinstance(heating, bindings.PrimaryHeating)
+    assert heating.fuel_type == "Gas"
+    assert not hasattr(record, "__dict__")
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        heating.fuel_type = "Oil"
+    # Records built from different documents share enum strings
+    other = bindings.ROOT.from_dict(json.loads(json.dumps(valid_2_0_0_modeling_json)))
+    assert other.roofMaterial is record.roofMaterial
+    assert hash(other) == hash(record)
+
+
+def test_record__absent_and_extra(valid_2_0_0_modeling_json):
+    survey = valid_2_0_0_modeling_json["survey"]
+    del survey["electrical"]
+    survey["notes"] = ["checked", {"by": "inspector"}]
+    bindings = module.load_bindings("modeling_input", "2.0.0")
+    record = bindings.ROOT.from_dict(valid_2_0_0_modeling_json)
+    assert record.survey.electrical is bindings.ABSENT
+    assert record.survey.extra == (("notes", ["checked", {"by": "inspector"}]),)
+    assert record.to_dict() == valid_2_0_0_modeling_json
+
+
+def test_attribute_names():
+    generator_ = module.BindingsGenerator("test", "1.0.0")
+    schema = {
+        "type": "object",
+        "properties": {
+            "class": {"type": "string"},
+            "to_dict": {"enum": ["a", None]},
+            "a-b": {"oneOf": [{"type": "integer"}, {"type": "null"}]},
+            "a_b": {"type": "object", "properties": {"x": {"const": 1}}},
+        },
+        "required": ["class", "to_dict", "a-b"],
+        "additionalProperties": False,
+    }
+    root = generator_.add_class(schema, "test", (), None)
+    namespace: dict = {}
+    exec(generator_.source(root), namespace)
+    fields = {f.name: f.type for f in dataclasses.fields(namespace["Test"])}
+    assert fields == {
+        "class_": str,
+        "to_dict_": Literal["a", None],
+        "a_b": Optional[int],
+        "a_b_": namespace["AB"],
+    }
+    document = {"class": "x", "to_dict": "a", "a-b": None, "a_b": {"x": 1}}
+    assert namespace["ROOT"].from_dict(document).to_dict() == document
+
+
+def test_from_document(valid_2_0_0_modeling_json):
+    record = module.from_document(valid_2_0_0_modeling_json, "modeling_input")
+    assert record.input_schema_version == "2.0.0"
+    assert (
+        module.from_document(
+            valid_2_0_0_modeling_json, "modeling_input", "2.0.0", validated=True
+        )
+        == record
+    )
+    with pytest.raises(validate.ValidationError):
+        module.from_document(valid_2_0_0_modeling_json, "modeling_input", "1.0.0")
+    with pytest.raises(ValueError, match="version"):
+        module.from_document(
+            valid_2_0_0_modeling_json, "modeling_input", validated=True
+        )
+
+
+def test_write_modules(tmp_path, monkeypatch):
+    paths = module.write_modules("modeling_input", tmp_path)
+    assert [path.name for path in paths] == [
+        f"modeling_input_{version.replace('.', '_')}.py" for version in VERSIONS
+    ]
+    monkeypatch.syspath_prepend(str(tmp_path))
+    generated = importlib.import_module("modeling_input_1_0_0")
+    try:
+        document = json.loads(
+            (SCHEMA_DIR / "modeling_input_1_0_0_sample_valid.json").read_text()
+        )
+        record = generated.ROOT.from_dict(document)
+        assert record.to_dict() == document
+        assert pickle.loads(pickle.dumps(record)) == record
+        assert generated.VERSION == "1.0.0"
+    finally:
+        del sys.modules["modeling_input_1_0_0"]
@@ -0,0 +1,168 @@
+import csv
+import json
+import sys
+import time
+from collections import Counter, deque
+from pathlib import Path
+from typing import IO, Deque, Iterable, Iterator, List, Optional, Tuple
+
+from raven_schemas import aggregate, validate
+from raven_schemas.constants import OUTPUT_FORMATS
+
+WRITE_BUFFER_SIZE = 1 << 20
+
+# (record id, raw JSON text) pairs, validated lazily
+RawRecords = Iterable[Tuple[str, validate.Record]]
+
+
+def iter_ndjson(path: Path) -> Iterator[Tuple[str, bytes]]:
+    """Yield (line number, raw line) for each non-blank line of an NDJSON file"""
+    with open(path, "rb") as f:
+        for line_number, line in enumerate(f, start=1):
+            if line.strip():
+                yield str(line_number), line
+
+
+def iter_json_files(
+    directory: Path, pattern: str = "*.json"
+) -> Iterator[Tuple[str, bytes]]:
+    """Yield (relative path, raw contents) for each JSON file under a directory, in sorted order"""
+    directory = Path(directory)
+    for path in sorted(directory.rglob(pattern)):
+        if path.is_file():
+            yield str(path.relative_to(directory)), path.read_bytes()
+
+
+class VerdictWriter:
+    """Writes one row per verdict to a buffered NDJSON or CSV stream"""
+
+    def __init__(self, stream: IO[str], output_format: str = "ndjson"):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(
+                f"Unknown output format {output_format}, expected one of {OUTPUT_FORMATS}"
+            )
+        self.stream = stream
+        self.output_format = output_format
+        self._csv = None
+        if output_format == "csv":
+            self._csv = csv.writer(stream)
+            self._csv.writerow(["record_id", "valid", "valid_versions", "error"])
+
+    def write(self, record_id: str, verdict: validate.Verdict) -> None:
+        if self._csv is not None:
+            self._csv.writerow(
+                [
+                    record_id,
+                    verdict.is_valid,
+                    " ".join(verdict.valid_versions),
+                    verdict.error or "",
+                ]
+            )
+        else:
+            self.stream.write(
+                json.dumps(
+                    {
+                        "record_id": record_id,
+                        "valid": verdict.is_valid,
+                        "valid_versions": verdict.valid_versions,
+                        "error": verdict.error,
+                    }
+                )
+            )
+            self.stream.write("\n")
+
+
+class Summary:
+    """Running counts of a bulk validation"""
+
+    def __init__(self):
+        self.total = 0
+        self.failures = 0
+        self.by_version: Counter = Counter()
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def add(self, verdict: validate.Verdict) -> None:
+        self.total += 1
+        if verdict.is_valid:
+            self.by_version.update(verdict.valid_versions)
+        else:
+            self.failures += 1
+
+    def finish(self) -> None:
+        self.elapsed = time.perf_counter() - self.started
+
+    @property
+    def records_per_second(self) -> float:
+        return self.total / self.elapsed if self.elapsed else 0.0
+
+    def render(self) -> str:
+        lines = [
+            f"Validated {self.total} records in {self.elapsed:.2f}s "
+            f"({self.records_per_second:.1f} records/s)"
+        ]
+        for version, count in sorted(self.by_version.items()):
+            lines.append(f"  valid for {version}: {count}")
+        lines.append(f"  invalid: {self.failures}")
+        return "\n".join(lines)
+
+
+def validate_stream(
+    raw_records: RawRecords,
+    schema_name: str,
+    versions: List[str],
+    writer: Optional[VerdictWriter] = None,
+    workers: Optional[int] = None,
+    chunksize: int = validate.DEFAULT_CHUNKSIZE,
+    report: Optional[aggregate.ErrorAggregator] = None,
+) -> Summary:
+    """Validate (record id, record) pairs in parallel, writing each verdict as it arrives.
+    The errors of invalid records are added to the report, if any.
+    """
+    # validate_many yields in order, so ids only need to be held while their record is in flight
+    record_ids: Deque[str] = deque()
+
+    def records() -> Iterator[validate.Record]:
+        for record_id, record in raw_records:
+            record_ids.append(record_id)
+            yield record
+
+    verdicts = validate.validate_many(
+        records(),
+        schema_name,
+        versions,
+        workers=workers,
+        chunksize=chunksize,
+        details=report is not None,
+    )
+    return summarize(
+        ((record_ids.popleft(), verdict) for verdict in verdicts),
+        writer=writer,
+        report=report,
+    )
+
+
+def summarize(
+    verdicts: Iterable[Tuple[str, validate.Verdict]],
+    writer: Optional[VerdictWriter] = None,
+    report: Optional[aggregate.ErrorAggregator] = None,
+) -> Summary:
+    """Count (record id, verdict) pairs, writing each verdict as it arrives.
+    The errors of invalid verdicts (see validate.validate_record's details) go to the report.
+    """
+    summary = Summary()
+    for record_id, verdict in verdicts:
+        summary.add(verdict)
+        if writer is not None:
+            writer.write(record_id, verdict)
+        if report is not None and not verdict.is_valid:
+            report.add(record_id, verdict.errors)
+    summary.finish()
+    return summary
+
+
+def open_output(path: str) -> IO[str]:
+    """Open a buffered text stream for results; "-" means stdout"""
+    if path == "-":
+        return sys.stdout
+    return open(path, "w", newline="", buffering=WRITE_BUFFER_SIZE)
@@ -0,0 +1,95 @@
+import io
+import json
+
+import pytest
+
+from raven_schemas import aggregate
+from raven_schemas import bulk as module
+from raven_schemas.constants import SCHEMA_DIR
+
+
+@pytest.fixture
+def ndjson_file(tmp_path):
+    valid = json.loads(
+        (SCHEMA_DIR / "modeling_input_1_0_0_sample_valid.json").read_text()
+    )
+    path = tmp_path / "records.ndjson"
+    path.write_text(
+        "\n".join([json.dumps(valid), "", json.dumps({"invalid": "data"}), "{bad"])
+        + "\n"
+    )
+    return path
+
+
+def test_iter_ndjson__skips_blank_lines(ndjson_file):
+    assert [record_id for record_id, _ in module.iter_ndjson(ndjson_file)] == [
+        "1",
+        "3",
+        "4",
+    ]
+
+
+def test_iter_json_files(tmp_path):
+    (tmp_path / "nested").mkdir()
+    (tmp_path / "nested" / "b.json").write_text("{}")
+    (tmp_path / "a.json").write_text("{}")
+    (tmp_path / "c.txt").write_text("{}")
+    assert [record_id for record_id, _ in module.iter_json_files(tmp_path)] == [
+        "a.json",
+        "nested/b.json",
+    ]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_validate_stream__ndjson(ndjson_file, workers):
+    stream = io.StringIO()
+    summary = module.validate_stream(
+        module.iter_ndjson(ndjson_file),
+        "modeling_input",
+        ["1.0.0", "2.0.0"],
+        writer=module.VerdictWriter(stream),
+        workers=workers,
+        chunksize=1,
+    )
+    rows = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [(row["record_id"], row["valid"]) for row in rows] == [
+        ("1", True),
+        ("3", False),
+        ("4", False),
+    ]
+    assert rows[2]["error"].startswith("Invalid JSON")
+    assert summary.total == 3
+    assert summary.failures == 2
+    assert summary.by_version == {"1.0.0": 1}
+    assert "invalid: 2" in summary.render()
+
+
+def test_verdict_writer__csv():
+    stream = io.StringIO()
+    writer = module.VerdictWriter(stream, "csv")
+    writer.write("1", module.validate.Verdict(["1.0.0", "1.0.1"]))
+    assert stream.getvalue().splitlines() == [
+        "record_id,valid,valid_versions,error",
+        "1,True,1.0.0 1.0.1,",
+    ]
+
+
+def test_verdict_writer__unknown_format():
+    with pytest.raises(ValueError):
+        module.VerdictWriter(io.StringIO(), "xml")
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_validate_stream__report(ndjson_file, workers):
+    report = aggregate.ErrorAggregator()
+    summary = module.validate_stream(
+        module.iter_ndjson(ndjson_file),
+        "modeling_input",
+        ["1.0.0", "2.0.0"],
+        workers=workers,
+        chunksize=1,
+        report=report,
+    )
+    assert report.records == summary.failures == 2
+    assert report.examples[aggregate.INVALID_JSON] == ["4"]
+    assert report.counts[aggregate.ErrorKey("1.0.0", "$", "required", None)] == 1
@@ -0,0 +1,140 @@
+"""Cache of per-version validation verdicts, keyed by the content of the document and the schema.
+
+A key is the sha256 of the document's canonical JSON (sorted keys, no whitespace), plus the
+schema name, version and the sha256 of the schema the verdict was reached with (see
+ValidatorRegistry.schema_hash). Verdicts of an edited schema are kept apart from those of its
+previous contents, even before the manifest is rebuilt.
+
+Verdicts are kept in an in-memory LRU, and optionally in a sqlite database that survives
+restarts and can be shared between processes.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, NamedTuple, Optional, Union
+
+DEFAULT_CACHE_SIZE = 10_000
+
+_canonical = json.JSONEncoder(
+    sort_keys=True, separators=(",", ":"), ensure_ascii=False
+).encode
+
+
+def canonical_hash(document: Any) -> str:
+    """sha256 of the document's canonical JSON, the same for documents that only differ in
+    key order or whitespace
+    """
+    # Parsed JSON can hold lone surrogates ("\ud800"), which strict UTF-8 can't encode
+    return hashlib.sha256(
+        _canonical(document).encode("utf-8", "surrogatepass")
+    ).hexdigest()
+
+
+class CachedVerdict(NamedTuple):
+    """Outcome of validating a document against one schema version"""
+
+    is_valid: bool
+    # Error message if the document isn't valid
+    message: Optional[str] = None
+
+
+class VerdictCache:
+    """LRU of verdicts in memory, backed by an optional sqlite file"""
+
+    def __init__(
+        self,
+        maxsize: int = DEFAULT_CACHE_SIZE,
+        path: Optional[Union[str, Path]] = None,
+    ):
+        if maxsize < 1:
+            raise ValueError(f"maxsize must be at least 1, got {maxsize}")
+        self.maxsize = maxsize
+        self.path = path
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._verdicts: "OrderedDict[str, CachedVerdict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if path is not None:
+            self._db = sqlite3.connect(str(path), check_same_thread=False, timeout=30)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS verdicts"
+                " (key TEXT PRIMARY KEY, is_valid INTEGER NOT NULL, message TEXT)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def key(
+        document_hash: str, schema_name: str, version: str, schema_hash: str
+    ) -> str:
+        return f"{document_hash}:{schema_name}:{version}:{schema_hash}"
+
+    def get(self, key: str) -> Optional[CachedVerdict]:
+        with self._lock:
+            verdict = self._verdicts.get(key)
+            if verdict is not None:
+                self.memory_hits += 1
+                self._verdicts.move_to_end(key)
+                return verdict
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT is_valid, message FROM verdicts WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    self.disk_hits += 1
+                    verdict = CachedVerdict(bool(row[0]), row[1])
+                    self._insert(key, verdict)
+                    return verdict
+            self.misses += 1
+            return None
+
+    def put(self, key: str, verdict: CachedVerdict) -> None:
+        with self._lock:
+            self._insert(key, verdict)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?)",
+                    (key, int(verdict.is_valid), verdict.message),
+                )
+                self._db.commit()
+
+    def clear(self) -> None:
+        """Drop every verdict, from memory and disk, and reset the statistics"""
+        with self._lock:
+            self._verdicts.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM verdicts")
+                self._db.commit()
+            self.memory_hits = self.disk_hits = self.misses = 0
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups
+            if lookups
+            else 0.0,
+            "size": len(self._verdicts),
+            "maxsize": self.maxsize,
+        }
+
+    def __len__(self) -> int:
+        return len(self._verdicts)
+
+    def _insert(self, key: str, verdict: CachedVerdict) -> None:
+        self._verdicts[key] = verdict
+        self._verdicts.move_to_end(key)
+        while len(self._verdicts) > self.maxsize:
+            self._verdicts.popitem(last=False)
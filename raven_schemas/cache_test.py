@@ -0,0 +1,123 @@
+import json
+
+import pytest
+
+from raven_schemas import cache as module
+from raven_schemas import schemas, validate
+from raven_schemas.constants import PACKAGE_DIR
+
+
+@pytest.fixture
+def valid_1_0_0_modeling_json():
+    with open(
+        PACKAGE_DIR / "schemas/modeling_input_1_0_0_sample_valid.json"
+    ) as modeling_input:
+        return json.load(modeling_input)
+
+
+def test_canonical_hash():
+    assert module.canonical_hash({"a": 1, "b": [1, 2]}) == module.canonical_hash(
+        json.loads('{ "b": [1,2],\n "a": 1 }')
+    )
+    assert module.canonical_hash({"a": 1}) != module.canonical_hash({"a": 1.5})
+
+
+def test_canonical_hash__lone_surrogate(valid_1_0_0_modeling_json):
+    valid_1_0_0_modeling_json["city"] = json.loads('"\\ud800"')
+    assert module.canonical_hash(valid_1_0_0_modeling_json) != module.canonical_hash(
+        dict(valid_1_0_0_modeling_json, city="\ufffd")
+    )
+    assert validate.find_valid_versions(
+        valid_1_0_0_modeling_json,
+        "modeling_input",
+        ["1.0.0"],
+        cache=module.VerdictCache(),
+    ) == ["1.0.0"]
+
+
+def test_key__includes_the_schema_hash():
+    assert module.VerdictCache.key(
+        "abc", "modeling_input", "1.0.0", "1234"
+    ) != module.VerdictCache.key("abc", "modeling_input", "1.0.0", "5678")
+
+
+def test_find_valid_versions__schema_edited(
+    tmp_path, monkeypatch, valid_1_0_0_modeling_json
+):
+    monkeypatch.setattr(validate, "registry", validate.ValidatorRegistry())
+    cache = module.VerdictCache()
+    assert validate.find_valid_versions(
+        valid_1_0_0_modeling_json, "modeling_input", ["1.0.0"], cache=cache
+    ) == ["1.0.0"]
+    # The schema file is edited to reject every document, while the registry keeps the
+    # validator built from its previous contents
+    edited = tmp_path / "modeling_input_1_0_0_schema.json"
+    edited.write_text("false")
+    monkeypatch.setattr(schemas, "get_schema_path", lambda *args: edited)
+    valid_1_0_0_modeling_json["city"] = "Elsewhere"
+    assert validate.find_valid_versions(
+        valid_1_0_0_modeling_json, "modeling_input", ["1.0.0"], cache=cache
+    ) == ["1.0.0"]
+    # Its verdict isn't taken for one of the edited schema
+    validate.registry.clear()
+    with pytest.raises(validate.ValidationError):
+        validate.find_valid_versions(
+            valid_1_0_0_modeling_json, "modeling_input", ["1.0.0"], cache=cache
+        )
+    assert cache.stats()["misses"] == 3
+
+
+def test_memory_lru():
+    cache = module.VerdictCache(maxsize=2)
+    cache.put("a", module.CachedVerdict(True))
+    cache.put("b", module.CachedVerdict(False, "nope"))
+    assert cache.get("a") == (True, None)
+    cache.put("c", module.CachedVerdict(True))
+    assert cache.get("b") is None
+    assert cache.get("c") == (True, None)
+    assert cache.stats() == {
+        "memory_hits": 2,
+        "disk_hits": 0,
+        "misses": 1,
+        "hit_rate": 2 / 3,
+        "size": 2,
+        "maxsize": 2,
+    }
+
+
+def test_disk_tier_survives_restarts(tmp_path):
+    path = tmp_path / "verdicts.sqlite"
+    cache = module.VerdictCache(maxsize=1, path=path)
+    cache.put("a", module.CachedVerdict(False, "nope"))
+    cache.put("b", module.CachedVerdict(True))
+    # Evicted from memory, still on disk
+    assert cache.get("a") == (False, "nope")
+    assert cache.stats()["disk_hits"] == 1
+    cache.close()
+
+    reopened = module.VerdictCache(path=path)
+    assert reopened.get("b") == (True, None)
+    assert reopened.get("b") == (True, None)
+    assert (reopened.disk_hits, reopened.memory_hits) == (1, 1)
+    reopened.clear()
+    assert reopened.get("a") is None
+    reopened.close()
+
+
+def test_find_valid_versions__cached(valid_1_0_0_modeling_json):
+    cache = module.VerdictCache()
+    versions = ["1.0.0", "1.0.1"]
+    for _ in range(3):
+        assert validate.find_valid_versions(
+            valid_1_0_0_modeling_json, "modeling_input", versions, cache=cache
+        ) == ["1.0.0"]
+    # 1.0.1 is rejected by its discriminator, without a lookup
+    assert (cache.misses, cache.memory_hits) == (1, 2)
+
+    valid_1_0_0_modeling_json["roofMaterial"] = "bogus"
+    for _ in range(2):
+        with pytest.raises(validate.ValidationError, match="'bogus' is not one of"):
+            validate.find_valid_versions(
+                valid_1_0_0_modeling_json, "modeling_input", ["1.0.0"], cache=cache
+            )
+    assert (cache.misses, cache.memory_hits) == (2, 3)
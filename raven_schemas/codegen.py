@@ -0,0 +1,544 @@
+"""Compile JSON schemas into specialized Python validation functions.
+
+Each subschema becomes a function that returns None when the instance is valid, or an error
+message prefixed with the instance path relative to it (eg. ".survey.systems: 'X' is not ...").
+Subschemas that are simple enough (type, enum, const, and properties/not/anyOf/allOf of those)
+are also inlined as boolean expressions in their parent, and their function is only called to
+build the error message once the inline check has failed. Identical subschemas are compiled once.
+
+Only the keywords used by our schemas are supported; anything else raises a ValueError
+so that a new schema can't silently be compiled into a more permissive validator.
+"""
+import functools
+import json
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from raven_schemas import schemas
+
+# Keywords that don't affect validation
+ANNOTATION_KEYWORDS = {"$schema", "$comment", "title", "description", "examples"}
+SUPPORTED_KEYWORDS = ANNOTATION_KEYWORDS | {
+    "type",
+    "enum",
+    "const",
+    "required",
+    "properties",
+    "additionalProperties",
+    "items",
+    "minimum",
+    "maximum",
+    "minLength",
+    "maxLength",
+    "allOf",
+    "anyOf",
+    "oneOf",
+    "not",
+    "if",
+    "then",
+    "else",
+}
+# Keywords that may appear in an inlined boolean expression
+INLINE_KEYWORDS = ANNOTATION_KEYWORDS | {
+    "type",
+    "enum",
+    "const",
+    "properties",
+    "not",
+    "anyOf",
+    "allOf",
+}
+MAX_INLINE_LENGTH = 600
+# Stands in for the instance in stored inline expressions; repr() never produces it
+PLACEHOLDER = "\x00"
+
+TYPE_CHECKS = {
+    "string": "isinstance({x}, str)",
+    "integer": "(isinstance({x}, int) and not isinstance({x}, bool) or isinstance({x}, float) and {x}.is_integer())",
+    "number": "(isinstance({x}, (int, float)) and not isinstance({x}, bool))",
+    "boolean": "({x} is True or {x} is False)",
+    "null": "{x} is None",
+    "object": "isinstance({x}, dict)",
+    "array": "isinstance({x}, list)",
+}
+
+PRELUDE = '''
+
+def _equal(a, b):
+    """JSON equality: booleans are not numbers, containers compare element-wise"""
+    if isinstance(a, bool) or isinstance(b, bool):
+        return a is b
+    if isinstance(a, str) or isinstance(b, str):
+        return a == b
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(_equal(i, j) for i, j in zip(a, b))
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(_equal(a[k], b[k]) for k in a)
+    return a == b
+'''
+
+
+def canonical_key(schema: Any) -> str:
+    """Canonical form of a subschema, ignoring annotations, used to dedupe identical subschemas"""
+    return json.dumps(_strip_annotations(schema), sort_keys=True)
+
+
+def _strip_annotations(schema: Any) -> Any:
+    if isinstance(schema, dict):
+        return {
+            k: _strip_annotations(v)
+            for k, v in schema.items()
+            if k not in ANNOTATION_KEYWORDS
+        }
+    if isinstance(schema, list):
+        return [_strip_annotations(v) for v in schema]
+    return schema
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class SchemaCompiler:
+    """Accumulates the compiled functions of one or more schemas into a single module.
+
+    With memoize=True, every generated function takes a memo dict as a second argument, and the
+    results of object subschemas are cached in it by (subschema, id(instance)). Sharing one memo
+    between several versions' entry points evaluates their identical subtrees only once.
+    """
+
+    def __init__(self, memoize: bool = False):
+        self.memoize = memoize
+        self._names: Dict[str, str] = {}  # canonical subschema -> function name
+        self._inline: Dict[str, Optional[str]] = {}  # function name -> expression
+        self._functions: List[str] = []
+        self._constants: Dict[str, str] = {}  # value source -> constant name
+        self._entry_points: Dict[str, str] = {}  # version -> root function name
+
+    def add_schema(self, version: str, schema: Any) -> None:
+        self._entry_points[version] = self.compile(schema)
+
+    def compile(self, schema: Any) -> str:
+        """Compile a subschema, returning the name of its function"""
+        key = canonical_key(schema)
+        if key in self._names:
+            return self._names[key]
+        name = f"_s{len(self._names)}"
+        self._names[key] = name
+        self._inline[name] = self._expr(schema, PLACEHOLDER)
+        self._functions.append(self._function(name, schema))
+        return name
+
+    def source(self, header: str = "") -> str:
+        lines = [f'"""{header}"""' if header else '"""Generated validators."""']
+        lines.append(PRELUDE)
+        lines.extend(f"{name} = {value}" for value, name in self._constants.items())
+        lines.extend(self._functions)
+        memo = ", m=None" if self.memoize else ""
+        for version, root in self._entry_points.items():
+            entry = f"validate_{version.replace('.', '_')}"
+            lines.append(f"\n\ndef {entry}(instance{memo}):")
+            if self.memoize:
+                lines.append("    if m is None:\n        m = {}")
+            lines.append(f"    e = {self._call(root, 'instance')}")
+            lines.append('    return None if e is None else "$" + e')
+        lines.append("\n\nVALIDATORS = {")
+        lines.extend(
+            f"    {version!r}: validate_{version.replace('.', '_')},"
+            for version in self._entry_points
+        )
+        lines.append("}\n")
+        return "\n".join(lines)
+
+    # Helpers
+
+    def _constant(self, value: Any, prefix: str = "_C") -> str:
+        if isinstance(value, frozenset):
+            # Sorted, so that the generated source doesn't depend on hash randomization
+            source = f"frozenset({sorted(value, key=repr)!r})"
+        else:
+            source = repr(value)
+        if source not in self._constants:
+            self._constants[source] = f"{prefix}{len(self._constants)}"
+        return self._constants[source]
+
+    def _call(self, name: str, var: str) -> str:
+        return f"{name}({var}, m)" if self.memoize else f"{name}({var})"
+
+    def _ok(self, schema: Any, var: str) -> str:
+        """Boolean expression: does var satisfy the subschema"""
+        name = self.compile(schema)
+        expr = self._inline[name]
+        if expr is not None:
+            return expr.replace(PLACEHOLDER, var)
+        return f"({self._call(name, var)} is None)"
+
+    def _match(self, values: List[Any], x: str) -> str:
+        """Boolean expression: is x equal to one of the values"""
+        terms = []
+        strings = [v for v in values if isinstance(v, str)]
+        numbers = [v for v in values if _is_number(v)]
+        others = [
+            v
+            for v in values
+            if not (isinstance(v, str) or _is_number(v) or v in (True, False, None))
+        ]
+        if None in values:
+            terms.append(f"{x} is None")
+        for literal in (True, False):
+            if any(v is literal for v in values):
+                terms.append(f"{x} is {literal}")
+        if len(strings) == 1:
+            terms.append(f"{x} == {strings[0]!r}")
+        elif strings:
+            terms.append(
+                f"isinstance({x}, str) and {x} in {self._constant(frozenset(strings), '_E')}"
+            )
+        if numbers:
+            terms.append(
+                f"isinstance({x}, (int, float)) and not isinstance({x}, bool) "
+                f"and {x} in {self._constant(frozenset(numbers), '_N')}"
+            )
+        if others:
+            terms.append(f"any(_equal({x}, c) for c in {self._constant(others, '_L')})")
+        if not terms:
+            return "False"
+        return "(" + " or ".join(f"({t})" for t in terms) + ")"
+
+    def _type_check(self, types: Any, x: str) -> str:
+        if isinstance(types, str):
+            types = [types]
+        for t in types:
+            if t not in TYPE_CHECKS:
+                raise ValueError(f"Unsupported type {t!r}")
+        return "(" + " or ".join(TYPE_CHECKS[t].format(x=x) for t in types) + ")"
+
+    # Inline expressions
+
+    def _expr(self, schema: Any, x: str) -> Optional[str]:
+        """Inline boolean expression checking x against a simple subschema.
+        None if the subschema needs a function.
+        """
+        if schema is True:
+            return "True"
+        if schema is False:
+            return "False"
+        if not isinstance(schema, dict) or not set(schema) <= INLINE_KEYWORDS:
+            return None
+        terms = []
+        if "type" in schema:
+            terms.append(self._type_check(schema["type"], x))
+        if "enum" in schema:
+            terms.append(self._match(schema["enum"], x))
+        if "const" in schema:
+            terms.append(self._match([schema["const"]], x))
+        if "properties" in schema:
+            props = []
+            for key, subschema in schema["properties"].items():
+                sub = self._expr(subschema, f"{x}[{key!r}]")
+                if sub is None:
+                    return None
+                props.append(f"({key!r} not in {x} or {sub})")
+            if props:
+                terms.append(f"(not isinstance({x}, dict) or {' and '.join(props)})")
+        if "not" in schema:
+            sub = self._expr(schema["not"], x)
+            if sub is None:
+                return None
+            terms.append(f"not {sub}")
+        for keyword, joiner in (("allOf", " and "), ("anyOf", " or ")):
+            if keyword in schema:
+                subs = [self._expr(s, x) for s in schema[keyword]]
+                if any(s is None for s in subs):
+                    return None
+                terms.append("(" + joiner.join(subs) + ")")  # type: ignore[arg-type]
+        if not terms:
+            return "True"
+        expr = "(" + " and ".join(terms) + ")"
+        if len(expr) > MAX_INLINE_LENGTH:
+            return None
+        return expr
+
+    # Functions
+
+    def _function(self, name: str, schema: Any) -> str:
+        args = "x, m" if self.memoize else "x"
+        body = self._body(schema)
+        object_schema = isinstance(schema, dict) and (
+            "properties" in schema or "allOf" in schema
+        )
+        if self.memoize and object_schema:
+            return (
+                f"\n\ndef {name}({args}):\n"
+                f"    k = ({name!r}, id(x))\n"
+                f"    if k in m:\n        return m[k]\n"
+                f"    m[k] = r = {name}_(x, m)\n"
+                f"    return r\n"
+                f"\n\ndef {name}_({args}):\n" + "\n".join(body)
+            )
+        return f"\n\ndef {name}({args}):\n" + "\n".join(body)
+
+    def _fail(self, template: str, *args: str) -> str:
+        """Statement returning a root-relative error message"""
+        if args:
+            return f"return {': ' + template!r} % ({', '.join(args)},)"
+        return f"return {': ' + template!r}"
+
+    def _body(self, schema: Any) -> List[str]:
+        if schema is True or schema == {}:
+            return ["    return None"]
+        if schema is False:
+            return ["    " + self._fail("False schema does not allow %r", "x")]
+        if not isinstance(schema, dict):
+            raise ValueError(f"Invalid subschema {schema!r}")
+        unsupported = set(schema) - SUPPORTED_KEYWORDS
+        if unsupported:
+            raise ValueError(f"Unsupported keywords {sorted(unsupported)}")
+
+        lines: List[str] = []
+
+        def check(condition: str, failure: str, indent: str = "    "):
+            lines.append(f"{indent}if not {condition}:")
+            lines.append(f"{indent}    {failure}")
+
+        if "type" in schema:
+            check(
+                self._type_check(schema["type"], "x"),
+                self._fail(
+                    "%r is not of type %s",
+                    "x",
+                    self._constant(
+                        ", ".join(
+                            repr(t)
+                            for t in (
+                                [schema["type"]]
+                                if isinstance(schema["type"], str)
+                                else schema["type"]
+                            )
+                        )
+                    ),
+                ),
+            )
+        if "enum" in schema:
+            check(
+                self._match(schema["enum"], "x"),
+                self._fail("%r is not one of %r", "x", self._constant(schema["enum"])),
+            )
+        if "const" in schema:
+            check(
+                self._match([schema["const"]], "x"),
+                self._fail("%r was expected", self._constant(schema["const"])),
+            )
+
+        object_keywords = [
+            k for k in ("required", "properties", "additionalProperties") if k in schema
+        ]
+        if object_keywords:
+            lines.append("    if isinstance(x, dict):")
+            self._object_body(schema, lines)
+
+        if "items" in schema:
+            item = self.compile(schema["items"])
+            lines.append("    if isinstance(x, list):")
+            lines.append("        for i, v in enumerate(x):")
+            lines.append(f"            e = {self._call(item, 'v')}")
+            lines.append("            if e is not None:")
+            lines.append('                return "[%d]" % i + e')
+
+        number = "isinstance(x, (int, float)) and not isinstance(x, bool)"
+        if "minimum" in schema:
+            limit = self._constant(schema["minimum"])
+            lines.append(f"    if {number} and x < {limit}:")
+            lines.append(
+                "        " + self._fail("%r is less than the minimum of %r", "x", limit)
+            )
+        if "maximum" in schema:
+            limit = self._constant(schema["maximum"])
+            lines.append(f"    if {number} and x > {limit}:")
+            lines.append(
+                "        "
+                + self._fail("%r is greater than the maximum of %r", "x", limit)
+            )
+        if "minLength" in schema:
+            lines.append(
+                f"    if isinstance(x, str) and len(x) < {schema['minLength']!r}:"
+            )
+            lines.append("        " + self._fail("%r is too short", "x"))
+        if "maxLength" in schema:
+            lines.append(
+                f"    if isinstance(x, str) and len(x) > {schema['maxLength']!r}:"
+            )
+            lines.append("        " + self._fail("%r is too long", "x"))
+
+        for subschema in schema.get("allOf", []):
+            name = self.compile(subschema)
+            if self._inline[name] is not None:
+                lines.append(f"    if not {self._ok(subschema, 'x')}:")
+                lines.append(f"        return {self._call(name, 'x')}")
+            else:
+                lines.append(f"    e = {self._call(name, 'x')}")
+                lines.append("    if e is not None:")
+                lines.append("        return e")
+        if "anyOf" in schema:
+            check(
+                "(" + " or ".join(self._ok(s, "x") for s in schema["anyOf"]) + ")",
+                self._fail("%r is not valid under any of the given schemas", "x"),
+            )
+        if "oneOf" in schema:
+            matches = " + ".join(self._ok(s, "x") for s in schema["oneOf"])
+            lines.append(f"    n = {matches}")
+            lines.append("    if n == 0:")
+            lines.append(
+                "        "
+                + self._fail("%r is not valid under any of the given schemas", "x")
+            )
+            lines.append("    if n > 1:")
+            lines.append(
+                "        "
+                + self._fail(
+                    "%r is valid under more than one of the given schemas", "x"
+                )
+            )
+        if "not" in schema:
+            lines.append(f"    if {self._ok(schema['not'], 'x')}:")
+            lines.append(
+                "        "
+                + self._fail(
+                    "%r should not be valid under %r",
+                    "x",
+                    self._constant(_strip_annotations(schema["not"])),
+                )
+            )
+        if "if" in schema and ("then" in schema or "else" in schema):
+            lines.append(f"    if {self._ok(schema['if'], 'x')}:")
+            lines.extend(self._branch(schema.get("then")))
+            lines.append("    else:")
+            lines.extend(self._branch(schema.get("else")))
+        lines.append("    return None")
+        return lines
+
+    def _branch(self, schema: Any) -> List[str]:
+        if schema is None:
+            return ["        pass"]
+        name = self.compile(schema)
+        return [
+            f"        e = {self._call(name, 'x')}",
+            "        if e is not None:",
+            "            return e",
+        ]
+
+    def _object_body(self, schema: dict, lines: List[str]) -> None:
+        properties = schema.get("properties", {})
+        if "required" in schema:
+            required = self._constant(frozenset(schema["required"]), "_R")
+            lines.append(f"        if not x.keys() >= {required}:")
+            lines.append(f"            for k in {self._constant(schema['required'])}:")
+            lines.append("                if k not in x:")
+            lines.append(
+                "                    " + self._fail("%r is a required property", "k")
+            )
+        additional = schema.get("additionalProperties", True)
+        known = self._constant(frozenset(properties), "_P")
+        if additional is False:
+            lines.append(f"        if not x.keys() <= {known}:")
+            lines.append("            for k in x:")
+            lines.append(f"                if k not in {known}:")
+            lines.append(
+                "                    "
+                + self._fail(
+                    "Additional properties are not allowed (%r was unexpected)", "k"
+                )
+            )
+        elif additional is not True:
+            name = self.compile(additional)
+            lines.append("        for k, v in x.items():")
+            lines.append(f"            if k not in {known}:")
+            lines.append(f"                e = {self._call(name, 'v')}")
+            lines.append("                if e is not None:")
+            lines.append('                    return "." + k + e')
+        for key, subschema in properties.items():
+            name = self.compile(subschema)
+            value = f"x[{key!r}]"
+            lines.append(f"        if {key!r} in x:")
+            if self._inline[name] is not None:
+                lines.append(f"            if not {self._ok(subschema, value)}:")
+                lines.append(
+                    f"                return {'.' + key!r} + {self._call(name, value)}"
+                )
+            else:
+                lines.append(f"            e = {self._call(name, value)}")
+                lines.append("            if e is not None:")
+                lines.append(f"                return {'.' + key!r} + e")
+
+
+def compile_schema_source(
+    schema_name: str, versions: Optional[List[str]] = None, memoize: bool = False
+) -> str:
+    """Python source of a module with one validate_<version> function per schema version,
+    and a VALIDATORS dict mapping versions to them.
+    """
+    if versions is None:
+        versions = schemas.get_known_schemas_and_versions()[schema_name]
+    compiler = SchemaCompiler(memoize=memoize)
+    for version in versions:
+        compiler.add_schema(version, schemas.load_schema(schema_name, version))
+    return compiler.source(
+        f"Generated by `raven-schemas compile` from the {schema_name} schemas. Do not edit."
+    )
+
+
+@functools.cache
+def load_validators(
+    schema_name: str, versions: Optional[tuple] = None, memoize: bool = False
+) -> Dict[str, Callable]:
+    """Compile the schema versions in memory, returning {version: validate function}.
+    Each function returns None for a valid instance, or an error message.
+    Bytecode from the validator artifact is used when it's up to date (see artifact.py).
+    """
+    # artifact builds its bytecode with this module
+    from raven_schemas import artifact
+
+    if versions is None:
+        versions = tuple(schemas.get_known_schemas_and_versions()[schema_name])
+    prebuilt = artifact.default_artifact()
+    code = prebuilt.code(schema_name, versions, memoize) if prebuilt else None
+    if code is None:
+        source = compile_schema_source(schema_name, list(versions), memoize)
+        code = compile(source, f"<compiled {schema_name}>", "exec")
+    namespace: Dict[str, Any] = {}
+    exec(code, namespace)
+    return namespace["VALIDATORS"]
+
+
+def compile_function(schema: Any) -> Callable[[Any], Optional[str]]:
+    """Compile a single schema (or subschema) in memory.
+    The function returns None for a valid instance, or an error message.
+    """
+    return compile_functions({"schema": schema})["schema"]
+
+
+def compile_functions(named_schemas: Dict[str, Any]) -> Dict[str, Callable]:
+    """Compile several schemas (or subschemas) into one in-memory module, returning {name: function}.
+    Identical schemas share their function, so callers can skip repeated checks by identity.
+    """
+    compiler = SchemaCompiler()
+    entry_points: Dict[str, str] = {}  # canonical schema -> entry point
+    names: Dict[str, str] = {}  # name -> entry point
+    for name, schema in named_schemas.items():
+        key = canonical_key(schema)
+        if key not in entry_points:
+            entry_points[key] = f"e{len(entry_points)}"
+            compiler.add_schema(entry_points[key], schema)
+        names[name] = entry_points[key]
+    namespace: Dict[str, Any] = {}
+    exec(compile(compiler.source(), "<compiled schemas>", "exec"), namespace)
+    return {name: namespace["VALIDATORS"][entry] for name, entry in names.items()}
+
+
+def write_module(schema_name: str, output_dir: Path) -> Path:
+    """Write the compiled validators of every known version of a schema to <output_dir>/<schema_name>.py"""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    path = output_dir / f"{schema_name}.py"
+    path.write_text(compile_schema_source(schema_name))
+    return path
@@ -0,0 +1,130 @@
+import copy
+import json
+from typing import Any, Iterator, List
+
+import pytest
+
+from raven_schemas import codegen as module
+from raven_schemas import schemas, validate
+from raven_schemas.constants import SCHEMA_DIR
+
+VERSIONS = schemas.get_known_schemas_and_versions()["modeling_input"]
+SAMPLE_FILES = sorted(SCHEMA_DIR.glob("modeling_input_*_sample_*.json"))
+
+
+def _mutations(data: Any, path: List = None) -> Iterator[Any]:
+    """Documents that each differ from data in one place"""
+    path = path or []
+    if isinstance(data, dict):
+        for key, value in data.items():
+            for replacement in (None, "bogus", 1, True, {}):
+                mutated = copy.deepcopy(data)
+                mutated[key] = replacement
+                yield mutated
+            dropped = copy.deepcopy(data)
+            del dropped[key]
+            yield dropped
+            for sub in _mutations(value, path + [key]):
+                mutated = copy.deepcopy(data)
+                mutated[key] = sub
+                yield mutated
+        extra = copy.deepcopy(data)
+        extra["unexpected"] = 1
+        yield extra
+
+
+@pytest.fixture(scope="module")
+def compiled():
+    return module.load_validators("modeling_input")
+
+
+@pytest.mark.parametrize("sample_file", SAMPLE_FILES, ids=lambda f: f.name)
+def test_same_verdicts_as_jsonschema_on_samples(compiled, sample_file):
+    data = json.loads(sample_file.read_text())
+    for version in VERSIONS:
+        expected = validate.registry.get("modeling_input", version).is_valid(data)
+        assert (compiled[version](data) is None) == expected, version
+
+
+@pytest.mark.parametrize("version", ["1.0.0", "1.1.0", "2.0.0"])
+def test_same_verdicts_as_jsonschema_on_mutations(compiled, version):
+    sample_file = (
+        SCHEMA_DIR / f"modeling_input_{version.replace('.', '_')}_sample_valid.json"
+    )
+    validator = validate.registry.get("modeling_input", version)
+    for mutated in _mutations(json.loads(sample_file.read_text())):
+        assert (compiled[version](mutated) is None) == validator.is_valid(mutated)
+
+
+def test_error_message_has_instance_path(compiled):
+    data = json.loads(
+        (SCHEMA_DIR / "modeling_input_2_0_0_sample_valid.json").read_text()
+    )
+    data["survey"]["systems"]["cooling"]["type"] = "Condenser"
+    assert compiled["2.0.0"](data).startswith(
+        "$.survey.systems.cooling.type: 'Condenser'"
+    )
+    del data["city"]
+    assert compiled["2.0.0"](data) == "$: 'city' is a required property"
+
+
+@pytest.mark.parametrize(
+    "schema, valid, invalid",
+    [
+        ({"type": "integer"}, [1, 1.0, -3], [True, 1.5, "1", None]),
+        ({"enum": [1, "a", None]}, [1, 1.0, "a", None], [True, "b", []]),
+        ({"const": False}, [False], [0, None, True]),
+        (
+            {"const": [1, {"a": True}]},
+            [[1, {"a": True}]],
+            [[1, {"a": 1}], [True, {"a": True}]],
+        ),
+        ({"oneOf": [{"type": "integer"}, {"type": "number"}]}, [1.5], [1, "a"]),
+        ({"items": {"type": "string"}, "maxLength": 1}, [["a"], "b"], [[1], "ab"]),
+        ({"minimum": 2, "maximum": 3}, [2, 3, "a"], [1, 4]),
+    ],
+)
+def test_keyword_semantics(schema, valid, invalid):
+    compiler = module.SchemaCompiler()
+    compiler.add_schema("0.0.0", schema)
+    namespace: dict = {}
+    exec(compiler.source(), namespace)
+    validate_fn = namespace["VALIDATORS"]["0.0.0"]
+    assert [validate_fn(v) for v in valid] == [None] * len(valid)
+    assert all(validate_fn(v) is not None for v in invalid)
+
+
+def test_unsupported_keyword():
+    compiler = module.SchemaCompiler()
+    with pytest.raises(ValueError, match="patternProperties"):
+        compiler.add_schema("0.0.0", {"patternProperties": {"a": {}}})
+
+
+def test_identical_subschemas_are_compiled_once():
+    compiler = module.SchemaCompiler()
+    compiler.add_schema("0.0.0", {"enum": [True, False, None], "$comment": "a"})
+    compiler.add_schema("0.0.1", {"enum": [True, False, None]})
+    assert compiler.source().count("\ndef _s") == 1
+
+
+def test_write_module(tmp_path):
+    path = module.write_module("modeling_input", tmp_path)
+    namespace: dict = {}
+    exec(path.read_text(), namespace)
+    assert set(namespace["VALIDATORS"]) == set(VERSIONS)
+
+
+def test_memoize_shares_identical_subtrees():
+    shared = {"type": "object", "properties": {"a": {"type": "integer"}}}
+    compiler = module.SchemaCompiler(memoize=True)
+    compiler.add_schema("1", {"properties": {"v": {"const": 1}, "shared": shared}})
+    compiler.add_schema("2", {"properties": {"v": {"const": 2}, "shared": shared}})
+    namespace: dict = {}
+    exec(compiler.source(), namespace)
+    data = {"shared": {"a": 1}}
+    memo: dict = {}
+    assert namespace["VALIDATORS"]["1"](data, memo) is None
+    evaluated = len(memo)
+    assert namespace["VALIDATORS"]["2"](data, memo) is None
+    # Only the second root is new, the shared subtree's result is reused
+    assert len(memo) == evaluated + 1
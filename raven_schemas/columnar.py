@@ -0,0 +1,714 @@
+"""Validate a batch of records held as columns, one check per schema rule for the whole batch.
+
+A batch maps column names to equal length sequences: lists, or NumPy arrays. A column is named
+by the dotted path of a property, eg. "bedroomCount" or "survey.systems.cooling.type", and
+MISSING marks a row where the property is absent (a column that isn't in the batch is absent
+from every row). columns_from_documents flattens documents into this layout.
+
+Rules are derived from the schema once per set of columns:
+- type: from the column's dtype when it settles it, otherwise per value
+- enum and const (including the `oneOf: [..., {"type": "null"}]` unions): set membership
+- required and additionalProperties: which columns are present in each row
+- properties, allOf, anyOf, oneOf, not and if/then/else: boolean operations on the masks of
+  their subschemas, eg. the survey rules that tie fuel_type to the rest of primary_heating
+Keywords that can't be checked that way (eg. minimum or pattern, or a column of objects) are
+validated row by row with jsonschema, on the values reconstructed from the columns.
+
+The result has a validity mask over the rows, and the rows each rule fails for. A rule is
+identified by its schema location, eg. "#/properties/roofMaterial/enum". Masks are lists of
+booleans, or NumPy boolean arrays when the batch holds NumPy arrays: NumPy is only imported
+then, it isn't a dependency of this package.
+Empty objects can't be represented by columns: flatten them into an empty object value.
+"""
+import functools
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+import jsonschema
+
+from raven_schemas import schemas
+
+SEPARATOR = "."
+# Keywords that combine subschemas of the same value
+COMBINATORS = {"not", "allOf", "anyOf", "oneOf", "if"}
+# Keywords that don't constrain values
+ANNOTATIONS = {
+    "$schema",
+    "$id",
+    "$comment",
+    "$defs",
+    "definitions",
+    "title",
+    "description",
+    "default",
+    "examples",
+}
+_JSON_CLASSES = {
+    "string": (str,),
+    "boolean": (bool,),
+    "null": (type(None),),
+    "object": (dict,),
+    "array": (list,),
+    "number": (int, float),
+    "integer": (int,),
+}
+
+# A path in a document: property names
+Path = Tuple[str, ...]
+# A boolean per row: a list, or a NumPy array
+Mask = Any
+
+
+class _Missing:
+    def __repr__(self) -> str:
+        return "MISSING"
+
+
+MISSING: Any = _Missing()
+# Classes whose JSON type is known without asking the type checker
+_KNOWN_CLASSES = {str, bool, type(None), dict, list, int, float, _Missing}
+
+
+class Rule(NamedTuple):
+    # Schema location of the keyword, eg. "#/properties/roofMaterial/enum"
+    code: str
+    # Dotted path of the property the keyword applies to, "" for the document
+    path: str
+    keyword: str
+    # $comment of the subschema the keyword is in, if any
+    comment: Optional[str]
+    # False if any part of the rule is checked row by row
+    vectorized: bool
+
+
+class ColumnarResult(NamedTuple):
+    valid: Mask
+    # Rows each rule fails for, for the rules that fail for any row
+    failures: Dict[str, Mask]
+    rules: Dict[str, Rule]
+
+    def errors(self, row: int) -> List[str]:
+        """Codes of the rules the row fails"""
+        return [code for code, mask in self.failures.items() if mask[row]]
+
+
+def _flatten(document: Any, prefix: str, row: Dict[str, Any]) -> None:
+    for name, value in document.items():
+        column = f"{prefix}{SEPARATOR}{name}" if prefix else name
+        if isinstance(value, dict) and value:
+            _flatten(value, column, row)
+        else:
+            row[column] = value
+
+
+def columns_from_documents(documents: Iterable[dict]) -> Dict[str, List[Any]]:
+    """Columns of the documents' properties, down to their non-object (or empty object) values"""
+    rows = []
+    for document in documents:
+        row: Dict[str, Any] = {}
+        _flatten(document, "", row)
+        rows.append(row)
+    names = sorted({name for row in rows for name in row})
+    return {name: [row.get(name, MISSING) for row in rows] for name in names}
+
+
+def _equal(a: Any, b: Any) -> bool:
+    """JSON equality: booleans are not numbers, containers compare element-wise"""
+    if isinstance(a, bool) or isinstance(b, bool):
+        return a is b
+    if isinstance(a, str) or isinstance(b, str):
+        return a == b
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(_equal(i, j) for i, j in zip(a, b))
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(_equal(a[k], b[k]) for k in a)
+    return a == b
+
+
+def _contains(
+    value: Any, scalars: Set[Any], bools: Set[bool], others: List[Any]
+) -> bool:
+    if value.__class__ is bool:
+        return value in bools
+    if value.__class__ is dict or value.__class__ is list:
+        return any(_equal(value, other) for other in others)
+    return value in scalars
+
+
+class _ListMasks:
+    """Masks as lists of booleans"""
+
+    def __init__(self, size: int, validator: "jsonschema.protocols.Validator"):
+        self.size = size
+        self.validator = validator
+
+    def constant(self, value: bool) -> Mask:
+        return [value] * self.size
+
+    def from_iter(self, values: Iterable[bool]) -> Mask:
+        return list(values)
+
+    def and_(self, a: Mask, b: Mask) -> Mask:
+        return [x and y for x, y in zip(a, b)]
+
+    def or_(self, a: Mask, b: Mask) -> Mask:
+        return [x or y for x, y in zip(a, b)]
+
+    def not_(self, a: Mask) -> Mask:
+        return [not x for x in a]
+
+    def exactly_one(self, masks: List[Mask]) -> Mask:
+        return [sum(row) == 1 for row in zip(*masks)]
+
+    def values(self, column: Sequence[Any]) -> List[Any]:
+        return list(column)
+
+    def present(self, column: Sequence[Any]) -> Mask:
+        return [value is not MISSING for value in column]
+
+    def isin(self, column: Sequence[Any], values: List[Any]) -> Mask:
+        # As in JSON Schema, booleans aren't equal to 0 and 1
+        bools = {value for value in values if value.__class__ is bool}
+        others = [value for value in values if isinstance(value, (dict, list))]
+        scalars = {
+            value
+            for value in values
+            if value.__class__ is not bool and not isinstance(value, (dict, list))
+        }
+        if not others:
+            try:
+                return [
+                    value in bools if value.__class__ is bool else value in scalars
+                    for value in column
+                ]
+            except TypeError:
+                # An object or array value
+                pass
+        return [_contains(value, scalars, bools, others) for value in column]
+
+    def types(self, column: Sequence[Any], types: List[str]) -> Mask:
+        classes = {cls for name in types for cls in _JSON_CLASSES.get(name, ())}
+        # Integers in JSON Schema include floats without a fractional part
+        integral = "integer" in types and "number" not in types
+        return [
+            value.__class__ in classes
+            or integral
+            and value.__class__ is float
+            and value.is_integer()
+            or value.__class__ not in _KNOWN_CLASSES
+            and any(self.validator.is_type(value, name) for name in types)
+            for value in column
+        ]
+
+
+class _NumpyMasks(_ListMasks):
+    """Masks as NumPy boolean arrays, checking typed columns from their dtype"""
+
+    def __init__(self, size: int, validator: "jsonschema.protocols.Validator"):
+        super().__init__(size, validator)
+        import numpy
+
+        self.numpy = numpy
+
+    def constant(self, value: bool) -> Mask:
+        return self.numpy.full(self.size, value, dtype=bool)
+
+    def from_iter(self, values: Iterable[bool]) -> Mask:
+        return self.numpy.fromiter(values, dtype=bool, count=self.size)
+
+    def and_(self, a: Mask, b: Mask) -> Mask:
+        return self.numpy.logical_and(a, b)
+
+    def or_(self, a: Mask, b: Mask) -> Mask:
+        return self.numpy.logical_or(a, b)
+
+    def not_(self, a: Mask) -> Mask:
+        return self.numpy.logical_not(a)
+
+    def exactly_one(self, masks: List[Mask]) -> Mask:
+        return self.numpy.sum(masks, axis=0) == 1
+
+    @staticmethod
+    def _kind(column: Sequence[Any]) -> str:
+        dtype = getattr(column, "dtype", None)
+        return "O" if dtype is None else dtype.kind
+
+    def values(self, column: Sequence[Any]) -> List[Any]:
+        return column.tolist() if hasattr(column, "tolist") else list(column)
+
+    def present(self, column: Sequence[Any]) -> Mask:
+        if self._kind(column) in "biufU":
+            return self.constant(True)
+        return self.from_iter(super().present(self.values(column)))
+
+    def isin(self, column: Sequence[Any], values: List[Any]) -> Mask:
+        kind = self._kind(column)
+        if kind == "b":
+            candidates = [value for value in values if value.__class__ is bool]
+        elif kind in "iuf":
+            candidates = [
+                value
+                for value in values
+                if isinstance(value, (int, float)) and value.__class__ is not bool
+            ]
+        elif kind == "U":
+            candidates = [value for value in values if isinstance(value, str)]
+        else:
+            return self.from_iter(super().isin(self.values(column), values))
+        if not candidates:
+            return self.constant(False)
+        return self.numpy.isin(column, candidates)
+
+    def types(self, column: Sequence[Any], types: List[str]) -> Mask:
+        kind = self._kind(column)
+        if kind == "b":
+            return self.constant("boolean" in types)
+        if kind in "iu":
+            return self.constant("integer" in types or "number" in types)
+        if kind == "f":
+            if "number" in types:
+                return self.constant(True)
+            if "integer" in types:
+                return self.numpy.isfinite(column) & (
+                    self.numpy.floor(column) == column
+                )
+            return self.constant(False)
+        if kind == "U":
+            return self.constant("string" in types)
+        return self.from_iter(super().types(self.values(column), types))
+
+
+class _Batch:
+    """The columns of a batch, and the masks and values derived from them"""
+
+    def __init__(
+        self, layout: "_Layout", columns: Mapping[str, Any], masks: _ListMasks
+    ):
+        self.layout = layout
+        self.columns = columns
+        self.masks = masks
+        self._present: Dict[Path, Mask] = {}
+        self._leaf_present: Dict[Path, Mask] = {}
+        self._within: Dict[Path, Mask] = {(): masks.constant(True)}
+        self._values: Dict[Path, List[Any]] = {}
+
+    def column(self, path: Path) -> Any:
+        return self.columns[SEPARATOR.join(path)]
+
+    def present(self, path: Path) -> Mask:
+        """Rows that have the property"""
+        if path not in self._present:
+            kind = self.layout.kind(path)
+            if not path:
+                mask = self.masks.constant(True)
+            elif kind == "absent":
+                mask = self.masks.constant(False)
+            elif kind == "leaf":
+                mask = self.masks.present(self.column(path))
+            else:
+                children = [path + (name,) for name in self.layout.children[path]]
+                mask = self.present(children[0])
+                for child in children[1:]:
+                    mask = self.masks.or_(mask, self.present(child))
+                if kind == "mixed":
+                    mask = self.masks.or_(mask, self.leaf_present(path))
+            self._present[path] = mask
+        return self._present[path]
+
+    def leaf_present(self, path: Path) -> Mask:
+        """Rows with a value in the property's own column"""
+        if path not in self._leaf_present:
+            self._leaf_present[path] = self.masks.present(self.column(path))
+        return self._leaf_present[path]
+
+    def within(self, path: Path) -> Mask:
+        """Rows that have the property and all of its parents"""
+        if path not in self._within:
+            self._within[path] = self.masks.and_(
+                self.within(path[:-1]), self.present(path)
+            )
+        return self._within[path]
+
+    def values(self, path: Path) -> List[Any]:
+        """The property's value in each row (MISSING if it's absent), rebuilt from the columns"""
+        if path not in self._values:
+            kind = self.layout.kind(path)
+            if kind == "absent":
+                values = [MISSING] * self.masks.size
+            elif kind == "leaf":
+                values = self.masks.values(self.column(path))
+            else:
+                names = self.layout.children.get(path, [])
+                children = [self.values(path + (name,)) for name in names]
+                values = []
+                for row in zip(*children):
+                    document = {
+                        name: value
+                        for name, value in zip(names, row)
+                        if value is not MISSING
+                    }
+                    values.append(document or MISSING)
+                if kind == "mixed":
+                    values = [
+                        value if value is not MISSING else document
+                        for value, document in zip(
+                            self.masks.values(self.column(path)), values
+                        )
+                    ]
+            self._values[path] = values
+        return self._values[path]
+
+
+class _Layout:
+    """Which properties the columns of a batch hold"""
+
+    def __init__(self, names: Iterable[str]):
+        self.leaves = {tuple(name.split(SEPARATOR)) for name in names}
+        children: Dict[Path, Set[str]] = {}
+        for leaf in self.leaves:
+            for i in range(len(leaf)):
+                children.setdefault(leaf[:i], set()).add(leaf[i])
+        self.children = {path: sorted(names) for path, names in children.items()}
+
+    def kind(self, path: Path) -> str:
+        """leaf: a column holds the property's values; object: columns hold its properties;
+        mixed: both; absent: neither
+        """
+        if not path:
+            return "object"
+        if path in self.leaves:
+            return "mixed" if path in self.children else "leaf"
+        return "object" if path in self.children else "absent"
+
+
+# Checks a batch, returning a mask
+Check = Callable[[_Batch], Mask]
+
+
+def _escape(name: str) -> str:
+    return name.replace("~", "~0").replace("/", "~1")
+
+
+def _all(checks: List[Check]) -> Check:
+    if not checks:
+        return lambda batch: batch.masks.constant(True)
+
+    def check(batch: _Batch) -> Mask:
+        mask = checks[0](batch)
+        for other in checks[1:]:
+            mask = batch.masks.and_(mask, other(batch))
+        return mask
+
+    return check
+
+
+def _any(checks: List[Check]) -> Check:
+    if not checks:
+        return lambda batch: batch.masks.constant(False)
+
+    def check(batch: _Batch) -> Mask:
+        mask = checks[0](batch)
+        for other in checks[1:]:
+            mask = batch.masks.or_(mask, other(batch))
+        return mask
+
+    return check
+
+
+def _absent_or(path: Path, check: Check) -> Check:
+    return lambda batch: batch.masks.or_(
+        batch.masks.not_(batch.present(path)), check(batch)
+    )
+
+
+class _Compiler:
+    """Derives the rules of a schema, for a layout of columns"""
+
+    def __init__(self, validator: "jsonschema.protocols.Validator", layout: _Layout):
+        self.validator = validator
+        self.layout = layout
+        self.rules: List[Tuple[Rule, Check]] = []
+        # Number of checks made row by row so far
+        self._per_row = 0
+
+    def assertions(self, schema: Any, path: Path, location: str) -> None:
+        """Add the rules of the subschema that applies to the property at path"""
+        if schema is True:
+            return
+        if schema is False:
+            rule = Rule(location, SEPARATOR.join(path), "false", None, True)
+            self._rule(rule, path, self.predicate(False, path))
+            return
+        kind = self.layout.kind(path)
+        if kind == "absent":
+            # No row has the property
+            return
+        comment = schema.get("$comment")
+        for keyword, value in schema.items():
+            keyword_location = f"{location}/{keyword}"
+            if keyword in ANNOTATIONS or keyword in ("then", "else"):
+                continue
+            if keyword == "properties" and kind in ("object", "mixed"):
+                for name, subschema in value.items():
+                    self.assertions(
+                        subschema,
+                        path + (name,),
+                        f"{keyword_location}/{_escape(name)}",
+                    )
+                if kind == "mixed":
+                    # Object values of the property's own column
+                    check = self._row_by_row({keyword: value}, path, leaf=True)
+                    rule = Rule(
+                        keyword_location, SEPARATOR.join(path), keyword, comment, False
+                    )
+                    self._rule(rule, path, check)
+            elif keyword == "allOf":
+                for i, subschema in enumerate(value):
+                    self.assertions(subschema, path, f"{keyword_location}/{i}")
+            else:
+                per_row = self._per_row
+                check = self._keyword_predicate(keyword, value, schema, path)
+                rule = Rule(
+                    keyword_location,
+                    SEPARATOR.join(path),
+                    keyword,
+                    comment,
+                    vectorized=self._per_row == per_row,
+                )
+                self._rule(rule, path, check)
+
+    def _rule(self, rule: Rule, path: Path, check: Check) -> None:
+        def fails(batch: _Batch) -> Mask:
+            return batch.masks.and_(batch.within(path), batch.masks.not_(check(batch)))
+
+        self.rules.append((rule, fails))
+
+    def predicate(self, schema: Any, path: Path) -> Check:
+        """Rows where the property's value is valid against the subschema (or absent)"""
+        if schema is True:
+            return lambda batch: batch.masks.constant(True)
+        if schema is False:
+            return lambda batch: batch.masks.not_(batch.present(path))
+        checks = [
+            self._keyword_predicate(keyword, value, schema, path)
+            for keyword, value in schema.items()
+            if keyword not in ANNOTATIONS and keyword not in ("then", "else")
+        ]
+        return _all(checks)
+
+    def _keyword_predicate(
+        self, keyword: str, value: Any, schema: dict, path: Path
+    ) -> Check:
+        subschema = {keyword: value}
+        if keyword == "if":
+            subschema.update(
+                (name, schema[name]) for name in ("then", "else") if name in schema
+            )
+        kind = self.layout.kind(path)
+        if kind == "mixed" and keyword not in COMBINATORS:
+            # Rows with a value in the property's own column are checked one by one, the
+            # others (with the property's properties in columns) together
+            objects = self._vectorized(keyword, value, schema, path, "object")
+            if objects is None:
+                return self._row_by_row(subschema, path)
+            values = self._row_by_row(subschema, path, leaf=True)
+
+            def either(batch: _Batch) -> Mask:
+                masks = batch.masks
+                leaf = batch.leaf_present(path)
+                return masks.or_(
+                    masks.and_(leaf, values(batch)),
+                    masks.and_(masks.not_(leaf), objects(batch)),
+                )
+
+            return either
+        check = self._vectorized(keyword, value, schema, path, kind)
+        if check is None:
+            return self._row_by_row(subschema, path)
+        return check
+
+    def _vectorized(
+        self, keyword: str, value: Any, schema: dict, path: Path, kind: str
+    ) -> Optional[Check]:
+        if kind == "absent":
+            return lambda batch: batch.masks.constant(True)
+        if keyword == "not":
+            check = self.predicate(value, path)
+            return lambda batch: batch.masks.not_(check(batch))
+        if keyword in ("allOf", "anyOf", "oneOf"):
+            checks = [self.predicate(subschema, path) for subschema in value]
+            if keyword == "allOf":
+                return _all(checks)
+            if keyword == "anyOf":
+                return _any(checks)
+            return lambda batch: batch.masks.exactly_one(
+                [check(batch) for check in checks]
+            )
+        if keyword == "if":
+            condition = self.predicate(value, path)
+            then = self.predicate(schema.get("then", True), path)
+            otherwise = self.predicate(schema.get("else", True), path)
+
+            def if_then_else(batch: _Batch) -> Mask:
+                masks = batch.masks
+                holds = condition(batch)
+                return masks.or_(
+                    masks.and_(holds, then(batch)),
+                    masks.and_(masks.not_(holds), otherwise(batch)),
+                )
+
+            return if_then_else
+        if kind == "mixed":
+            return None
+        if keyword == "type":
+            types = [value] if isinstance(value, str) else list(value)
+            if kind == "object":
+                return lambda batch: batch.masks.constant("object" in types)
+            return lambda batch: batch.masks.types(batch.column(path), types)
+        if keyword in ("enum", "const"):
+            values = value if keyword == "enum" else [value]
+            if kind == "object":
+                if any(isinstance(candidate, dict) for candidate in values):
+                    return None
+                return lambda batch: batch.masks.constant(False)
+            return lambda batch: batch.masks.isin(batch.column(path), values)
+        if kind != "object":
+            # Object keywords, on values that may or may not be objects
+            return None
+        if keyword == "properties":
+            return _all(
+                [
+                    _absent_or(
+                        path + (name,), self.predicate(subschema, path + (name,))
+                    )
+                    for name, subschema in value.items()
+                ]
+            )
+        if keyword == "required":
+            return _all(
+                [
+                    (lambda batch, child=path + (name,): batch.present(child))
+                    for name in value
+                ]
+            )
+        if keyword == "additionalProperties" and "patternProperties" not in schema:
+            known = schema.get("properties", {})
+            return _all(
+                [
+                    _absent_or(path + (name,), self.predicate(value, path + (name,)))
+                    for name in self.layout.children.get(path, [])
+                    if name not in known
+                ]
+            )
+        return None
+
+    def _row_by_row(self, subschema: dict, path: Path, leaf: bool = False) -> Check:
+        """Validate the property's values with jsonschema, or only those of its own column"""
+        self._per_row += 1
+        is_valid = self.validator.evolve(schema=subschema).is_valid
+
+        def check(batch: _Batch) -> Mask:
+            if leaf:
+                values = batch.masks.values(batch.column(path))
+            else:
+                values = batch.values(path)
+            return batch.masks.from_iter(
+                value is MISSING or is_valid(value) for value in values
+            )
+
+        return check
+
+
+def _masks(
+    columns: Mapping[str, Sequence[Any]], validator: "jsonschema.protocols.Validator"
+) -> _ListMasks:
+    """Masks over the rows of the columns
+    @raises ValueError if the columns don't all have the same length
+    """
+    sizes = {len(column) for column in columns.values()}
+    if len(sizes) > 1:
+        raise ValueError(f"Columns have different lengths: {sorted(sizes)}")
+    numpy = any(hasattr(column, "dtype") for column in columns.values())
+    return (_NumpyMasks if numpy else _ListMasks)(
+        sizes.pop() if sizes else 0, validator
+    )
+
+
+class ColumnarValidator:
+    """Validates batches of columns against a schema version"""
+
+    def __init__(self, schema_name: str, version: str):
+        self.schema_name = schema_name
+        self.version = version
+        self.schema = schemas.load_schema(schema_name, version)
+        cls = jsonschema.validators.validator_for(
+            self.schema, default=jsonschema.Draft202012Validator
+        )
+        cls.check_schema(self.schema)
+        self.validator = cls(self.schema)
+        self._plans: Dict[frozenset, Tuple[_Layout, List[Tuple[Rule, Check]]]] = {}
+
+    def rules(self, names: Iterable[str]) -> List[Rule]:
+        """The rules checked for batches with these columns"""
+        return [rule for rule, _ in self._plan(names)[1]]
+
+    def _plan(self, names: Iterable[str]) -> Tuple[_Layout, List[Tuple[Rule, Check]]]:
+        key = frozenset(names)
+        if key not in self._plans:
+            layout = _Layout(key)
+            compiler = _Compiler(self.validator, layout)
+            compiler.assertions(self.schema, (), "#")
+            self._plans[key] = (layout, compiler.rules)
+        return self._plans[key]
+
+    def validate(self, columns: Mapping[str, Sequence[Any]]) -> ColumnarResult:
+        """@raises ValueError if the columns don't all have the same length"""
+        masks = _masks(columns, self.validator)
+        layout, rules = self._plan(columns)
+        batch = _Batch(layout, columns, masks)
+        failures = {}
+        invalid = masks.constant(False)
+        for rule, fails in rules:
+            mask = fails(batch)
+            if any(mask):
+                failures[rule.code] = mask
+                invalid = masks.or_(invalid, mask)
+        return ColumnarResult(
+            masks.not_(invalid), failures, {rule.code: rule for rule, _ in rules}
+        )
+
+
+@functools.cache
+def _columnar_validator(schema_name: str, version: str) -> ColumnarValidator:
+    return ColumnarValidator(schema_name, version)
+
+
+def validate_columns(
+    columns: Mapping[str, Sequence[Any]], schema_name: str, version: str
+) -> ColumnarResult:
+    """Validate a batch of columns against a schema version"""
+    return _columnar_validator(schema_name, version).validate(columns)
+
+
+def valid_rows(schema: Any, columns: Mapping[str, Sequence[Any]]) -> Mask:
+    """Rows of the columns (one document per row) that are valid against a schema
+    @raises ValueError if the columns don't all have the same length
+    """
+    validator = jsonschema.validators.validator_for(
+        schema, default=jsonschema.Draft202012Validator
+    )(schema)
+    masks = _masks(columns, validator)
+    layout = _Layout(columns)
+    check = _Compiler(validator, layout).predicate(schema, ())
+    return check(_Batch(layout, columns, masks))
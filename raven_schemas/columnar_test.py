@@ -0,0 +1,123 @@
+import json
+
+import pytest
+
+from raven_schemas import columnar as module
+from raven_schemas import generator, schemas, validate
+from raven_schemas.constants import PACKAGE_DIR
+
+VERSIONS = schemas.get_known_schemas_and_versions()["modeling_input"]
+PRIMARY_HEATING = "survey.systems.primary_heating"
+
+
+@pytest.fixture
+def valid_2_0_0_modeling_json():
+    with open(
+        PACKAGE_DIR / "schemas/modeling_input_2_0_0_sample_valid.json"
+    ) as modeling_input:
+        return json.load(modeling_input)
+
+
+@pytest.mark.parametrize("version", VERSIONS)
+def test_validate__same_as_jsonschema(version):
+    documents = generator.DocumentGenerator("modeling_input", version, seed=0)
+    batch = [documents.document() for _ in range(50)]
+    batch += [documents.invalid_document()[1] for _ in range(150)]
+    result = module.validate_columns(
+        module.columns_from_documents(batch), "modeling_input", version
+    )
+    validator = validate.registry.get("modeling_input", version)
+    assert result.valid == [validator.is_valid(document) for document in batch]
+    assert all(
+        bool(result.errors(row)) != valid for row, valid in enumerate(result.valid)
+    )
+
+
+def test_validate__rules(valid_2_0_0_modeling_json):
+    heating = valid_2_0_0_modeling_json["survey"]["systems"]["primary_heating"]
+    documents = [json.loads(json.dumps(valid_2_0_0_modeling_json)) for _ in range(4)]
+    documents[1]["roofMaterial"] = "Straw"
+    documents[2]["survey"]["systems"]["primary_heating"] = dict(
+        heating, fuel_type="None"
+    )
+    del documents[3]["bedroomCount"]
+    validator = module.ColumnarValidator("modeling_input", "2.0.0")
+    columns = module.columns_from_documents(documents)
+    result = validator.validate(columns)
+
+    assert result.valid == [True, False, False, False]
+    assert result.errors(0) == []
+    assert result.errors(1) == ["#/properties/roofMaterial/enum"]
+    assert result.errors(3) == ["#/required"]
+    [code] = result.errors(2)
+    rule = result.rules[code]
+    assert rule.path == PRIMARY_HEATING
+    assert rule.keyword == "if"
+    assert rule.comment.startswith("Fuel_type set to None")
+    # Every rule is checked with column operations
+    assert all(rule.vectorized for rule in validator.rules(columns))
+
+
+def test_validate__columns():
+    columns = {
+        "input_schema_version": ["2.0.0"] * 3,
+        "bedroomCount": [3, 3.0, True],
+        "garageAreaSqFt": [None, 1.5, module.MISSING],
+        f"{PRIMARY_HEATING}.functional": [True, 1, module.MISSING],
+    }
+    result = module.validate_columns(columns, "modeling_input", "2.0.0")
+    prefix = "#/properties/survey/properties/systems/properties/primary_heating"
+    assert result.failures["#/properties/bedroomCount/type"] == [False, False, True]
+    assert result.failures["#/properties/garageAreaSqFt/oneOf"] == [False, True, False]
+    assert result.failures[f"{prefix}/properties/functional/enum"] == [
+        False,
+        True,
+        False,
+    ]
+    assert result.failures["#/required"] == [True, True, True]
+
+
+def test_validate__mixed_columns(valid_2_0_0_modeling_json):
+    """A property that's an object in some rows and not in others"""
+    documents = [json.loads(json.dumps(valid_2_0_0_modeling_json)) for _ in range(3)]
+    documents[1]["survey"]["systems"] = "none"
+    documents[2]["survey"]["systems"] = {}
+    columns = module.columns_from_documents(documents)
+    assert "survey.systems" in columns
+    result = module.validate_columns(columns, "modeling_input", "2.0.0")
+    systems = "#/properties/survey/properties/systems"
+    assert result.errors(0) == []
+    assert result.errors(1) == [f"{systems}/type"]
+    assert result.errors(2) == [f"{systems}/required"]
+
+
+def test_contains__containers():
+    others = [[1, True], {"a": [0]}]
+    assert module._contains([1, True], set(), set(), others)
+    assert module._contains({"a": [0.0]}, set(), set(), others)
+    # Booleans aren't numbers, even inside containers
+    assert not module._contains([True, True], set(), set(), others)
+    assert not module._contains({"a": [False]}, set(), set(), others)
+
+
+def test_validate__errors():
+    with pytest.raises(ValueError, match="different lengths"):
+        module.validate_columns({"a": [1], "b": []}, "modeling_input", "2.0.0")
+    result = module.validate_columns({}, "modeling_input", "2.0.0")
+    assert result.valid == []
+
+
+def test_validate__numpy(valid_2_0_0_modeling_json):
+    numpy = pytest.importorskip("numpy")
+    columns = module.columns_from_documents([valid_2_0_0_modeling_json] * 3)
+    columns = {name: numpy.array(values) for name, values in columns.items()}
+    columns["bedroomCount"] = numpy.array([3, 4, 5])
+    columns["latitude"] = numpy.array([1.5, 2.0, 3.0])
+    columns["buildYear"] = numpy.array([1990.0, 1990.5, 2000.0])
+    columns["roofMaterial"] = numpy.array(["Metal", "Straw", "Slate"])
+    result = module.validate_columns(columns, "modeling_input", "2.0.0")
+    assert result.valid.tolist() == [True, False, True]
+    assert result.errors(1) == [
+        "#/properties/buildYear/type",
+        "#/properties/roofMaterial/enum",
+    ]
@@ -3,3 +3,9 @@ from pathlib import Path
 
 PACKAGE_DIR = Path(os.path.dirname(__file__))
 SCHEMA_DIR = PACKAGE_DIR / "schemas"
+MANIFEST_PATH = PACKAGE_DIR / "manifest.py"
+
+# Defaults of the bulk validation commands, kept here so that the CLI can be built
+# without importing the validation modules
+DEFAULT_CHUNKSIZE = 64
+OUTPUT_FORMATS = ["ndjson", "csv"]
@@ -0,0 +1,269 @@
+"""Decision tables of the allOf rules of an object, eg. the survey's if/then combination rules.
+
+Most rules only read a few properties with a finite set of values: fuel_type "None" forcing the
+rest of primary_heating to null, the heating systems that go with a cooling type, ... For such
+rules, every combination of the values they read is checked once, when the table is compiled,
+and checking a document becomes a single lookup of the tuple of its values. Each rule keeps
+its $comment, which is appended to the messages of its errors.
+
+A rule goes in its object's table if it only reads properties through `properties`, constrains
+them with const, enum or type (combined with not, allOf, anyOf, oneOf and if/then/else), and
+the object's schema limits each of them to a few string, boolean or null values. The other
+rules, and documents with a value outside the table (which are invalid anyway), are validated
+as usual. optimize.optimized_validator compiles the tables of a schema when it builds its
+validator.
+"""
+import functools
+import itertools
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+import jsonschema
+
+from raven_schemas import columnar, schemas
+
+# A property that a document doesn't have
+ABSENT = columnar.MISSING
+# Above this number of combinations, the object's rules are validated as usual
+MAX_TABLE_SIZE = 1 << 16
+# The standard allOf keyword, for objects without a table
+_standard_all_of = jsonschema.Draft202012Validator.VALIDATORS["allOf"]
+# Keywords that combine constraints of the same value
+COMBINATORS = {"not", "allOf", "anyOf", "oneOf", "if", "then", "else"}
+# Table keys only hold these, so that tuples compare as JSON values do (True isn't 1)
+_KEY_CLASSES = {str, bool, type(None), type(ABSENT)}
+
+# Path of a property, from the object that has the rules
+Path = Tuple[str, ...]
+
+
+class TableRule(NamedTuple):
+    # Index of the rule in the allOf
+    index: int
+    comment: Optional[str]
+
+
+class DecisionTable:
+    """Failing rules of an allOf, by the values of the properties its rules read"""
+
+    def __init__(
+        self,
+        fields: Tuple[Path, ...],
+        rules: Dict[int, TableRule],
+        entries: Dict[Tuple[Any, ...], Tuple[int, ...]],
+    ):
+        self.fields = fields
+        self.rules = rules
+        # key -> indexes of the rules that fail
+        self.entries = entries
+        self._names = (
+            [path[0] for path in fields]
+            if all(len(path) == 1 for path in fields)
+            else None
+        )
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def key(self, instance: dict) -> Optional[Tuple[Any, ...]]:
+        """The values of the fields, or None if they can't be in the table"""
+        if self._names is not None:
+            key = tuple([instance.get(name, ABSENT) for name in self._names])
+        else:
+            values = []
+            for path in self.fields:
+                value: Any = instance
+                for name in path:
+                    if value is ABSENT:
+                        break
+                    if value.__class__ is not dict:
+                        return None
+                    value = value.get(name, ABSENT)
+                values.append(value)
+            key = tuple(values)
+        for value in key:
+            if value.__class__ not in _KEY_CLASSES:
+                return None
+        return key
+
+    def failing(self, instance: dict) -> Optional[Tuple[int, ...]]:
+        """Indexes of the rules the object fails, or None if it isn't in the table"""
+        key = self.key(instance)
+        return None if key is None else self.entries.get(key)
+
+
+def _rule_fields(
+    schema: Any, path: Path, constrained: Set[Path], objects: Set[Path]
+) -> bool:
+    """Collect the properties a rule constrains, and the ones it reaches them through.
+    @returns False if the rule could read anything else
+    """
+    if isinstance(schema, bool):
+        return True
+    if not isinstance(schema, dict):
+        return False
+    for keyword, value in schema.items():
+        if keyword == "$comment":
+            continue
+        if keyword == "properties":
+            if not isinstance(value, dict):
+                return False
+            if value:
+                objects.add(path)
+            for name, subschema in value.items():
+                if "." in name or not _rule_fields(
+                    subschema, path + (name,), constrained, objects
+                ):
+                    return False
+        elif keyword == "required":
+            # Only the object's own properties: a nested object may exist without them
+            if path or not isinstance(value, list):
+                return False
+            constrained.update((name,) for name in value)
+        elif keyword in ("const", "enum", "type"):
+            if not path or path in objects:
+                return False
+            constrained.add(path)
+        elif keyword in COMBINATORS:
+            subschemas = value if isinstance(value, list) else [value]
+            for subschema in subschemas:
+                if not _rule_fields(subschema, path, constrained, objects):
+                    return False
+        else:
+            return False
+    return not constrained & objects
+
+
+def _values(schema: Any) -> Optional[List[Any]]:
+    """Every value a property's schema allows, if they're a few strings, booleans or nulls"""
+    if not isinstance(schema, dict):
+        return None
+    if "enum" in schema:
+        values = list(schema["enum"])
+    elif "const" in schema:
+        values = [schema["const"]]
+    elif "type" in schema:
+        types = [schema["type"]] if isinstance(schema["type"], str) else schema["type"]
+        values = []
+        for name in types:
+            if name == "boolean":
+                values += [True, False]
+            elif name == "null":
+                values.append(None)
+            else:
+                return None
+    elif "oneOf" in schema or "anyOf" in schema:
+        values = []
+        for subschema in schema.get("oneOf") or schema["anyOf"]:
+            branch = _values(subschema)
+            if branch is None:
+                return None
+            values += branch
+    else:
+        return None
+    if not all(value.__class__ in _KEY_CLASSES for value in values):
+        return None
+    unique: Dict[Tuple[type, Any], Any] = {}
+    for value in values:
+        unique.setdefault((value.__class__, value), value)
+    return list(unique.values())
+
+
+def _domain(schema: dict, path: Path) -> Optional[List[Any]]:
+    """The values a property can have in a valid object, ABSENT included if it's optional"""
+    required = True
+    for name in path:
+        if not isinstance(schema, dict):
+            return None
+        required = required and name in schema.get("required", [])
+        schema = schema.get("properties", {}).get(name)
+    values = _values(schema)
+    if values is None:
+        return None
+    return values + ([] if required else [ABSENT])
+
+
+def compile_table(schema: dict) -> Optional[DecisionTable]:
+    """The decision table of the rules in an object schema's allOf, if any can go in one"""
+    all_of = schema.get("allOf")
+    if not isinstance(all_of, list):
+        return None
+    domains: Dict[Path, List[Any]] = {}
+    rules: Dict[int, TableRule] = {}
+    for index, rule in enumerate(all_of):
+        constrained: Set[Path] = set()
+        if not _rule_fields(rule, (), constrained, set()) or not constrained:
+            continue
+        rule_domains = {path: _domain(schema, path) for path in constrained}
+        if any(domain is None for domain in rule_domains.values()):
+            continue
+        domains.update(rule_domains)  # type: ignore[arg-type]
+        comment = rule.get("$comment") if isinstance(rule, dict) else None
+        rules[index] = TableRule(index, comment)
+    if not rules:
+        return None
+    fields = tuple(sorted(domains))
+    size = 1
+    for path in fields:
+        size *= len(domains[path])
+    if size > MAX_TABLE_SIZE:
+        return None
+
+    keys = list(itertools.product(*(domains[path] for path in fields)))
+    columns = {".".join(path): list(column) for path, column in zip(fields, zip(*keys))}
+    valid = {index: columnar.valid_rows(all_of[index], columns) for index in rules}
+    entries = {}
+    for row, key in enumerate(keys):
+        entries[key] = tuple(index for index in rules if not valid[index][row])
+    return DecisionTable(fields, rules, entries)
+
+
+def iter_tables(
+    schema: Any, location: str = "#"
+) -> Iterator[Tuple[str, DecisionTable]]:
+    """(schema location of the allOf, table) of every object schema with rules in a table"""
+    if not isinstance(schema, dict):
+        return
+    if "allOf" in schema:
+        table = compile_table(schema)
+        if table is not None:
+            yield f"{location}/allOf", table
+    for keyword, value in schema.items():
+        if keyword in ("properties", "$defs") and isinstance(value, dict):
+            for name, subschema in value.items():
+                yield from iter_tables(subschema, f"{location}/{keyword}/{name}")
+        elif isinstance(value, dict):
+            yield from iter_tables(value, f"{location}/{keyword}")
+        elif isinstance(value, list) and keyword != "enum":
+            for i, subschema in enumerate(value):
+                yield from iter_tables(subschema, f"{location}/{keyword}/{i}")
+
+
+@functools.cache
+def compile_tables(schema_name: str, version: str) -> Dict[str, DecisionTable]:
+    """The decision tables of a schema version, by schema location of their allOf"""
+    return dict(iter_tables(schemas.load_schema(schema_name, version)))
+
+
+# id of an allOf list -> (the list, its table)
+Tables = Dict[int, Tuple[list, DecisionTable]]
+
+
+def all_of(tables: Tables, validator, all_of, instance, schema):
+    """The allOf keyword, checking the rules in the decision table of the allOf, if it has one
+    in tables, with a lookup
+    """
+    entry = tables.get(id(all_of)) if instance.__class__ is dict else None
+    # The entry keeps the list, so its id can't have been reused by another list
+    table = entry[1] if entry is not None and entry[0] is all_of else None
+    if table is None:
+        yield from _standard_all_of(validator, all_of, instance, schema)
+        return
+    failing = table.failing(instance)
+    for index, subschema in enumerate(all_of):
+        rule = table.rules.get(index)
+        if rule is not None and failing is not None and index not in failing:
+            continue
+        for error in validator.descend(instance, subschema, schema_path=index):
+            if rule is not None and rule.comment:
+                error.message = f"{error.message} ({rule.comment})"
+            yield error
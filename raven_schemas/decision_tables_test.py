@@ -0,0 +1,147 @@
+import json
+import random
+
+import jsonschema
+import pytest
+
+from raven_schemas import decision_tables as module
+from raven_schemas import generator, optimize, schemas
+from raven_schemas.constants import PACKAGE_DIR
+
+VERSIONS = schemas.get_known_schemas_and_versions()["modeling_input"]
+PRIMARY_HEATING = "#/properties/survey/properties/systems/properties/primary_heating"
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "kind": {"enum": ["a", "b"]},
+        "flag": {"type": ["boolean", "null"]},
+        "size": {"type": "number"},
+    },
+    "required": ["kind"],
+    "allOf": [
+        {
+            "$comment": "b has a flag",
+            "if": {"properties": {"kind": {"const": "b"}}},
+            "then": {"required": ["flag"], "properties": {"flag": {"const": True}}},
+        },
+        # Reads size, which can have any number
+        {
+            "if": {"properties": {"kind": {"const": "a"}}},
+            "then": {"properties": {"size": {"maximum": 3}}},
+        },
+    ],
+}
+
+
+@pytest.fixture
+def valid_2_0_0_modeling_json():
+    with open(
+        PACKAGE_DIR / "schemas/modeling_input_2_0_0_sample_valid.json"
+    ) as modeling_input:
+        return json.load(modeling_input)
+
+
+def test_compile_table():
+    table = module.compile_table(SCHEMA)
+    assert table.fields == (("flag",), ("kind",))
+    assert list(table.rules.values()) == [module.TableRule(0, "b has a flag")]
+    # flag is optional, kind isn't
+    assert len(table) == 4 * 2
+    assert table.failing({"kind": "b", "flag": True}) == ()
+    assert table.failing({"kind": "b", "flag": None}) == (0,)
+    assert table.failing({"kind": "b"}) == (0,)
+    assert table.failing({"kind": "a"}) == ()
+    # Outside the table
+    assert table.failing({"kind": "c"}) is None
+    assert table.failing({"kind": "b", "flag": 1}) is None
+    assert table.failing({"kind": ["b"]}) is None
+    assert module.compile_table({"allOf": [SCHEMA["allOf"][1]]}) is None
+
+
+@pytest.mark.parametrize(
+    "instance",
+    [
+        {"kind": "b", "flag": True},
+        {"kind": "b", "flag": False, "size": 10},
+        {"kind": "b"},
+        {"kind": "a", "size": 10},
+        {"kind": "c", "flag": 1},
+        {"kind": "b", "flag": 1},
+        "b",
+    ],
+)
+def test_all_of__same_errors(instance):
+    expected = jsonschema.Draft202012Validator(SCHEMA).iter_errors(instance)
+    errors = optimize.optimized_validator(SCHEMA).iter_errors(instance)
+    assert sorted(
+        (list(e.schema_path), e.message.replace(" (b has a flag)", "")) for e in errors
+    ) == sorted((list(e.schema_path), e.message) for e in expected)
+
+
+def test_compile_tables__primary_heating():
+    tables = module.compile_tables("modeling_input", "2.0.0")
+    table = tables[f"{PRIMARY_HEATING}/allOf"]
+    assert ("fuel_type",) in table.fields
+    assert table.rules[0].comment.startswith("Fuel_type set to None")
+    heating = {
+        "fuel_type": "None",
+        "ducted_heating": None,
+        "functional": None,
+        "over_age": None,
+        "furnace_vent": None,
+        "system": None,
+        "insulated_ducts": None,
+    }
+    assert 0 not in table.failing(heating)
+    assert 0 in table.failing(dict(heating, functional=True))
+
+
+def test_all_of__comment_in_message(valid_2_0_0_modeling_json):
+    systems = valid_2_0_0_modeling_json["survey"]["systems"]
+    systems["primary_heating"] = dict(
+        systems["primary_heating"], fuel_type="None", functional=True
+    )
+    validator = optimize.optimized_validator(
+        optimize.optimize_schema(schemas.load_schema("modeling_input", "2.0.0"))
+    )
+    messages = [
+        e.message
+        for e in validator.iter_errors(valid_2_0_0_modeling_json)
+        if list(e.absolute_path)[-1:] == ["functional"]
+    ]
+    assert messages
+    assert all(message.endswith("aren't null)") for message in messages)
+
+
+@pytest.mark.parametrize("version", VERSIONS)
+def test_all_of__same_as_jsonschema(version):
+    """Documents with every combination of values the tables hold, and some they don't"""
+    schema = optimize.optimize_schema(schemas.load_schema("modeling_input", version))
+    expected = jsonschema.Draft202012Validator(schema)
+    validator = optimize.optimized_validator(schema)
+    documents = generator.DocumentGenerator("modeling_input", version, seed=0)
+    tables = module.compile_tables("modeling_input", version)
+    rng = random.Random(0)
+    for _ in range(100):
+        document = documents.document()
+        for location, table in tables.items():
+            instance = document
+            for name in location.split("/")[2:-1:2]:
+                instance = instance.get(name, {}) if isinstance(instance, dict) else {}
+            choices = [sorted(set(column), key=repr) for column in zip(*table.entries)]
+            for path, values in zip(table.fields, choices):
+                parent = instance
+                for name in path[:-1]:
+                    parent = parent.setdefault(name, {})
+                value = rng.choice(values + ["unknown"])
+                if value is module.ABSENT:
+                    parent.pop(path[-1], None)
+                else:
+                    parent[path[-1]] = value
+        assert sorted(
+            (list(e.absolute_path), e.validator)
+            for e in validator.iter_errors(document)
+        ) == sorted(
+            (list(e.absolute_path), e.validator) for e in expected.iter_errors(document)
+        )
@@ -0,0 +1,188 @@
+import functools
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+from raven_schemas import schemas
+
+# Document fields that each schema version pins to a specific value (or set of values)
+DISCRIMINATOR_PATHS: Tuple[Tuple[str, ...], ...] = (
+    ("input_schema_version",),
+    ("survey", "survey_schema_version"),
+)
+
+
+class _Missing:
+    def __repr__(self):
+        return "<missing>"
+
+
+MISSING = _Missing()
+
+
+def _describe(accepted: Optional[FrozenSet], key: str) -> str:
+    """Human readable description of what a version accepts, for rejection messages"""
+    if accepted is None:
+        return "any value"
+    values = sorted(v for v in accepted if v is not MISSING)
+    if not values:
+        return f"no '{key}' property"
+    if len(values) == 1:
+        return repr(values[0])
+    return f"one of {values!r}"
+
+
+def _keyword(schema: dict, path: Sequence[str]) -> str:
+    """The keyword that pins the value at the given path: const, enum or additionalProperties"""
+    node = schema
+    for key in path[:-1]:
+        node = node.get("properties", {}).get(key, {})
+    prop = node.get("properties", {}).get(path[-1])
+    if prop is None:
+        return "additionalProperties"
+    return "const" if "const" in prop else "enum"
+
+
+def _accepted_values(schema: dict, path: Sequence[str]) -> Optional[FrozenSet]:
+    """Values (strings, or MISSING) that a schema accepts at the given path.
+    None means the schema doesn't narrow the value down, so it can't be used to skip versions.
+    """
+    node = schema
+    for key in path[:-1]:
+        node = node.get("properties", {}).get(key)
+        if not isinstance(node, dict):
+            return None
+    key = path[-1]
+    prop = node.get("properties", {}).get(key)
+    accepted: set = set()
+    if prop is None:
+        if node.get("additionalProperties", True) is not False:
+            return None
+    elif "const" in prop:
+        if not isinstance(prop["const"], str):
+            return None
+        accepted.add(prop["const"])
+    elif "enum" in prop:
+        if not all(isinstance(v, str) for v in prop["enum"]):
+            return None
+        accepted.update(prop["enum"])
+    else:
+        return None
+    if key not in node.get("required", []):
+        accepted.add(MISSING)
+    return frozenset(accepted)
+
+
+class DiscriminatorIndex:
+    """Maps discriminator values to the versions of a schema that can accept them,
+    so that versions which can't possibly match a document are skipped without a full validation.
+    """
+
+    def __init__(self, versioned_schemas: Dict[str, dict]):
+        self.versions = frozenset(versioned_schemas)
+        # path -> value -> versions accepting that value
+        self._by_value: Dict[Tuple[str, ...], Dict[object, FrozenSet[str]]] = {}
+        # path -> versions that accept any value
+        self._any_value: Dict[Tuple[str, ...], FrozenSet[str]] = {}
+        # (path, version) -> description of accepted values
+        self._expected: Dict[Tuple[Tuple[str, ...], str], str] = {}
+        # (path, version) -> the keyword that rejects other values
+        self._keywords: Dict[Tuple[Tuple[str, ...], str], str] = {}
+
+        for path in DISCRIMINATOR_PATHS:
+            by_value: Dict[object, set] = {}
+            any_value = set()
+            for version, schema in versioned_schemas.items():
+                accepted = _accepted_values(schema, path)
+                self._expected[(path, version)] = _describe(accepted, path[-1])
+                if accepted is None:
+                    any_value.add(version)
+                    continue
+                self._keywords[(path, version)] = _keyword(schema, path)
+                for value in accepted:
+                    by_value.setdefault(value, set()).add(version)
+            self._any_value[path] = frozenset(any_value)
+            self._by_value[path] = {
+                value: frozenset(versions | any_value)
+                for value, versions in by_value.items()
+            }
+
+    def accepting_versions(self, data: dict, path: Tuple[str, ...]) -> FrozenSet[str]:
+        """Versions that could accept the document's value at the given discriminator path"""
+        node = data
+        for key in path[:-1]:
+            node = node.get(key) if isinstance(node, dict) else None
+        if not isinstance(node, dict):
+            return self.versions
+        value = node.get(path[-1], MISSING)
+        if value is not MISSING and type(value) is not str:
+            # Non-string values are left to the full validation to report
+            return self.versions
+        return self._by_value[path].get(value, self._any_value[path])
+
+    def partition(
+        self, data: dict, versions: Iterable[str]
+    ) -> Tuple[List[str], Dict[str, str]]:
+        """Split versions into those worth a full validation and those that can't match.
+        @returns (candidate versions, {rejected version: error message})
+        """
+        candidates, rejected = self.rejected_paths(data, versions)
+        return candidates, {
+            version: self.message(data, path, version)
+            for version, path in rejected.items()
+        }
+
+    def rejected_paths(
+        self, data: dict, versions: Iterable[str]
+    ) -> Tuple[List[str], Dict[str, Tuple[str, ...]]]:
+        """Like partition, without formatting any messages.
+        @returns (candidate versions, {rejected version: discriminator path that rejected it})
+        """
+        versions = list(versions)
+        if not isinstance(data, dict):
+            return versions, {}
+        accepting = [
+            (path, self.accepting_versions(data, path)) for path in DISCRIMINATOR_PATHS
+        ]
+        candidates = []
+        rejected: Dict[str, Tuple[str, ...]] = {}
+        for version in versions:
+            if version not in self.versions:
+                # Unknown versions are reported by the full validation
+                candidates.append(version)
+                continue
+            for path, accepted in accepting:
+                if version not in accepted:
+                    rejected[version] = path
+                    break
+            else:
+                candidates.append(version)
+        return candidates, rejected
+
+    def keyword(self, data: dict, path: Tuple[str, ...], version: str) -> str:
+        """The JSON schema keyword that rejects the document's value at a discriminator path"""
+        node = data
+        for key in path[:-1]:
+            node = node[key]
+        if path[-1] not in node:
+            return "required"
+        return self._keywords[(path, version)]
+
+    def message(self, data: dict, path: Tuple[str, ...], version: str) -> str:
+        node = data
+        for key in path[:-1]:
+            node = node[key]
+        key = path[-1]
+        if key not in node:
+            return f"'{key}' is a required property"
+        return (
+            f"{node[key]!r} at '{'.'.join(path)}' is not accepted, "
+            f"expected {self._expected[(path, version)]}"
+        )
+
+
+@functools.cache
+def get_discriminator_index(schema_name: str) -> DiscriminatorIndex:
+    """Index built once from every known version of the given schema"""
+    versions = schemas.get_known_schemas_and_versions().get(schema_name, [])
+    return DiscriminatorIndex(
+        {version: schemas.load_schema(schema_name, version) for version in versions}
+    )
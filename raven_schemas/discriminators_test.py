@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+from raven_schemas import discriminators as module
+from raven_schemas import schemas
+from raven_schemas.constants import PACKAGE_DIR
+
+ALL_VERSIONS = schemas.get_known_schemas_and_versions()["modeling_input"]
+
+
+@pytest.fixture
+def valid_1_1_5_modeling_json():
+    with open(
+        PACKAGE_DIR / "schemas/modeling_input_1_1_5_sample_valid.json"
+    ) as modeling_input:
+        return json.load(modeling_input)
+
+
+def test_partition__only_matching_version_survives(valid_1_1_5_modeling_json):
+    index = module.get_discriminator_index("modeling_input")
+    candidates, rejected = index.partition(valid_1_1_5_modeling_json, ALL_VERSIONS)
+    assert candidates == ["1.1.5"]
+    assert set(rejected) == set(ALL_VERSIONS) - {"1.1.5"}
+
+
+def test_partition__wrong_survey_version(valid_1_1_5_modeling_json):
+    valid_1_1_5_modeling_json["survey"]["survey_schema_version"] = "1.0.5"
+    index = module.get_discriminator_index("modeling_input")
+    candidates, rejected = index.partition(valid_1_1_5_modeling_json, ["1.1.5"])
+    assert candidates == []
+    assert "survey.survey_schema_version" in rejected["1.1.5"]
+
+
+def test_partition__unconstrained_survey_version():
+    # Versions before 1.1.2 don't declare survey_schema_version, so any value gets through
+    index = module.get_discriminator_index("modeling_input")
+    data = {"input_schema_version": "1.0.0", "survey": {"survey_schema_version": "x"}}
+    candidates, _ = index.partition(data, ["1.0.0"])
+    assert candidates == ["1.0.0"]
+
+
+def test_partition__missing_version_only_matches_unversioned_schema():
+    index = module.get_discriminator_index("modeling_input")
+    candidates, rejected = index.partition({"survey": {}}, ALL_VERSIONS)
+    assert candidates == ["0.0.0"]
+    assert rejected["1.0.0"] == "'input_schema_version' is a required property"
+
+
+@pytest.mark.parametrize("data", [[], {"input_schema_version": 1}])
+def test_partition__leaves_unusual_documents_to_full_validation(data):
+    index = module.get_discriminator_index("modeling_input")
+    candidates, rejected = index.partition(data, ["1.0.0", "2.0.0"])
+    assert candidates == ["1.0.0", "2.0.0"]
+    assert rejected == {}
+
+
+def test_partition__unknown_versions_are_kept():
+    index = module.get_discriminator_index("modeling_input")
+    candidates, _ = index.partition({"input_schema_version": "1.0.0"}, ["9.9.9"])
+    assert candidates == ["9.9.9"]
+
+
+def test_rejected_paths(valid_1_1_5_modeling_json):
+    index = module.get_discriminator_index("modeling_input")
+    path = ("input_schema_version",)
+    candidates, rejected = index.rejected_paths(
+        valid_1_1_5_modeling_json, ["0.0.0", "1.1.5", "2.0.0"]
+    )
+    assert candidates == ["1.1.5"]
+    assert rejected == {"0.0.0": path, "2.0.0": path}
+    assert (
+        index.keyword(valid_1_1_5_modeling_json, path, "0.0.0")
+        == "additionalProperties"
+    )
+    assert index.keyword(valid_1_1_5_modeling_json, path, "2.0.0") == "const"
+    del valid_1_1_5_modeling_json["input_schema_version"]
+    _, rejected = index.rejected_paths(valid_1_1_5_modeling_json, ["2.0.0"])
+    assert index.keyword(valid_1_1_5_modeling_json, rejected["2.0.0"], "2.0.0") == (
+        "required"
+    )
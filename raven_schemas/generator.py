@@ -0,0 +1,350 @@
+"""Generate synthetic documents from a schema version, for load and fuzz testing.
+
+Generation is planned once per schema version:
+- enum, const, boolean and null values are drawn from their (finite) domain
+- objects with conditional rules (allOf, if/then, not, ...) whose properties all have finite
+  domains get the valid combinations of those properties enumerated up front, so drawing a
+  valid object is a single random choice
+- other objects with conditional rules (eg. the systems-level heating/cooling rules) are
+  rejection-sampled against their compiled subschema
+
+Invalid ("near-miss") documents are valid documents with exactly one rule broken:
+a missing required property, an unexpected property, a value outside its enum or type,
+or a combination of values that breaks one of the object's conditional rules.
+"""
+import itertools
+import json
+import random
+import string
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from raven_schemas import codegen, schemas
+
+MAX_COMBINATIONS = 100_000
+MAX_ATTEMPTS = 1_000
+CONDITIONAL_KEYWORDS = {"allOf", "anyOf", "oneOf", "not", "if"}
+VIOLATIONS = ["required", "additionalProperties", "enum", "type", "rule"]
+# Candidate replacement values when breaking a leaf's enum or type
+BAD_VALUES = ["__invalid__", 123456789, 0.5, True, None, [], {}]
+UNEXPECTED_PROPERTY = "__unexpected__"
+
+Path = Tuple[str, ...]
+
+
+class _Absent:
+    """Marks an optional property that is left out of a combination"""
+
+    def __repr__(self):
+        return "<absent>"
+
+
+ABSENT = _Absent()
+
+
+def _domain(schema: Any) -> Optional[List[Any]]:
+    """Every value a leaf schema accepts, or None if there are too many to list"""
+    if not isinstance(schema, dict):
+        return None
+    if "const" in schema:
+        return [schema["const"]]
+    types = schema.get("type")
+    if isinstance(types, str):
+        types = [types]
+    if "enum" in schema:
+        values = schema["enum"]
+    elif "oneOf" in schema or "anyOf" in schema:
+        values = []
+        for branch in schema.get("oneOf", []) + schema.get("anyOf", []):
+            branch_values = _domain(branch)
+            if branch_values is None:
+                return None
+            values.extend(v for v in branch_values if not _contains(values, v))
+    elif types and set(types) <= {"boolean", "null"}:
+        values = ([True, False] if "boolean" in types else []) + (
+            [None] if "null" in types else []
+        )
+    else:
+        return None
+    if types:
+        values = [v for v in values if _has_type(v, types)]
+    return list(values)
+
+
+def _contains(values: List[Any], value: Any) -> bool:
+    return any(type(v) is type(value) and v == value for v in values)
+
+
+def _has_type(value: Any, types: List[str]) -> bool:
+    checks = {
+        "string": lambda v: isinstance(v, str),
+        "integer": lambda v: isinstance(v, int) and not isinstance(v, bool),
+        "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+        "boolean": lambda v: isinstance(v, bool),
+        "null": lambda v: v is None,
+        "object": lambda v: isinstance(v, dict),
+        "array": lambda v: isinstance(v, list),
+    }
+    return any(checks[t](value) for t in types)
+
+
+class DocumentGenerator:
+    def __init__(self, schema_name: str, version: str, seed: Optional[int] = None):
+        self.schema_name = schema_name
+        self.version = version
+        self.random = random.Random(seed)
+        self.schema = schemas.load_schema(schema_name, version)
+        self.check = codegen.load_validators(schema_name, (version,))[version]
+        # Object paths -> enumerated rule-breaking combinations of their properties
+        self._invalid_combinations: Dict[Path, List[Dict[str, Any]]] = {}
+        # Object paths -> the properties whose combinations were enumerated
+        self._enumerated_keys: Dict[Path, set] = {}
+        # Object paths -> compiled checks of their subschema, for objects with conditional rules
+        self._object_checks: Dict[Path, Callable] = {}
+        self._property_generators: Dict[Path, Dict[str, Callable[[], Any]]] = {}
+        self._leaf_checks: Dict[Path, Callable] = {}
+        self._generate = self._plan(self.schema, ())
+
+    def document(self) -> dict:
+        """A new document that is valid for the schema version"""
+        return self._generate()
+
+    def invalid_document(self) -> Tuple[str, dict]:
+        """A new document that breaks exactly one rule of the schema version.
+        @returns (description of the broken rule, document)
+        """
+        for _ in range(MAX_ATTEMPTS):
+            document = self._generate()
+            sites = self._violation_sites(self.schema, document, ())
+            kinds = [kind for kind in VIOLATIONS if sites.get(kind)]
+            kind = self.random.choice(kinds)
+            schema, path = self.random.choice(sites[kind])
+            description = self._violate(kind, schema, document, path)
+            if description is not None and self.check(document) is not None:
+                return description, document
+        raise ValueError(
+            f"Couldn't break {self.schema_name} {self.version} with a single change"
+        )
+
+    # Planning
+
+    def _plan(self, schema: Any, path: Path) -> Callable[[], Any]:
+        domain = _domain(schema)
+        if domain is not None:
+            if not domain:
+                raise ValueError(f"No value satisfies the schema at {_format(path)}")
+            return lambda: self.random.choice(domain)
+        if not isinstance(schema, dict):
+            return lambda: None
+        branches = schema.get("oneOf") or schema.get("anyOf")
+        if branches and "type" not in schema:
+            # Branches are expected to be disjoint (eg. string or null)
+            plans = [self._plan(branch, path) for branch in branches]
+            return lambda: self.random.choice(plans)()
+        types = schema.get("type")
+        if isinstance(types, list):
+            types = types[0]
+        if types == "object" or "properties" in schema:
+            return self._plan_object(schema, path)
+        if types == "array":
+            item = self._plan(schema.get("items", {}), path + ("[]",))
+            return lambda: [item() for _ in range(self.random.randint(0, 3))]
+        if types == "integer":
+            low, high = schema.get("minimum", 0), schema.get("maximum", 5000)
+            return lambda: self.random.randint(low, high)
+        if types == "number":
+            low, high = schema.get("minimum", -180.0), schema.get("maximum", 180.0)
+            return lambda: round(self.random.uniform(low, high), 6)
+        if types == "string":
+            return lambda: "".join(
+                self.random.choices(
+                    string.ascii_lowercase, k=self.random.randint(4, 12)
+                )
+            )
+        raise ValueError(f"Can't generate a value for the schema at {_format(path)}")
+
+    def _plan_object(self, schema: dict, path: Path) -> Callable[[], dict]:
+        properties = schema.get("properties", {})
+        required = set(schema.get("required", []))
+        generators = {
+            key: self._plan(subschema, path + (key,))
+            for key, subschema in properties.items()
+        }
+        if not CONDITIONAL_KEYWORDS & set(schema):
+            return lambda: self._object(properties, required, generators)
+        self._property_generators[path] = generators
+
+        check = codegen.compile_function(schema)
+        self._object_checks[path] = check
+        domains = {key: _domain(subschema) for key, subschema in properties.items()}
+        finite = {
+            key: values + ([] if key in required else [ABSENT])
+            for key, values in domains.items()
+            if values is not None
+        }
+        size = 1
+        for values in finite.values():
+            size *= len(values)
+        combinations: List[Dict[str, Any]] = []
+        if finite and size <= MAX_COMBINATIONS:
+            # Free properties get a fixed sample value while the combinations are checked
+            sample = {key: generators[key]() for key in properties if key not in finite}
+            valid, invalid = [], []
+            for values in itertools.product(*finite.values()):
+                combination = {
+                    key: value
+                    for key, value in zip(finite, values)
+                    if value is not ABSENT
+                }
+                if check({**sample, **combination}) is None:
+                    valid.append(combination)
+                elif all(key in combination for key in required & finite.keys()):
+                    invalid.append(combination)
+            if valid:
+                combinations = valid
+                self._enumerated_keys[path] = set(finite)
+                self._invalid_combinations[path] = invalid
+        enumerated = self._enumerated_keys.get(path, set())
+
+        def generate() -> dict:
+            for _ in range(MAX_ATTEMPTS):
+                fixed = self.random.choice(combinations) if combinations else {}
+                candidate = self._object(
+                    properties, required, generators, fixed, enumerated
+                )
+                if check(candidate) is None:
+                    return candidate
+            raise ValueError(f"Couldn't generate a valid object at {_format(path)}")
+
+        return generate
+
+    def _object(
+        self,
+        properties: dict,
+        required: set,
+        generators: Dict[str, Callable[[], Any]],
+        fixed: Optional[Dict[str, Any]] = None,
+        enumerated: Optional[set] = None,
+    ) -> dict:
+        """A new object; enumerated properties come from the fixed combination (absent if
+        it leaves them out), optional ones are included half of the time.
+        """
+        result = {}
+        for key in properties:
+            if fixed and key in fixed:
+                result[key] = fixed[key]
+            elif enumerated and key in enumerated:
+                continue
+            elif key in required or self.random.random() < 0.5:
+                result[key] = generators[key]()
+        return result
+
+    # Breaking rules
+
+    def _violation_sites(
+        self, schema: Any, value: Any, path: Path
+    ) -> Dict[str, List[Tuple[Any, Path]]]:
+        """Places in a document where each kind of rule can be broken"""
+        sites: Dict[str, List[Tuple[Any, Path]]] = {kind: [] for kind in VIOLATIONS}
+        stack = [(schema, value, path)]
+        while stack:
+            schema, value, path = stack.pop()
+            if not isinstance(schema, dict):
+                continue
+            if isinstance(value, dict):
+                if any(key in value for key in schema.get("required", [])):
+                    sites["required"].append((schema, path))
+                if schema.get("additionalProperties", True) is False:
+                    sites["additionalProperties"].append((schema, path))
+                if path in self._object_checks:
+                    sites["rule"].append((schema, path))
+                for key, subschema in schema.get("properties", {}).items():
+                    if key in value:
+                        stack.append((subschema, value[key], path + (key,)))
+            elif "enum" in schema or "const" in schema:
+                sites["enum"].append((schema, path))
+            elif "type" in schema or "oneOf" in schema:
+                sites["type"].append((schema, path))
+        return sites
+
+    def _violate(
+        self, kind: str, schema: dict, document: dict, path: Path
+    ) -> Optional[str]:
+        """Break one rule of the schema at path, in place. None if it couldn't be broken."""
+        parent = document
+        for key in path[:-1]:
+            parent = parent[key]
+        target = parent[path[-1]] if path else document
+        where = _format(path)
+        if kind == "required":
+            key = self.random.choice([k for k in schema["required"] if k in target])
+            del target[key]
+            return f"required: {where} is missing {key!r}"
+        if kind == "additionalProperties":
+            target[UNEXPECTED_PROPERTY] = 1
+            return f"additionalProperties: {where} has {UNEXPECTED_PROPERTY!r}"
+        if kind in ("enum", "type"):
+            if path not in self._leaf_checks:
+                self._leaf_checks[path] = codegen.compile_function(schema)
+            leaf_check = self._leaf_checks[path]
+            for bad_value in BAD_VALUES:
+                if leaf_check(bad_value) is not None:
+                    parent[path[-1]] = bad_value
+                    return f"{kind}: {where} is {bad_value!r}"
+            return None
+        if kind == "rule":
+            return self._violate_rule(target, path)
+        raise ValueError(f"Unknown violation {kind}")
+
+    def _violate_rule(self, target: dict, path: Path) -> Optional[str]:
+        invalid = self._invalid_combinations.get(path)
+        check = self._object_checks[path]
+        if invalid:
+            combination = self.random.choice(invalid)
+            for key in self._enumerated_keys[path] - combination.keys():
+                target.pop(key, None)
+            target.update(combination)
+        else:
+            # Regenerate the object's properties until its own rules fail
+            generators = self._property_generators[path]
+            for _ in range(MAX_ATTEMPTS):
+                candidate = {
+                    key: generators[key]() for key in target if key in generators
+                }
+                if check(candidate) is not None:
+                    target.update(candidate)
+                    break
+            else:
+                return None
+        error = check(target)
+        if error is None:
+            return None
+        return f"rule: {_format(path)}{error[1:]}"
+
+
+def _format(path: Path) -> str:
+    return "$" + "".join(f".{key}" for key in path)
+
+
+def iter_documents(
+    schema_name: str,
+    version: str,
+    count: Optional[int] = None,
+    invalid: bool = False,
+    seed: Optional[int] = None,
+) -> Iterator[dict]:
+    """Lazily generate `count` documents (or an endless stream if count is None)"""
+    generator = DocumentGenerator(schema_name, version, seed)
+    produced = itertools.count() if count is None else range(count)
+    for _ in produced:
+        yield generator.invalid_document()[1] if invalid else generator.document()
+
+
+def write_ndjson(documents: Iterator[dict], stream: IO[str]) -> int:
+    """Write documents one per line, returning how many were written"""
+    written = 0
+    dumps = json.JSONEncoder(separators=(",", ":")).encode
+    for document in documents:
+        stream.write(dumps(document))
+        stream.write("\n")
+        written += 1
+    return written
@@ -0,0 +1,74 @@
+import io
+import json
+
+import pytest
+
+from raven_schemas import generator as module
+from raven_schemas import schemas, validate
+
+VERSIONS = schemas.get_known_schemas_and_versions()["modeling_input"]
+
+
+@pytest.mark.parametrize("version", VERSIONS)
+def test_documents_are_valid(version):
+    validator = validate.registry.get("modeling_input", version)
+    documents = module.iter_documents("modeling_input", version, 200, seed=1)
+    for document in documents:
+        assert validator.is_valid(document)
+
+
+@pytest.mark.parametrize("version", VERSIONS)
+def test_invalid_documents_break_one_rule(version):
+    validator = validate.registry.get("modeling_input", version)
+    generator = module.DocumentGenerator("modeling_input", version, seed=1)
+    kinds = set()
+    for _ in range(100):
+        description, document = generator.invalid_document()
+        kinds.add(description.split(":")[0])
+        assert not validator.is_valid(document), description
+    assert kinds == set(module.VIOLATIONS)
+
+
+def test_seed_is_reproducible():
+    def generate(seed):
+        return list(module.iter_documents("modeling_input", "2.0.0", 20, seed=seed))
+
+    assert generate(3) == generate(3)
+    assert generate(3) != generate(4)
+
+
+def test_domain():
+    assert module._domain({"enum": ["a", "b", 1], "type": "string"}) == ["a", "b"]
+    assert module._domain({"const": "x"}) == ["x"]
+    assert module._domain({"type": ["boolean", "null"]}) == [True, False, None]
+    assert module._domain(
+        {"oneOf": [{"enum": ["a"]}, {"type": "null"}, {"enum": ["a"]}]}
+    ) == ["a", None]
+    assert module._domain({"type": "string"}) is None
+    assert module._domain({"oneOf": [{"type": "string"}, {"type": "null"}]}) is None
+
+
+def test_rule_violations():
+    generator = module.DocumentGenerator("modeling_input", "2.0.0", seed=1)
+    # The survey objects with conditional rules have their combinations enumerated
+    assert generator._invalid_combinations
+    for path in generator._object_checks:
+        document = generator.document()
+        target = document
+        for key in path:
+            target = target.setdefault(key, {})
+        description = generator._violate_rule(target, path)
+        if description is None:
+            continue
+        assert description.startswith(f"rule: {module._format(path)}")
+        assert generator._object_checks[path](target) is not None
+        assert generator.check(document) is not None
+
+
+def test_write_ndjson():
+    stream = io.StringIO()
+    documents = module.iter_documents("modeling_input", "1.0.0", 5, seed=1)
+    assert module.write_ndjson(documents, stream) == 5
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 5
+    assert all(isinstance(json.loads(line), dict) for line in lines)
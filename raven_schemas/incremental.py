@@ -0,0 +1,460 @@
+"""Re-validate a valid document after a JSON Patch (RFC 6902), checking only what the patch can affect.
+
+For every path a patch touches, the checks are:
+- the new value, against the subschema at its path
+- the parent's property-set keywords (required, additionalProperties, ...), if a property
+  was added or removed; without re-checking the parent's other properties
+- the conditional keywords (allOf, if/then/else, not, ...) of every ancestor whose rules read
+  the path, eg. the survey.systems heating/cooling rules when survey.systems.cooling.type changes
+
+Everything else was valid before the patch and can't have changed, so the work is proportional
+to the size of the change rather than the size of the document.
+Patches are applied copy-on-write: only the containers along the patched paths are copied, and
+the previous document is left untouched.
+"""
+import copy
+import functools
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
+
+import jsonschema
+
+from raven_schemas import validate
+
+# A path in a document: object keys and array indexes
+Path = Tuple[Any, ...]
+
+# Keywords that combine subschemas, and may read any property of the object they apply to
+CONDITIONAL_KEYWORDS = [
+    "allOf",
+    "anyOf",
+    "oneOf",
+    "not",
+    "if",
+    "then",
+    "else",
+    "dependentRequired",
+    "dependentSchemas",
+]
+# Keywords of an object that only depend on which properties it has
+PROPERTY_SET_KEYWORDS = [
+    "required",
+    "additionalProperties",
+    "propertyNames",
+    "minProperties",
+    "maxProperties",
+    "unevaluatedProperties",
+]
+# Subschema keywords that aren't followed when looking for the properties a rule reads:
+# they can apply to any property, so the rule reads the whole object
+OPAQUE_KEYWORDS = {
+    "additionalProperties",
+    "patternProperties",
+    "propertyNames",
+    "unevaluatedProperties",
+    "minProperties",
+    "maxProperties",
+    "dependentSchemas",
+    "dependentRequired",
+    "items",
+    "prefixItems",
+    "contains",
+    "$ref",
+    "$dynamicRef",
+}
+
+
+class PatchError(ValueError):
+    pass
+
+
+def _parse_pointer(pointer: str) -> List[str]:
+    """JSON pointer (RFC 6901) -> unescaped reference tokens"""
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        raise PatchError(f"Invalid JSON pointer {pointer!r}")
+    return [
+        token.replace("~1", "/").replace("~0", "~") for token in pointer[1:].split("/")
+    ]
+
+
+def _index(container: list, token: str, allow_end: bool = False) -> int:
+    if allow_end and token == "-":
+        return len(container)
+    if not token.isdigit() or (token != "0" and token.startswith("0")):
+        raise PatchError(f"Invalid array index {token!r}")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise PatchError(f"Array index {index} out of range")
+    return index
+
+
+class _Patcher:
+    """Applies patch operations copy-on-write, recording the paths they touch"""
+
+    def __init__(self, document: Any):
+        self.document = document
+        # Containers copied by this patch (by id), which can be modified in place
+        self._copied: Dict[int, Any] = {}
+        # path -> whether the patch added or removed it (rather than replacing its value)
+        self.changes: Dict[Path, bool] = {}
+
+    def _writable(self, value: Any) -> Any:
+        if id(value) in self._copied:
+            return value
+        value = copy.copy(value)
+        self._copied[id(value)] = value
+        return value
+
+    def _changed(self, path: Path, property_set_changed: bool) -> None:
+        self.changes[path] = self.changes.get(path, False) or property_set_changed
+
+    def _parent(self, tokens: List[str]) -> Tuple[Any, Path]:
+        """Copy the containers down to the parent of tokens, returning it and its path"""
+        if not isinstance(self.document, (dict, list)):
+            raise PatchError("Can't patch inside a scalar document")
+        self.document = node = self._writable(self.document)
+        path: List[Any] = []
+        for token in tokens[:-1]:
+            if isinstance(node, dict):
+                key: Any = token
+                if key not in node:
+                    raise PatchError(f"Path {'/'.join(tokens)} doesn't exist")
+            elif isinstance(node, list):
+                key = _index(node, token)
+            else:
+                raise PatchError(f"Path {'/'.join(tokens)} doesn't exist")
+            child = node[key]
+            if not isinstance(child, (dict, list)):
+                raise PatchError(f"Path {'/'.join(tokens)} doesn't exist")
+            node[key] = child = self._writable(child)
+            node = child
+            path.append(key)
+        return node, tuple(path)
+
+    def get(self, pointer: str) -> Any:
+        node = self.document
+        for token in _parse_pointer(pointer):
+            try:
+                node = node[_index(node, token) if isinstance(node, list) else token]
+            except (KeyError, TypeError):
+                raise PatchError(f"Path {pointer} doesn't exist")
+        return node
+
+    def add(self, pointer: str, value: Any) -> None:
+        tokens = _parse_pointer(pointer)
+        if not tokens:
+            self.document = value
+            self._changed((), False)
+            return
+        parent, path = self._parent(tokens)
+        if isinstance(parent, list):
+            index = _index(parent, tokens[-1], allow_end=True)
+            parent.insert(index, value)
+            # Every later item moved, so the array as a whole changed
+            self._changed(path, False)
+        else:
+            added = tokens[-1] not in parent
+            parent[tokens[-1]] = value
+            self._changed(path + (tokens[-1],), added)
+
+    def remove(self, pointer: str) -> Any:
+        tokens = _parse_pointer(pointer)
+        if not tokens:
+            raise PatchError("Can't remove the whole document")
+        parent, path = self._parent(tokens)
+        if isinstance(parent, list):
+            value = parent.pop(_index(parent, tokens[-1]))
+            self._changed(path, False)
+        else:
+            if tokens[-1] not in parent:
+                raise PatchError(f"Path {pointer} doesn't exist")
+            value = parent.pop(tokens[-1])
+            self._changed(path + (tokens[-1],), True)
+        return value
+
+    def replace(self, pointer: str, value: Any) -> None:
+        tokens = _parse_pointer(pointer)
+        if not tokens:
+            self.document = value
+            self._changed((), False)
+            return
+        parent, path = self._parent(tokens)
+        if isinstance(parent, list):
+            key: Any = _index(parent, tokens[-1])
+        elif tokens[-1] in parent:
+            key = tokens[-1]
+        else:
+            raise PatchError(f"Path {pointer} doesn't exist")
+        parent[key] = value
+        self._changed(path + (key,), False)
+
+    def apply(self, operation: Dict[str, Any]) -> None:
+        op = operation.get("op")
+        try:
+            pointer = operation["path"]
+            if op == "add":
+                self.add(pointer, operation["value"])
+            elif op == "remove":
+                self.remove(pointer)
+            elif op == "replace":
+                self.replace(pointer, operation["value"])
+            elif op == "move":
+                source = operation["from"]
+                if pointer.startswith(source + "/"):
+                    raise PatchError(f"Can't move {source} into one of its children")
+                self.add(pointer, self.remove(source))
+            elif op == "copy":
+                self.add(pointer, copy.deepcopy(self.get(operation["from"])))
+            elif op == "test":
+                if self.get(pointer) != operation["value"]:
+                    raise PatchError(f"Test failed at {pointer}")
+            else:
+                raise PatchError(f"Unknown patch operation {op!r}")
+        except KeyError as e:
+            raise PatchError(f"Patch operation {op!r} is missing {e}")
+
+
+def _reads(schema: Any, prefix: Path = ()) -> Set[Path]:
+    """Paths (relative to the object a rule applies to) that a rule reads.
+    () means the rule may read anything in the object.
+    """
+    reads: Set[Path] = set()
+    if not isinstance(schema, dict):
+        return reads
+    for keyword, value in schema.items():
+        if keyword == "properties":
+            for key, subschema in value.items():
+                reads.add(prefix + (key,))
+                reads |= _reads(subschema, prefix + (key,))
+        elif keyword == "required":
+            reads.update(prefix + (key,) for key in value)
+        elif keyword in ("allOf", "anyOf", "oneOf"):
+            for subschema in value:
+                reads |= _reads(subschema, prefix)
+        elif keyword in ("not", "if", "then", "else"):
+            reads |= _reads(value, prefix)
+        elif keyword in OPAQUE_KEYWORDS:
+            reads.add(prefix)
+    return reads
+
+
+def _overlaps(path: Path, reads: Set[Path]) -> bool:
+    return any(path[: len(read)] == read or read[: len(path)] == path for read in reads)
+
+
+class _Check(NamedTuple):
+    path: Path
+    # Path of the subschema within the version's schema, for error reporting
+    schema_path: Tuple[Any, ...]
+    validator: "jsonschema.protocols.Validator"
+
+
+class _SchemaIndex:
+    """What the patches of documents of one schema version need, computed on first use:
+    the paths each object's rules read, and validators for the subschemas that get re-checked.
+    """
+
+    def __init__(self, validator: "jsonschema.protocols.Validator"):
+        self.validator = validator
+        # schema path -> (the object's conditional keywords, the paths they read)
+        self._rules: Dict[Tuple[Any, ...], Tuple[dict, Set[Path]]] = {}
+        self._validators: Dict[
+            Tuple[Tuple[Any, ...], str], "jsonschema.protocols.Validator"
+        ] = {}
+
+    def rules(
+        self, schema: dict, schema_path: Tuple[Any, ...]
+    ) -> Tuple[dict, Set[Path]]:
+        rules = self._rules.get(schema_path)
+        if rules is None:
+            conditionals = {k: schema[k] for k in CONDITIONAL_KEYWORDS if k in schema}
+            rules = self._rules[schema_path] = (conditionals, _reads(conditionals))
+        return rules
+
+    def check(
+        self, path: Path, schema_path: Tuple[Any, ...], kind: str, schema: Any
+    ) -> _Check:
+        """A check of the subschema at schema_path, "value" for the whole subschema, "rules" for
+        its conditional keywords or "properties" for its property-set keywords
+        """
+        key = (schema_path, kind)
+        validator = self._validators.get(key)
+        if validator is None:
+            if kind == "rules":
+                schema = self.rules(schema, schema_path)[0]
+            elif kind == "properties":
+                schema = _property_set_schema(schema)
+            validator = self._validators[key] = self.validator.evolve(schema=schema)
+        return _Check(path, schema_path, validator)
+
+
+@functools.cache
+def _schema_index(schema_name: str, version: str) -> _SchemaIndex:
+    return _SchemaIndex(validate.registry.get(schema_name, version))
+
+
+class PatchResult(NamedTuple):
+    # The patched document if it is still valid, else None
+    document: Optional["ValidatedDocument"]
+    errors: List[validate.ErrorDetail]
+    # Document paths of the subtrees that were re-checked
+    checked_paths: List[Path]
+
+    @property
+    def is_valid(self) -> bool:
+        return not self.errors
+
+
+class ValidatedDocument:
+    """A document known to be valid for one version of a schema, that patches can be checked against"""
+
+    def __init__(self, document: Any, schema_name: str, version: str):
+        """@raises validate.ValidationError if the document isn't valid for the version"""
+        self.schema_name = schema_name
+        self.version = version
+        self._index = _schema_index(schema_name, version)
+        error = jsonschema.exceptions.best_match(
+            self._index.validator.iter_errors(document)
+        )
+        if error is not None:
+            raise validate.ValidationError(
+                f"Errors validating {schema_name}:\nVersion {version}: {error.message}"
+            )
+        self.document = document
+
+    @classmethod
+    def assume_valid(
+        cls, document: Any, schema_name: str, version: str
+    ) -> "ValidatedDocument":
+        """Wrap a document without validating it, for callers that check the whole document some
+        other way: patches only check what they change, so anything else that's invalid goes
+        unnoticed.
+        """
+        handle = cls.__new__(cls)
+        handle.schema_name = schema_name
+        handle.version = version
+        handle._index = _schema_index(schema_name, version)
+        handle.document = document
+        return handle
+
+    @classmethod
+    def _trusted(
+        cls, document: Any, previous: "ValidatedDocument"
+    ) -> "ValidatedDocument":
+        handle = cls.__new__(cls)
+        handle.schema_name = previous.schema_name
+        handle.version = previous.version
+        handle._index = previous._index
+        handle.document = document
+        return handle
+
+    def patch(
+        self, operations: List[Dict[str, Any]], max_errors: Optional[int] = None
+    ) -> PatchResult:
+        """Apply a JSON Patch and re-check the parts of the document it affects.
+        The patched document is only kept (in the result) if it is still valid.
+        @raises PatchError if the patch can't be applied.
+        """
+        patcher = _Patcher(self.document)
+        for operation in operations:
+            patcher.apply(operation)
+        checks = self._checks(patcher.document, patcher.changes)
+        errors: List[validate.ErrorDetail] = []
+        for check in checks:
+            instance = _resolve(patcher.document, check.path)
+            for error in check.validator.iter_errors(instance):
+                # Report paths relative to the whole document
+                error.path.extendleft(reversed(check.path))
+                error.schema_path.extendleft(reversed(check.schema_path))
+                errors.append(validate.ErrorDetail.from_error(self.version, error))
+                if max_errors is not None and len(errors) >= max_errors:
+                    break
+            if max_errors is not None and len(errors) >= max_errors:
+                break
+        checked = [check.path for check in checks]
+        if errors:
+            return PatchResult(None, errors, checked)
+        return PatchResult(
+            ValidatedDocument._trusted(patcher.document, self), [], checked
+        )
+
+    def _checks(self, document: Any, changes: Dict[Path, bool]) -> List[_Check]:
+        # (path, kind of check) -> check, kinds are "value", "rules" and "properties"
+        checks: Dict[Tuple[Path, str], _Check] = {}
+        index = self._index
+        for path, property_set_changed in changes.items():
+            # Walk the schema down the changed path, noting the ancestors' rules that read it
+            schema: Any = index.validator.schema
+            schema_path: Tuple[Any, ...] = ()
+            depth = 0
+            while depth < len(path):
+                if isinstance(schema, dict):
+                    conditionals, reads = index.rules(schema, schema_path)
+                    if conditionals and _overlaps(path[depth:], reads):
+                        checks[(path[:depth], "rules")] = index.check(
+                            path[:depth], schema_path, "rules", schema
+                        )
+                    if depth == len(path) - 1 and property_set_changed:
+                        checks[(path[:depth], "properties")] = index.check(
+                            path[:depth], schema_path, "properties", schema
+                        )
+                child = _child_schema(schema, path[depth])
+                if child is None:
+                    # Not a single known subschema, re-check this whole subtree
+                    break
+                schema, schema_path = child[0], schema_path + child[1]
+                depth += 1
+            if _exists(document, path[:depth]):
+                checks[(path[:depth], "value")] = index.check(
+                    path[:depth], schema_path, "value", schema
+                )
+        # A value check covers every other check at or below its path
+        covered = [path for path, kind in checks if kind == "value"]
+        return [
+            check
+            for (path, kind), check in checks.items()
+            if not any(
+                path[: len(outer)] == outer and (kind != "value" or path != outer)
+                for outer in covered
+            )
+            # A later operation may have removed the object an earlier one changed
+            and _exists(document, path)
+        ]
+
+
+def _child_schema(schema: Any, key: Any) -> Optional[Tuple[Any, Tuple[Any, ...]]]:
+    """(the subschema that applies to a property or item, its relative schema path),
+    or None if it isn't a single known subschema.
+    """
+    if not isinstance(schema, dict):
+        return None
+    if isinstance(key, str) and key in schema.get("properties", {}):
+        return schema["properties"][key], ("properties", key)
+    if isinstance(key, int) and isinstance(schema.get("items"), dict):
+        return schema["items"], ("items",)
+    return None
+
+
+def _property_set_schema(schema: dict) -> dict:
+    """The keywords of an object schema that only depend on which properties it has"""
+    result = {k: schema[k] for k in PROPERTY_SET_KEYWORDS if k in schema}
+    # additionalProperties needs to know the declared properties, not their schemas
+    for keyword in ("properties", "patternProperties"):
+        if keyword in schema and "additionalProperties" in result:
+            result[keyword] = {key: True for key in schema[keyword]}
+    return result
+
+
+def _exists(document: Any, path: Path) -> bool:
+    try:
+        _resolve(document, path)
+    except (KeyError, IndexError, TypeError):
+        return False
+    return True
+
+
+def _resolve(document: Any, path: Path) -> Any:
+    for key in path:
+        document = document[key]
+    return document
@@ -0,0 +1,165 @@
+import copy
+import json
+import random
+
+import pytest
+
+from raven_schemas import generator
+from raven_schemas import incremental as module
+from raven_schemas import schemas, validate
+from raven_schemas.constants import PACKAGE_DIR
+
+VERSIONS = schemas.get_known_schemas_and_versions()["modeling_input"]
+
+
+@pytest.fixture
+def valid_2_0_0_modeling_json():
+    with open(
+        PACKAGE_DIR / "schemas/modeling_input_2_0_0_sample_valid.json"
+    ) as modeling_input:
+        return json.load(modeling_input)
+
+
+def _leaf_paths(value, path=()):
+    if isinstance(value, dict):
+        for key, child in value.items():
+            yield from _leaf_paths(child, path + (key,))
+    elif path:
+        yield path
+
+
+def _pointer(path):
+    return "".join(f"/{key}" for key in path)
+
+
+def test_patch__replace_checks_only_the_change(valid_2_0_0_modeling_json):
+    original = copy.deepcopy(valid_2_0_0_modeling_json)
+    handle = module.ValidatedDocument(
+        valid_2_0_0_modeling_json, "modeling_input", "2.0.0"
+    )
+    result = handle.patch(
+        [{"op": "replace", "path": "/survey/systems/cooling/type", "value": "bogus"}]
+    )
+    assert not result.is_valid
+    assert result.document is None
+    (error,) = result.errors
+    assert (error.keyword, error.json_path) == ("enum", "$.survey.systems.cooling.type")
+    assert error.schema_path == (
+        "#/properties/survey/properties/systems/properties/cooling/properties/type/enum"
+    )
+    # The value, and the rules of survey.systems and survey.systems.cooling that read it
+    assert set(result.checked_paths) == {
+        ("survey", "systems"),
+        ("survey", "systems", "cooling"),
+        ("survey", "systems", "cooling", "type"),
+    }
+    result = handle.patch(
+        [{"op": "replace", "path": "/roofMaterial", "value": "Metal"}]
+    )
+    assert result.is_valid
+    assert result.checked_paths == [("roofMaterial",)]
+    assert result.document.document["roofMaterial"] == "Metal"
+    # Copy-on-write: the original document is untouched
+    assert valid_2_0_0_modeling_json == original
+    assert result.document.document["survey"] is valid_2_0_0_modeling_json["survey"]
+
+
+def test_patch__property_set_changes(valid_2_0_0_modeling_json):
+    handle = module.ValidatedDocument(
+        valid_2_0_0_modeling_json, "modeling_input", "2.0.0"
+    )
+    result = handle.patch([{"op": "remove", "path": "/city"}])
+    assert [(e.keyword, e.json_path) for e in result.errors] == [("required", "$")]
+    result = handle.patch([{"op": "add", "path": "/unexpected", "value": 1}])
+    assert [e.keyword for e in result.errors] == ["additionalProperties"]
+    result = handle.patch(
+        [
+            {"op": "remove", "path": "/city"},
+            {"op": "add", "path": "/city", "value": "Oakland"},
+            {"op": "test", "path": "/city", "value": "Oakland"},
+        ]
+    )
+    assert result.is_valid
+
+
+def test_patch__change_then_remove_ancestor(valid_2_0_0_modeling_json):
+    handle = module.ValidatedDocument(
+        valid_2_0_0_modeling_json, "modeling_input", "2.0.0"
+    )
+    operations = [
+        {"op": "replace", "path": "/survey/systems/cooling/type", "value": "bogus"},
+        {"op": "remove", "path": "/survey/systems/cooling"},
+    ]
+    result = handle.patch(operations)
+    patched = copy.deepcopy(valid_2_0_0_modeling_json)
+    del patched["survey"]["systems"]["cooling"]
+    assert result.is_valid == (
+        validate.check_versions(patched, "modeling_input", ["2.0.0"]).valid_versions
+        == ["2.0.0"]
+    )
+    assert ("survey", "systems", "cooling") not in result.checked_paths
+
+
+def test_patch__errors(valid_2_0_0_modeling_json):
+    handle = module.ValidatedDocument(
+        valid_2_0_0_modeling_json, "modeling_input", "2.0.0"
+    )
+    for operation in [
+        {"op": "remove", "path": "/nope"},
+        {"op": "replace", "path": "/survey/nope/x", "value": 1},
+        {"op": "test", "path": "/city", "value": "nope"},
+        {"op": "move", "from": "/survey", "path": "/survey/systems/x"},
+        {"op": "frobnicate", "path": "/city"},
+        {"op": "add", "value": 1},
+        {"op": "add", "path": "no-slash", "value": 1},
+    ]:
+        with pytest.raises(module.PatchError):
+            handle.patch([operation])
+    with pytest.raises(validate.ValidationError):
+        module.ValidatedDocument({"invalid": "data"}, "modeling_input", "2.0.0")
+
+
+def test_patch__pointers():
+    patcher = module._Patcher({"a/b": {"~c": [1, 2]}})
+    patcher.apply({"op": "add", "path": "/a~1b/~0c/-", "value": 3})
+    patcher.apply({"op": "copy", "from": "/a~1b/~0c", "path": "/d"})
+    patcher.apply({"op": "move", "from": "/d/0", "path": "/a~1b/~0c/0"})
+    assert patcher.document == {"a/b": {"~c": [1, 1, 2, 3]}, "d": [2, 3]}
+
+
+@pytest.mark.parametrize("version", VERSIONS)
+def test_patch__agrees_with_full_validation(version):
+    """Random single-value patches of generated documents, valid or not, and removals"""
+    rng = random.Random(version)
+    documents = generator.DocumentGenerator("modeling_input", version, seed=1)
+    validator = validate.registry.get("modeling_input", version)
+    outcomes = set()
+    for _ in range(100):
+        document = documents.document()
+        donor = documents.document()
+        if rng.random() < 0.5:
+            donor = documents.invalid_document()[1]
+        handle = module.ValidatedDocument(document, "modeling_input", version)
+        # Leaves of the donor whose parent object is in the document
+        paths = [
+            path
+            for path in _leaf_paths(donor)
+            if module._exists(document, path[:-1])
+            and isinstance(module._resolve(document, path[:-1]), dict)
+        ]
+        path = rng.choice(paths)
+        if rng.random() < 0.2:
+            path = rng.choice(list(_leaf_paths(document)))
+            patch = [{"op": "remove", "path": _pointer(path)}]
+        else:
+            op = "replace" if module._exists(document, path) else "add"
+            value = module._resolve(donor, path)
+            patch = [{"op": op, "path": _pointer(path), "value": value}]
+
+        patcher = module._Patcher(document)
+        patcher.apply(patch[0])
+        expected = patcher.document
+        result = handle.patch(patch)
+        assert result.is_valid == validator.is_valid(expected), patch
+        outcomes.add(result.is_valid)
+    assert outcomes == {True, False}
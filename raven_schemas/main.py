@@ -2,11 +2,52 @@ import json
 import sys
 from pathlib import Path
 from pprint import pprint
-from typing import List
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
 
 import click
 
-from raven_schemas import schemas, validate
+from raven_schemas import schemas
+from raven_schemas.constants import DEFAULT_CHUNKSIZE, OUTPUT_FORMATS
+
+# The validation modules pull in jsonschema, so commands import them when they run
+if TYPE_CHECKING:
+    from raven_schemas import aggregate, bulk
+
+
+def check_schema_names(ctx: click.Context, param: click.Parameter, value: Any) -> Any:
+    """Option callback checking schema names against the known schemas. The schemas are only
+    looked up once a name is given, not when the CLI is imported.
+    """
+    names = value if param.multiple else [value]
+    known = schemas.get_known_schemas_and_versions()
+    for name in names:
+        if name is not None and name not in known:
+            raise click.BadParameter(
+                f"{name!r} is not one of {', '.join(map(repr, known))}."
+            )
+    return value
+
+
+def complete_schema_names(
+    ctx: click.Context, param: click.Parameter, incomplete: str
+) -> List[str]:
+    return [
+        name
+        for name in schemas.get_known_schemas_and_versions()
+        if name.startswith(incomplete)
+    ]
+
+
+def schema_name_option(**kwargs):
+    """-s/--schema-name option; kwargs are passed to click.option"""
+    return click.option(
+        "-s",
+        "--schema-name",
+        metavar="SCHEMA_NAME",
+        callback=check_schema_names,
+        shell_complete=complete_schema_names,
+        **kwargs,
+    )
 
 
 @click.group()
@@ -15,15 +56,34 @@ def raven_schemas():
 
 
 @raven_schemas.command()
-@click.option(
-    "-s",
-    "--schema-name",
-    type=click.Choice(schemas.get_known_schemas_and_versions().keys()),
-    required=True,
-)
+@schema_name_option(required=True)
 @click.option("-v", "--schema-version", multiple=True)
 @click.option("-f", "--json-file", type=click.Path(exists=True), required=True)
-def validate_file(schema_name: str, schema_version: List[str], json_file: Path):
+@click.option(
+    "--max-errors",
+    type=click.IntRange(min=0),
+    default=None,
+    help="Report up to this many structured errors per version (0 for all of them).",
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    help="Print the time spent on each schema keyword, most expensive first.",
+)
+@click.option(
+    "--profile-output",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="Also write the profile in collapsed stack format, for flame graph tools.",
+)
+def validate_file(
+    schema_name: str,
+    schema_version: List[str],
+    json_file: Path,
+    max_errors: Optional[int],
+    profile: bool,
+    profile_output: Optional[str],
+):
     """
     Validate a JSON file against the given schema.
     If versions are provided, the file will be validated against those versions.
@@ -33,20 +93,675 @@ def validate_file(schema_name: str, schema_version: List[str], json_file: Path):
         schema_version = schemas.get_known_schemas_and_versions()[schema_name]
         print(f"Checking known versions of {schema_name} schema: {schema_version}.")
 
-    with open(json_file) as f:
-        json_data = json.load(f)
+    from raven_schemas import streaming, validate
+
+    with open(json_file, "rb") as f:
+        raw = f.read()
+
+    if profile or profile_output:
+        # Profiles the jsonschema validators, which streaming validation mostly skips
+        with validate.profiling() as profiler:
+            valid = _validate_file_json(
+                json.loads(raw), schema_name, schema_version, max_errors
+            )
+        print(profiler.format_table())
+        if profile_output:
+            with open(profile_output, "w") as f:
+                profiler.write_collapsed(f)
+            print(f"Wrote {profile_output}")
+        if not valid:
+            sys.exit(1)
+        return
+
+    if max_errors is not None:
+        if not _validate_file_json(
+            json.loads(raw), schema_name, schema_version, max_errors
+        ):
+            sys.exit(1)
+        return
 
     try:
-        versions = validate.find_valid_versions(json_data, schema_name, schema_version)
-    except validate.ValidationError as e:
-        print(e)
-        sys.exit(1)
+        _, versions = streaming.validate_bytes(raw, schema_name, schema_version)
+    except validate.ValidationError:
+        # Streaming gives up on the first error it meets, which isn't always the one
+        # find_valid_versions reports: validate the whole document again for its message
+        try:
+            json_data = json.loads(raw)
+        except ValueError as parse_error:
+            # Streaming can also reject a document before reaching its malformed part
+            print(f"Invalid JSON: {parse_error}")
+            sys.exit(1)
+        if not _validate_file_json(json_data, schema_name, schema_version, None):
+            sys.exit(1)
     else:
         print(f"✅ File is valid for {schema_name} version(s): {versions}")
 
 
+def _validate_file_json(
+    json_data: dict,
+    schema_name: str,
+    schema_version: List[str],
+    max_errors: Optional[int],
+) -> bool:
+    """Validate a parsed file for validate-file, printing the outcome. Returns whether it's valid."""
+    from raven_schemas import validate
+
+    if max_errors is None:
+        try:
+            versions = validate.find_valid_versions(
+                json_data, schema_name, schema_version
+            )
+        except validate.ValidationError as e:
+            print(e)
+            return False
+        print(f"✅ File is valid for {schema_name} version(s): {versions}")
+        return True
+
+    report = validate.check_versions(
+        json_data, schema_name, schema_version, max_errors=max_errors or None
+    )
+    for errors in report.errors.values():
+        for error in errors:
+            print(f"{error}\n    keyword: {error.keyword} at {error.schema_path}")
+    if not report.valid_versions:
+        return False
+    print(f"✅ File is valid for {schema_name} version(s): {report.valid_versions}")
+    return True
+
+
+def bulk_options(command):
+    """Options shared by the bulk validation commands"""
+    options = [
+        schema_name_option(required=True),
+        click.option("-v", "--schema-version", multiple=True),
+        click.option(
+            "-o",
+            "--output",
+            default="-",
+            show_default=True,
+            help="File to write per-record results to, '-' for stdout.",
+        ),
+        click.option(
+            "--format",
+            "output_format",
+            type=click.Choice(OUTPUT_FORMATS),
+            default="ndjson",
+            show_default=True,
+        ),
+        click.option(
+            "-j",
+            "--workers",
+            type=int,
+            default=None,
+            help="Worker processes, defaults to the number of CPUs.",
+        ),
+        click.option(
+            "--chunksize",
+            type=int,
+            default=DEFAULT_CHUNKSIZE,
+            show_default=True,
+            help="Records sent to a worker at a time.",
+        ),
+        click.option(
+            "--report",
+            type=click.Path(dir_okay=False, writable=True),
+            default=None,
+            help="File to write the errors of invalid records to, grouped by version, "
+            "JSON path, keyword and rule (JSON). The most frequent groups are printed too.",
+        ),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
+
+def run_bulk_validation(
+    raw_records: "bulk.RawRecords",
+    schema_name: str,
+    schema_version: List[str],
+    output: str,
+    output_format: str,
+    workers: Optional[int],
+    chunksize: int,
+    report: Optional[str],
+):
+    """Validate records, write per-record results and print a summary.
+    Exits with status 1 if any record is invalid.
+    """
+    from raven_schemas import bulk
+
+    if not schema_version:
+        schema_version = schemas.get_known_schemas_and_versions()[schema_name]
+    write_bulk_results(
+        lambda writer, aggregator: bulk.validate_stream(
+            raw_records,
+            schema_name,
+            list(schema_version),
+            writer=writer,
+            workers=workers,
+            chunksize=chunksize,
+            report=aggregator,
+        ),
+        output,
+        output_format,
+        report,
+    )
+
+
+def write_bulk_results(
+    run: Callable[
+        ["bulk.VerdictWriter", Optional["aggregate.ErrorAggregator"]], "bulk.Summary"
+    ],
+    output: str,
+    output_format: str,
+    report: Optional[str] = None,
+):
+    """Run a bulk validation that writes to the results writer (and the error aggregator, for a
+    report), and print its summary. Exits with status 1 if any record is invalid.
+    """
+    from raven_schemas import aggregate, bulk
+
+    aggregator = aggregate.ErrorAggregator() if report is not None else None
+    stream = bulk.open_output(output)
+    try:
+        summary = run(bulk.VerdictWriter(stream, output_format), aggregator)
+    finally:
+        if stream is sys.stdout:
+            stream.flush()
+        else:
+            stream.close()
+    # Keep the summary out of the results when they go to stdout
+    click.echo(summary.render(), err=output == "-")
+    if aggregator is not None:
+        with open(report, "w") as f:
+            aggregator.write_json(f)
+        if aggregator.records:
+            click.echo(aggregator.render(), err=output == "-")
+    if summary.failures:
+        sys.exit(1)
+
+
+@raven_schemas.command()
+@bulk_options
+@click.option(
+    "-f",
+    "--ndjson-file",
+    type=click.Path(exists=True, dir_okay=False),
+    required=True,
+)
+def validate_ndjson(ndjson_file: Path, **kwargs):
+    """
+    Validate every line of an NDJSON file against the given schema, in parallel.
+    If no versions are provided, each record is validated against all known versions of the schema.
+    """
+    from raven_schemas import bulk
+
+    run_bulk_validation(bulk.iter_ndjson(ndjson_file), **kwargs)
+
+
+@raven_schemas.command()
+@bulk_options
+@click.option(
+    "-d",
+    "--directory",
+    type=click.Path(exists=True, file_okay=False),
+    required=True,
+)
+@click.option("--pattern", default="*.json", show_default=True)
+def validate_dir(directory: Path, pattern: str, **kwargs):
+    """
+    Validate every JSON file in a directory (recursively) against the given schema, in parallel.
+    If no versions are provided, each file is validated against all known versions of the schema.
+    """
+    from raven_schemas import bulk
+
+    run_bulk_validation(bulk.iter_json_files(directory, pattern), **kwargs)
+
+
+def _parse_lines(ctx, param, value: Optional[str]) -> Optional[range]:
+    """A range of line numbers: FIRST-LAST (inclusive), FIRST- or -LAST"""
+    if value is None:
+        return None
+    first, separator, last = value.partition("-")
+    try:
+        if not separator:
+            raise ValueError
+        start = int(first) if first else 1
+        stop = int(last) + 1 if last else sys.maxsize
+    except ValueError:
+        raise click.BadParameter(f"expected FIRST-LAST, got {value!r}")
+    if start < 1 or stop <= start:
+        raise click.BadParameter(f"{value!r} is an empty range of lines")
+    return range(start, stop)
+
+
+@raven_schemas.command()
+@bulk_options
+@click.option(
+    "-f",
+    "--ndjson-file",
+    type=click.Path(exists=True, dir_okay=False),
+    required=True,
+)
+@click.option(
+    "--index",
+    "index_path",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Line-offset index of the file, built if needed. Defaults to <ndjson file>.idx.",
+)
+@click.option(
+    "--lines",
+    callback=_parse_lines,
+    default=None,
+    help="Only validate these lines, eg. 1000-1999, 5000- or -99.",
+)
+@click.option(
+    "--failed-from",
+    type=click.Path(exists=True, dir_okay=False),
+    default=None,
+    help="Only validate the records that were invalid in these results (NDJSON or CSV).",
+)
+def validate_archive(
+    ndjson_file: Path,
+    index_path: Optional[str],
+    lines: Optional[range],
+    failed_from: Optional[str],
+    schema_name: str,
+    schema_version: List[str],
+    output: str,
+    output_format: str,
+    workers: Optional[int],
+    chunksize: int,
+    report: Optional[str],
+):
+    """
+    Validate a large NDJSON file, or some of its lines, through a memory map.
+    The offset of every line is indexed on the first run, so later runs (eg. of the records that
+    failed last time) only read the lines they validate.
+    """
+    from raven_schemas import archive, bulk
+
+    if not schema_version:
+        schema_version = schemas.get_known_schemas_and_versions()[schema_name]
+    with archive.NdjsonArchive(ndjson_file, index_path) as ndjson:
+        if ndjson.built:
+            click.echo(
+                f"Indexed {len(ndjson)} lines into {ndjson.index_path}", err=True
+            )
+        line_numbers = range(1, len(ndjson) + 1)
+        if lines is not None:
+            line_numbers = line_numbers[lines.start - 1 : lines.stop - 1]
+        if failed_from is not None:
+            line_numbers = [
+                line_number
+                for line_number in archive.failed_record_ids(failed_from)
+                if line_number in line_numbers
+            ]
+        write_bulk_results(
+            lambda writer, aggregator: bulk.summarize(
+                archive.validate_archive(
+                    ndjson,
+                    schema_name,
+                    list(schema_version),
+                    line_numbers,
+                    workers=workers,
+                    chunksize=chunksize,
+                    details=aggregator is not None,
+                ),
+                writer,
+                aggregator,
+            ),
+            output,
+            output_format,
+            report,
+        )
+
+
+def _parse_default(ctx, param, values: Tuple[str, ...]) -> Dict[str, Any]:
+    defaults = {}
+    for value in values:
+        pointer, _, document = value.partition("=")
+        try:
+            defaults[pointer] = json.loads(document)
+        except ValueError:
+            raise click.BadParameter(f"expected POINTER=JSON, got {value!r}")
+    return defaults
+
+
+@raven_schemas.command()
+@schema_name_option(required=True)
+@click.option(
+    "-t",
+    "--target-version",
+    default=None,
+    help="Version to migrate to, defaults to the latest one.",
+)
+@click.option("-f", "--ndjson-file", type=click.Path(exists=True), required=True)
+@click.option(
+    "-o",
+    "--output",
+    default="-",
+    show_default=True,
+    help="NDJSON file to write the migrated records to, '-' for stdout.",
+)
+@click.option(
+    "--failures",
+    default=None,
+    help="NDJSON file to write the records that couldn't be migrated to, with their errors.",
+)
+@click.option(
+    "--default",
+    "defaults",
+    multiple=True,
+    callback=_parse_default,
+    help="POINTER=JSON value for data that later versions require and earlier ones lack, "
+    "or that replaces values later versions dropped, "
+    'eg. /survey/structure/solar_panels={"present": false} or /survey/appliances/cooking/type=null',
+)
+@click.option(
+    "-j",
+    "--workers",
+    type=int,
+    default=None,
+    help="Worker processes, defaults to the number of CPUs.",
+)
+@click.option(
+    "--chunksize",
+    type=int,
+    default=DEFAULT_CHUNKSIZE,
+    show_default=True,
+    help="Records sent to a worker at a time.",
+)
+def migrate_ndjson(
+    schema_name: str,
+    target_version: Optional[str],
+    ndjson_file: Path,
+    output: str,
+    failures: Optional[str],
+    defaults: Dict[str, Any],
+    workers: Optional[int],
+    chunksize: int,
+):
+    """
+    Upgrade every record of an NDJSON file to a later schema version, in parallel.
+    Records are validated in full at the target version only; exits with status 1 if any fail.
+    """
+    from raven_schemas import bulk, migrate
+
+    if target_version is None:
+        target_version = schemas.get_known_schemas_and_versions()[schema_name][-1]
+    stream = bulk.open_output(output)
+    failures_stream = bulk.open_output(failures) if failures else None
+    try:
+        summary = migrate.migrate_stream(
+            bulk.iter_ndjson(ndjson_file),
+            schema_name,
+            target_version,
+            stream,
+            failures_stream,
+            defaults,
+            workers=workers,
+            chunksize=chunksize,
+        )
+    finally:
+        for opened in [stream, failures_stream]:
+            if opened is sys.stdout:
+                opened.flush()
+            elif opened is not None:
+                opened.close()
+    click.echo(summary.render(), err=output == "-")
+    if summary.failures:
+        sys.exit(1)
+
+
+@raven_schemas.command()
+@schema_name_option(required=True)
+@click.option("-v", "--schema-version", multiple=True)
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("-p", "--port", type=int, default=8765, show_default=True)
+@click.option(
+    "--unix-socket",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Listen on this Unix domain socket instead of a TCP port.",
+)
+@click.option(
+    "-j",
+    "--workers",
+    type=int,
+    default=None,
+    help="Worker processes, defaults to the number of CPUs.",
+)
+@click.option(
+    "--max-batch-size",
+    type=int,
+    default=DEFAULT_CHUNKSIZE,
+    show_default=True,
+    help="Most documents of concurrent requests sent to a worker at a time.",
+)
+def serve(
+    schema_name: str,
+    schema_version: List[str],
+    host: str,
+    port: int,
+    unix_socket: Optional[str],
+    workers: Optional[int],
+    max_batch_size: int,
+):
+    """
+    Validate documents sent over HTTP (POST /validate, one document or a JSON array of them),
+    with the validators of every version kept warm in worker processes. Stops on SIGINT/SIGTERM.
+    """
+    from raven_schemas import serve as server
+
+    versions = list(schema_version) or None
+    server.run(
+        schema_name,
+        versions,
+        host,
+        port,
+        unix_socket,
+        on_ready=lambda address: click.echo(
+            f"Validating {schema_name} documents on {address}", err=True
+        ),
+        workers=workers,
+        max_batch_size=max_batch_size,
+    )
+
+
+@raven_schemas.command("compile")
+@schema_name_option(
+    multiple=True,
+    help="Schemas to compile, defaults to all known schemas.",
+)
+@click.option(
+    "-o",
+    "--output-dir",
+    type=click.Path(file_okay=False),
+    default="compiled",
+    show_default=True,
+)
+def compile_schemas(schema_name: List[str], output_dir: Path):
+    """
+    Generate Python validation modules for every known version of the given schemas.
+    Each module has a validate_<version> function per version and a VALIDATORS dict.
+    """
+    from raven_schemas import codegen
+
+    for name in schema_name or schemas.get_known_schemas_and_versions():
+        path = codegen.write_module(name, Path(output_dir))
+        print(f"Wrote {path}")
+
+
+@raven_schemas.command()
+@schema_name_option(
+    multiple=True,
+    help="Schemas to generate bindings for, defaults to all known schemas.",
+)
+@click.option(
+    "-o",
+    "--output-dir",
+    type=click.Path(file_okay=False),
+    default="bindings",
+    show_default=True,
+)
+def bindings(schema_name: List[str], output_dir: Path):
+    """
+    Generate Python record classes (frozen, slotted dataclasses) for every known version of the
+    given schemas, one <schema>_<version>.py module per version, with ROOT the document's class.
+    """
+    from raven_schemas import bindings as generator
+
+    for name in schema_name or schemas.get_known_schemas_and_versions():
+        for path in generator.write_modules(name, Path(output_dir)):
+            print(f"Wrote {path}")
+
+
+@raven_schemas.command()
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Defaults to validators.artifact in the package, where the library looks for it.",
+)
+def build_artifact(output: Optional[str]):
+    """
+    Prebuild the validators of every known schema version into one file, so that new processes
+    don't have to read, check and compile the schemas. Rebuild it after modifying a schema;
+    out-of-date versions are read from their JSON files in the meantime.
+    """
+    from raven_schemas import artifact
+
+    path = artifact.build_artifact(output or artifact.DEFAULT_ARTIFACT_PATH)
+    print(f"Wrote {path}")
+
+
+@raven_schemas.command()
+@schema_name_option(required=True)
+@click.option("-v", "--schema-version", required=True)
+@click.option(
+    "-n",
+    "--count",
+    type=int,
+    default=None,
+    help="Documents to generate, defaults to an endless stream.",
+)
+@click.option(
+    "--invalid",
+    is_flag=True,
+    help="Generate near-miss documents that each break exactly one rule.",
+)
+@click.option("--seed", type=int, default=None, help="Seed for reproducible output.")
+@click.option(
+    "-o",
+    "--output",
+    default="-",
+    show_default=True,
+    help="NDJSON file to write to, '-' for stdout.",
+)
+def generate(
+    schema_name: str,
+    schema_version: str,
+    count: Optional[int],
+    invalid: bool,
+    seed: Optional[int],
+    output: str,
+):
+    """
+    Generate synthetic documents for a schema version, one JSON document per line.
+    Valid documents satisfy every rule of the version, including its conditional rules.
+    """
+    from raven_schemas import bulk, generator
+
+    documents = generator.iter_documents(
+        schema_name, schema_version, count, invalid=invalid, seed=seed
+    )
+    stream = bulk.open_output(output)
+    try:
+        generator.write_ndjson(documents, stream)
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+
+
 @raven_schemas.command()
 def list_schemas():
     """Return a list of schema names and versions"""
     print("Known schemas and versions:")
     pprint(schemas.get_known_schemas_and_versions())
+
+
+@raven_schemas.command()
+def build_manifest():
+    """Regenerate the manifest of schema files and content hashes.
+    Run this after adding or modifying a schema file.
+    """
+    path = schemas.write_manifest()
+    print(f"Wrote {path}")
+
+
+@raven_schemas.command()
+@schema_name_option(required=True)
+@click.option("-v", "--schema-version", multiple=True)
+@click.option(
+    "-n",
+    "--records",
+    type=int,
+    multiple=True,
+    help="Workload sizes, defaults to 1k, 100k and 1M records.",
+)
+@click.option(
+    "-w", "--workload", type=click.Choice(["valid", "invalid", "mixed"]), multiple=True
+)
+@click.option(
+    "-e", "--engine", type=click.Choice(["jsonschema", "multiversion"]), multiple=True
+)
+@click.option("--no-cold-start", is_flag=True, help="Skip the cold start measurements.")
+@click.option(
+    "-o", "--output", type=click.Path(dir_okay=False), help="Write results JSON here."
+)
+@click.option(
+    "-b",
+    "--baseline",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Results JSON of a previous run to compare against.",
+)
+@click.option("--threshold", type=float, default=0.1, show_default=True)
+def bench(
+    schema_name: str,
+    schema_version: List[str],
+    records: List[int],
+    workload: List[str],
+    engine: List[str],
+    no_cold_start: bool,
+    output: Optional[str],
+    baseline: Optional[str],
+    threshold: float,
+):
+    """
+    Benchmark validation latency, throughput, peak memory and cold start time.
+    Exits with status 1 if a baseline is given and any measurement regressed by more than the threshold.
+    """
+    from raven_schemas import bench as benchmarks
+
+    report = benchmarks.run_benchmarks(
+        schema_name,
+        versions=list(schema_version) or None,
+        sizes=list(records) or None,
+        workloads=list(workload) or None,
+        engines=list(engine) or None,
+        measure_cold_start=not no_cold_start,
+    )
+    print(benchmarks.render(report))
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+    if baseline:
+        with open(baseline) as f:
+            regressions = benchmarks.compare(json.load(f), report, threshold)
+        for regression in regressions:
+            print(f"❌ {regression}")
+        if regressions:
+            sys.exit(1)
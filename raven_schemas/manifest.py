@@ -0,0 +1,50 @@
+"""Generated by `raven-schemas build-manifest`. Do not edit."""
+
+MANIFEST = {
+    "modeling_input": {
+        "0.0.0": {
+            "path": "schemas/modeling_input_0_0_0_schema.json",
+            "sha256": "70049ec6bf2cd982f7405095f18a6fad580ea8cc0e7206e7fea6bffc05726e94",
+        },
+        "1.0.0": {
+            "path": "schemas/modeling_input_1_0_0_schema.json",
+            "sha256": "179ed4f1553a059dad808cba96905d0b1658711ddaeca60181c7732a839ceab4",
+        },
+        "1.0.1": {
+            "path": "schemas/modeling_input_1_0_1_schema.json",
+            "sha256": "c6fec0f7645df7195de9ed340c894f60ae9a9dc3f2c75ef71e7ce52854aaa470",
+        },
+        "1.1.0": {
+            "path": "schemas/modeling_input_1_1_0_schema.json",
+            "sha256": "641c73b5fef2f6c6f838ce5dbba320a4dfd4425b6557db065bbad7b10cb4dd4c",
+        },
+        "1.1.1": {
+            "path": "schemas/modeling_input_1_1_1_schema.json",
+            "sha256": "b88e61ffa6785ca42a3de721db7310a10a0869943d11309c714c0d03c0cd027a",
+        },
+        "1.1.2": {
+            "path": "schemas/modeling_input_1_1_2_schema.json",
+            "sha256": "a0a13fd361858f0835e6a88cf61b272f6f77cff5c287f5fd0a33e1995ff9899e",
+        },
+        "1.1.3": {
+            "path": "schemas/modeling_input_1_1_3_schema.json",
+            "sha256": "be575816ef7c2708f3e87b35093a79c19e5e006d16eef926e8db7de123207784",
+        },
+        "1.1.4": {
+            "path": "schemas/modeling_input_1_1_4_schema.json",
+            "sha256": "95cb262758c8cd5a8ca5e32a6fe9f5237d8ba36507cb1fb45a322ef187131edc",
+        },
+        "1.1.5": {
+            "path": "schemas/modeling_input_1_1_5_schema.json",
+            "sha256": "014be4acca511ef646d2beb5708008a81a36c66dd7ad8ee4a546d01ab56fb6d5",
+        },
+        "1.2.0": {
+            "path": "schemas/modeling_input_1_2_0_schema.json",
+            "sha256": "6b20f09d555961842c6d9fc000ef7cbb7e0be51e142ea3557faf0bd101af9488",
+        },
+        "2.0.0": {
+            "path": "schemas/modeling_input_2_0_0_schema.json",
+            "sha256": "b516b46b6904cfae4ebe837820d1cf63c26cdbd9b46bf060c262815b7727b316",
+        },
+    },
+}
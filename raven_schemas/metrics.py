@@ -0,0 +1,295 @@
+"""Counters and latency histograms of validations, per schema and version.
+
+Metrics are off by default: the instrumented code only checks whether a recorder is enabled.
+Once enabled, validation records:
+- raven_schemas_validations_total{schema, version, outcome}: each version find_valid_versions
+  tries, with outcome valid, invalid, or rejected (ruled out by a discriminator)
+- raven_schemas_validation_seconds{schema, version}: time to validate against a version
+- raven_schemas_documents_total{schema, outcome}: find_valid_versions calls, valid or invalid
+- raven_schemas_verdict_cache_total{schema, version, result}: verdict cache hits and misses
+- raven_schemas_registry_total{schema, version, result}: validator registry hits and misses
+- raven_schemas_validator_build_seconds{schema, version}: time to build a validator
+
+Metrics are kept in memory (see Metrics.snapshot) and passed on to sinks: a Prometheus text
+exposition file (eg. for node_exporter's textfile collector) or StatsD over UDP. Metrics are
+per process: worker processes of validate_many record their own.
+"""
+import bisect
+import os
+import socket
+import threading
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+# Upper bounds in seconds, from 50µs to 1s
+DEFAULT_BUCKETS = (
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    1.0,
+)
+DEFAULT_STATSD_PORT = 8125
+# Keeps StatsD packets within a typical network MTU
+MAX_STATSD_PACKET = 1432
+
+HELP = {
+    "raven_schemas_validations_total": "Schema versions tried by find_valid_versions, by outcome",
+    "raven_schemas_validation_seconds": "Time to validate a document against a schema version",
+    "raven_schemas_documents_total": "Documents checked by find_valid_versions, by outcome",
+    "raven_schemas_verdict_cache_total": "Verdict cache lookups, by result",
+    "raven_schemas_registry_total": "Validator registry lookups, by result",
+    "raven_schemas_validator_build_seconds": "Time to build a validator",
+}
+
+# (name, ((label, value), ...))
+MetricKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class HistogramSnapshot(NamedTuple):
+    buckets: Tuple[float, ...]
+    # Observations in each bucket, the last one counting those above every bound
+    counts: Tuple[int, ...]
+    sum: float
+    count: int
+
+
+class MetricsSnapshot(NamedTuple):
+    counters: Dict[MetricKey, int]
+    histograms: Dict[MetricKey, HistogramSnapshot]
+
+    def counter(self, name: str, **labels: str) -> int:
+        return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def histogram(self, name: str, **labels: str) -> Optional[HistogramSnapshot]:
+        return self.histograms.get((name, tuple(sorted(labels.items()))))
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class MetricsSink:
+    """Receives every recorded value as it's recorded, and the metrics on each flush"""
+
+    def increment(self, name: str, labels: Dict[str, str], value: int) -> None:
+        pass
+
+    def observe(self, name: str, labels: Dict[str, str], value: float) -> None:
+        pass
+
+    def flush(self, snapshot: MetricsSnapshot) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class Metrics:
+    def __init__(
+        self,
+        sinks: Sequence[MetricsSink] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.sinks = list(sinks)
+        self.buckets = tuple(sorted(buckets))
+        self._counters: Dict[MetricKey, int] = {}
+        self._histograms: Dict[MetricKey, _Histogram] = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, value: int = 1, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        for sink in self.sinks:
+            sink.increment(name, labels, value)
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(len(self.buckets) + 1)
+            histogram.counts[bisect.bisect_left(self.buckets, value)] += 1
+            histogram.sum += value
+            histogram.count += 1
+        for sink in self.sinks:
+            sink.observe(name, labels, value)
+
+    def snapshot(self) -> MetricsSnapshot:
+        """A copy of every metric's current value"""
+        with self._lock:
+            return MetricsSnapshot(
+                dict(self._counters),
+                {
+                    key: HistogramSnapshot(
+                        self.buckets, tuple(h.counts), h.sum, h.count
+                    )
+                    for key, h in self._histograms.items()
+                },
+            )
+
+    def flush(self) -> None:
+        snapshot = self.snapshot()
+        for sink in self.sinks:
+            sink.flush(snapshot)
+
+    def close(self) -> None:
+        """Flush and close the sinks"""
+        self.flush()
+        for sink in self.sinks:
+            sink.close()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    parts = [f'{label}="{_escape(value)}"' for label, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _bound(bound: float) -> str:
+    return repr(float(bound))
+
+
+def prometheus_text(snapshot: MetricsSnapshot) -> str:
+    """The snapshot in the Prometheus text exposition format"""
+    lines: List[str] = []
+    families: Dict[str, List[MetricKey]] = {}
+    for key in list(snapshot.counters) + list(snapshot.histograms):
+        families.setdefault(key[0], []).append(key)
+    for name in sorted(families):
+        is_histogram = name not in {key[0] for key in snapshot.counters}
+        if name in HELP:
+            lines.append(f"# HELP {name} {HELP[name]}")
+        lines.append(f"# TYPE {name} {'histogram' if is_histogram else 'counter'}")
+        for key in sorted(families[name]):
+            labels = key[1]
+            if not is_histogram:
+                lines.append(f"{name}{_labels(labels)} {snapshot.counters[key]}")
+                continue
+            histogram = snapshot.histograms[key]
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                le = f'le="{_bound(bound)}"'
+                lines.append(f"{name}_bucket{_labels(labels, le)} {cumulative}")
+            inf = 'le="+Inf"'
+            lines.append(f"{name}_bucket{_labels(labels, inf)} {histogram.count}")
+            lines.append(f"{name}_sum{_labels(labels)} {histogram.sum!r}")
+            lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+    return "\n".join(lines) + "\n"
+
+
+class PrometheusFileSink(MetricsSink):
+    """Writes every metric to a file in the Prometheus text format on each flush"""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+
+    def flush(self, snapshot: MetricsSnapshot) -> None:
+        # Write then rename, so that a scrape never reads a partial file
+        partial = self.path.with_name(f"{self.path.name}.{os.getpid()}.partial")
+        partial.write_text(prometheus_text(snapshot))
+        partial.replace(self.path)
+
+
+class StatsdSink(MetricsSink):
+    """Sends every recorded value to a StatsD server over UDP, as counters and timers.
+    Labels are appended to the metric name (eg. raven_schemas_validations_total.modeling_input.
+    2_0_0.valid). Values are buffered into packets, sent when full and on flush.
+    """
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = DEFAULT_STATSD_PORT,
+        max_packet: int = MAX_STATSD_PACKET,
+    ):
+        self.address = (host, port)
+        self.max_packet = max_packet
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._buffer: List[bytes] = []
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _name(name: str, labels: Dict[str, str]) -> str:
+        parts = [name] + [value for _, value in sorted(labels.items())]
+        return ".".join(
+            part.replace(".", "_").replace(":", "_").replace("|", "_") for part in parts
+        )
+
+    def increment(self, name: str, labels: Dict[str, str], value: int) -> None:
+        self._add(f"{self._name(name, labels)}:{value}|c".encode())
+
+    def observe(self, name: str, labels: Dict[str, str], value: float) -> None:
+        # StatsD timers are in milliseconds
+        self._add(f"{self._name(name, labels)}:{value * 1e3:.3f}|ms".encode())
+
+    def _add(self, line: bytes) -> None:
+        with self._lock:
+            if self._buffer and self._size + len(line) + 1 > self.max_packet:
+                self._send()
+            self._buffer.append(line)
+            self._size += len(line) + 1
+
+    def _send(self) -> None:
+        try:
+            self._socket.sendto(b"\n".join(self._buffer), self.address)
+        except OSError:
+            # Metrics are best effort, never fail a validation
+            pass
+        self._buffer = []
+        self._size = 0
+
+    def flush(self, snapshot: MetricsSnapshot) -> None:
+        with self._lock:
+            if self._buffer:
+                self._send()
+
+    def close(self) -> None:
+        self._socket.close()
+
+
+_metrics: Optional[Metrics] = None
+
+
+def current() -> Optional[Metrics]:
+    """The enabled metrics, or None while metrics are disabled"""
+    return _metrics
+
+
+def enable(
+    sinks: Sequence[MetricsSink] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+) -> Metrics:
+    """Start recording metrics (in this process), replacing any enabled ones"""
+    global _metrics
+    disable()
+    _metrics = Metrics(sinks, buckets)
+    return _metrics
+
+
+def disable() -> None:
+    """Stop recording metrics, flushing and closing the sinks"""
+    global _metrics
+    metrics, _metrics = _metrics, None
+    if metrics is not None:
+        metrics.close()
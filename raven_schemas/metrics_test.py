@@ -0,0 +1,186 @@
+import json
+import socket
+
+import pytest
+
+from raven_schemas import cache
+from raven_schemas import metrics as module
+from raven_schemas import schemas, validate
+from raven_schemas.constants import PACKAGE_DIR
+
+VERSIONS = schemas.get_known_schemas_and_versions()["modeling_input"]
+
+
+@pytest.fixture
+def valid_2_0_0_modeling_json():
+    with open(
+        PACKAGE_DIR / "schemas/modeling_input_2_0_0_sample_valid.json"
+    ) as modeling_input:
+        return json.load(modeling_input)
+
+
+@pytest.fixture
+def enabled():
+    yield module.enable()
+    module.disable()
+
+
+def test_disabled_by_default(valid_2_0_0_modeling_json):
+    assert module.current() is None
+    validate.find_valid_versions(valid_2_0_0_modeling_json, "modeling_input", VERSIONS)
+    assert module.current() is None
+
+
+def test_find_valid_versions(enabled, valid_2_0_0_modeling_json):
+    assert module.current() is enabled
+    validate.find_valid_versions(valid_2_0_0_modeling_json, "modeling_input", VERSIONS)
+    with pytest.raises(validate.ValidationError):
+        validate.find_valid_versions(
+            {"input_schema_version": "2.0.0"}, "modeling_input", ["2.0.0"]
+        )
+    snapshot = enabled.snapshot()
+    labels = {"schema": "modeling_input", "version": "2.0.0"}
+    assert (
+        snapshot.counter("raven_schemas_validations_total", outcome="valid", **labels)
+        == 1
+    )
+    assert (
+        snapshot.counter("raven_schemas_validations_total", outcome="invalid", **labels)
+        == 1
+    )
+    assert (
+        snapshot.counter(
+            "raven_schemas_validations_total",
+            schema="modeling_input",
+            version="1.0.0",
+            outcome="rejected",
+        )
+        == 1
+    )
+    for outcome in ["valid", "invalid"]:
+        assert (
+            snapshot.counter(
+                "raven_schemas_documents_total",
+                schema="modeling_input",
+                outcome=outcome,
+            )
+            == 1
+        )
+    histogram = snapshot.histogram("raven_schemas_validation_seconds", **labels)
+    assert histogram.count == sum(histogram.counts) == 2
+    assert histogram.sum > 0
+    assert snapshot.counter("raven_schemas_registry_total", result="hit", **labels)
+
+
+def test_verdict_cache(enabled, valid_2_0_0_modeling_json):
+    verdicts = cache.VerdictCache()
+    for _ in range(3):
+        validate.find_valid_versions(
+            valid_2_0_0_modeling_json, "modeling_input", ["2.0.0"], cache=verdicts
+        )
+    snapshot = enabled.snapshot()
+    labels = {"schema": "modeling_input", "version": "2.0.0"}
+    assert (
+        snapshot.counter("raven_schemas_verdict_cache_total", result="miss", **labels)
+        == 1
+    )
+    assert (
+        snapshot.counter("raven_schemas_verdict_cache_total", result="hit", **labels)
+        == 2
+    )
+    assert (
+        snapshot.counter("raven_schemas_validations_total", outcome="valid", **labels)
+        == 3
+    )
+    assert snapshot.histogram("raven_schemas_validation_seconds", **labels).count == 1
+
+
+def test_registry_build():
+    recorder = module.enable()
+    try:
+        validate.ValidatorRegistry().get("modeling_input", "1.0.0")
+    finally:
+        module.disable()
+    labels = {"schema": "modeling_input", "version": "1.0.0"}
+    snapshot = recorder.snapshot()
+    assert snapshot.counter("raven_schemas_registry_total", result="miss", **labels)
+    assert snapshot.histogram("raven_schemas_validator_build_seconds", **labels).count
+
+
+def test_histogram_buckets():
+    recorder = module.Metrics(buckets=[0.1, 0.01, 1])
+    for value in [0.001, 0.01, 0.5, 2]:
+        recorder.observe("h", value, a="b")
+    histogram = recorder.snapshot().histogram("h", a="b")
+    assert histogram.buckets == (0.01, 0.1, 1)
+    # Bounds are inclusive
+    assert histogram.counts == (2, 0, 1, 1)
+    assert histogram.count == 4
+    assert histogram.sum == pytest.approx(2.511)
+
+
+def test_prometheus_text():
+    recorder = module.Metrics(buckets=[0.01, 0.1])
+    recorder.increment("raven_schemas_documents_total", schema="a", outcome="valid")
+    recorder.increment("raven_schemas_documents_total", 2, schema="a", outcome="valid")
+    recorder.increment("other_total", label='quote " and \\ and \n')
+    recorder.observe("raven_schemas_validation_seconds", 0.05, schema="a", version="1")
+    assert module.prometheus_text(recorder.snapshot()).splitlines() == [
+        "# TYPE other_total counter",
+        'other_total{label="quote \\" and \\\\ and \\n"} 1',
+        "# HELP raven_schemas_documents_total "
+        + module.HELP["raven_schemas_documents_total"],
+        "# TYPE raven_schemas_documents_total counter",
+        'raven_schemas_documents_total{outcome="valid",schema="a"} 3',
+        "# HELP raven_schemas_validation_seconds "
+        + module.HELP["raven_schemas_validation_seconds"],
+        "# TYPE raven_schemas_validation_seconds histogram",
+        'raven_schemas_validation_seconds_bucket{schema="a",version="1",le="0.01"} 0',
+        'raven_schemas_validation_seconds_bucket{schema="a",version="1",le="0.1"} 1',
+        'raven_schemas_validation_seconds_bucket{schema="a",version="1",le="+Inf"} 1',
+        'raven_schemas_validation_seconds_sum{schema="a",version="1"} 0.05',
+        'raven_schemas_validation_seconds_count{schema="a",version="1"} 1',
+    ]
+
+
+def test_prometheus_file_sink(tmp_path):
+    path = tmp_path / "raven_schemas.prom"
+    recorder = module.Metrics([module.PrometheusFileSink(path)])
+    recorder.increment("a_total")
+    assert not path.exists()
+    recorder.flush()
+    assert path.read_text() == "# TYPE a_total counter\na_total 1\n"
+    recorder.increment("a_total")
+    recorder.close()
+    assert path.read_text() == "# TYPE a_total counter\na_total 2\n"
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_statsd_sink():
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(("127.0.0.1", 0))
+    server.settimeout(5)
+    try:
+        sink = module.StatsdSink(*server.getsockname(), max_packet=100)
+        recorder = module.Metrics([sink])
+        recorder.increment(
+            "validations_total", schema="modeling_input", version="2.0.0"
+        )
+        recorder.observe("validation_seconds", 0.0015, version="2.0.0")
+        # Doesn't fit in the first packet, which is sent
+        recorder.increment("documents_total", 3, outcome="valid")
+        assert server.recv(1000).decode().splitlines() == [
+            "validations_total.modeling_input.2_0_0:1|c",
+            "validation_seconds.2_0_0:1.500|ms",
+        ]
+        recorder.close()
+        assert server.recv(1000) == b"documents_total.valid:3|c"
+    finally:
+        server.close()
+
+
+def test_statsd_sink__unreachable():
+    sink = module.StatsdSink("127.0.0.1", 9)
+    recorder = module.Metrics([sink])
+    recorder.increment("a_total")
+    recorder.close()
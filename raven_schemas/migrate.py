@@ -0,0 +1,424 @@
+"""Upgrade documents to a later version of their schema, one version at a time.
+
+Each step upgrades a document from one version to the next (see modeling_input_versions.md) and
+is written as a JSON Patch. The patch is checked against the step's target version like any
+patch of a validated document (see incremental.py): only the values it changes, and the rules
+that read them, are re-checked. The fields a step doesn't touch are the same in both versions,
+so a document is only validated in full once, at the target version. That final validation
+also catches documents that weren't valid at their source version, and documents that break
+rules added along the way (eg. the survey combination rules of 1.1.0), which no step can fix.
+
+Some versions need data the previous version doesn't have (eg. survey.structure.solar_panels,
+required since 1.2.0): a step takes it from the defaults given to migrate(), keyed by JSON
+pointer, and fails when there's none. So do values that a version dropped with no equivalent
+(eg. the "Cooktop only" cooking type of 1.1.1), rather than losing them silently.
+"""
+import json
+import os
+import time
+from collections import Counter, deque
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+import jsonschema
+
+from raven_schemas import incremental, schemas, validate
+from raven_schemas.constants import DEFAULT_CHUNKSIZE
+
+# JSON Patch operations
+Operations = List[Dict[str, Any]]
+# JSON pointer -> value to use where a later version requires data an earlier one doesn't have
+Defaults = Dict[str, Any]
+
+_MISSING = object()
+
+
+class MigrationError(ValueError):
+    pass
+
+
+class Step(NamedTuple):
+    source: str
+    target: str
+    # The document (at the source version) -> the patch that upgrades it
+    upgrade: Callable[[dict, Defaults], Operations]
+
+
+def _get(document: Any, *keys: str) -> Any:
+    for key in keys:
+        if not isinstance(document, dict) or key not in document:
+            return _MISSING
+        document = document[key]
+    return document
+
+
+def _pointer(*keys: str) -> str:
+    return "".join("/" + key.replace("~", "~0").replace("/", "~1") for key in keys)
+
+
+def _rename_value(
+    document: dict, keys: List[str], renames: Dict[Any, Any]
+) -> Operations:
+    value = _get(document, *keys)
+    if value is _MISSING or not isinstance(value, str) or value not in renames:
+        return []
+    return [{"op": "replace", "path": _pointer(*keys), "value": renames[value]}]
+
+
+def _remove(document: dict, *keys: str) -> Operations:
+    if _get(document, *keys) is _MISSING:
+        return []
+    return [{"op": "remove", "path": _pointer(*keys)}]
+
+
+def _default(document: dict, defaults: Defaults, *keys: str) -> Operations:
+    """Add a property that later versions require, where its parent object exists"""
+    if _get(document, *keys) is not _MISSING or not isinstance(
+        _get(document, *keys[:-1]), dict
+    ):
+        return []
+    pointer = _pointer(*keys)
+    if pointer not in defaults:
+        raise MigrationError(
+            f"{pointer} has no equivalent in earlier versions, pass a default for it"
+        )
+    return [{"op": "add", "path": pointer, "value": defaults[pointer]}]
+
+
+def _replace_dropped(
+    document: dict, defaults: Defaults, keys: List[str], dropped: List[str]
+) -> Operations:
+    """Replace a value that later versions dropped with no equivalent by its default"""
+    value = _get(document, *keys)
+    if value is _MISSING or not isinstance(value, str) or value not in dropped:
+        return []
+    pointer = _pointer(*keys)
+    if pointer not in defaults:
+        raise MigrationError(
+            f"{pointer} is {value!r}, which has no equivalent in later versions, "
+            "pass a default for it"
+        )
+    return [{"op": "replace", "path": pointer, "value": defaults[pointer]}]
+
+
+def _survey_version(document: dict, version: str) -> Operations:
+    if not isinstance(_get(document, "survey"), dict):
+        return []
+    return [
+        {
+            "op": "add",
+            "path": _pointer("survey", "survey_schema_version"),
+            "value": version,
+        }
+    ]
+
+
+def _version_only(document: dict, defaults: Defaults) -> Operations:
+    return []
+
+
+def _to_1_1_2(document: dict, defaults: Defaults) -> Operations:
+    return [
+        *_rename_value(
+            document,
+            ["survey", "structure", "attic_type", "estimated_insulation_depth"],
+            {"0-4 inches": "<4 inches"},
+        ),
+        *_replace_dropped(
+            document,
+            defaults,
+            ["survey", "appliances", "cooking", "type"],
+            ["Cooktop only", "Oven only"],
+        ),
+        *_survey_version(document, "1.0.1"),
+    ]
+
+
+def _to_1_1_4(document: dict, defaults: Defaults) -> Operations:
+    return [
+        *_remove(document, "survey", "systems", "primary_heating", "dist_type"),
+        *_survey_version(document, "1.0.2"),
+    ]
+
+
+def _to_1_1_5(document: dict, defaults: Defaults) -> Operations:
+    return [
+        *_rename_value(
+            document,
+            ["survey", "systems", "cooling", "type"],
+            {"Condenser": "Central AC"},
+        ),
+        *_survey_version(document, "1.0.3"),
+    ]
+
+
+def _to_1_2_0(document: dict, defaults: Defaults) -> Operations:
+    return [
+        *_default(document, defaults, "survey", "structure", "solar_panels"),
+        *_survey_version(document, "1.0.4"),
+    ]
+
+
+def _to_2_0_0(document: dict, defaults: Defaults) -> Operations:
+    return [
+        *_remove(document, "survey", "structure", "most_windows"),
+        *_remove(document, "survey", "structure", "primary_siding_material"),
+        *_remove(
+            document, "survey", "structure", "foundation_under_main_floor_space", "type"
+        ),
+        *_survey_version(document, "1.0.5"),
+    ]
+
+
+STEPS: Dict[str, List[Step]] = {
+    "modeling_input": [
+        Step("1.0.0", "1.0.1", _version_only),
+        Step("1.0.1", "1.1.0", _version_only),
+        Step("1.1.0", "1.1.1", _version_only),
+        Step("1.1.1", "1.1.2", _to_1_1_2),
+        Step("1.1.2", "1.1.3", _version_only),
+        Step("1.1.3", "1.1.4", _to_1_1_4),
+        Step("1.1.4", "1.1.5", _to_1_1_5),
+        Step("1.1.5", "1.2.0", _to_1_2_0),
+        Step("1.2.0", "2.0.0", _to_2_0_0),
+    ]
+}
+
+
+def steps_between(schema_name: str, source: str, target: str) -> List[Step]:
+    """The chain of steps that upgrades documents from source to target
+    @raises MigrationError if there is none.
+    """
+    steps = STEPS.get(schema_name, [])
+    sources = [step.source for step in steps]
+    targets = [step.target for step in steps]
+    if source == target:
+        return []
+    if source not in sources or target not in targets:
+        raise MigrationError(
+            f"Can't migrate {schema_name} documents from version {source} to {target}"
+        )
+    start, end = sources.index(source), targets.index(target)
+    if start > end:
+        raise MigrationError(
+            f"Can't migrate {schema_name} documents from version {source} down to {target}"
+        )
+    return steps[start : end + 1]
+
+
+def source_version(document: Any) -> Optional[str]:
+    """The version a document declares, if any"""
+    version = _get(document, "input_schema_version")
+    return version if isinstance(version, str) else None
+
+
+def migrate(
+    document: dict,
+    schema_name: str,
+    target: str,
+    defaults: Optional[Defaults] = None,
+) -> dict:
+    """Upgrade a document to the target version. The document itself isn't modified.
+    @raises MigrationError if a step fails, or the result isn't valid for the target version.
+    """
+    defaults = defaults or {}
+    source = source_version(document)
+    if source is None:
+        raise MigrationError("Document has no input_schema_version")
+    for step in steps_between(schema_name, source, target):
+        operations = step.upgrade(document, defaults)
+        operations.append(
+            {"op": "replace", "path": "/input_schema_version", "value": step.target}
+        )
+        handle = incremental.ValidatedDocument.assume_valid(
+            document, schema_name, step.target
+        )
+        try:
+            result = handle.patch(operations, max_errors=1)
+        except incremental.PatchError as e:
+            raise MigrationError(f"Upgrading from {step.source} to {step.target}: {e}")
+        if not result.is_valid:
+            raise MigrationError(
+                f"Upgrading from {step.source} to {step.target}: {result.errors[0]}"
+            )
+        document = result.document.document
+    validator = validate.registry.get(schema_name, target)
+    error = jsonschema.exceptions.best_match(validator.iter_errors(document))
+    if error is not None:
+        raise MigrationError(
+            f"Migrated from {source}, not valid for {target}: "
+            f"{validate.ErrorDetail.from_error(target, error)}"
+        )
+    return document
+
+
+class MigrationResult(NamedTuple):
+    # The upgraded document, if the migration succeeded
+    document: Optional[dict]
+    source_version: Optional[str]
+    error: Optional[str] = None
+
+    @property
+    def is_migrated(self) -> bool:
+        return self.error is None
+
+
+def migrate_record(
+    record: validate.Record,
+    schema_name: str,
+    target: str,
+    defaults: Optional[Defaults] = None,
+) -> MigrationResult:
+    """migrate() for a single record, reporting failures in the result instead of raising.
+    Raw JSON records are parsed first; parse errors are reported as failures too.
+    """
+    if isinstance(record, (str, bytes, bytearray)):
+        try:
+            record = json.loads(record)
+        except ValueError as e:
+            return MigrationResult(None, None, f"Invalid JSON: {e}")
+    source = source_version(record)
+    try:
+        return MigrationResult(migrate(record, schema_name, target, defaults), source)
+    except MigrationError as e:
+        return MigrationResult(None, source, str(e))
+
+
+def _warm_worker(schema_name: str, target: str) -> None:
+    versions = schemas.get_known_schemas_and_versions()[schema_name]
+    validate.registry.preload(schema_name, versions[: versions.index(target) + 1])
+
+
+def _migrate_chunk(
+    records: List[validate.Record],
+    schema_name: str,
+    target: str,
+    defaults: Optional[Defaults],
+) -> List[MigrationResult]:
+    return [migrate_record(record, schema_name, target, defaults) for record in records]
+
+
+def migrate_many(
+    records: Iterable[validate.Record],
+    schema_name: str,
+    target: str,
+    defaults: Optional[Defaults] = None,
+    workers: Optional[int] = None,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    max_in_flight: Optional[int] = None,
+) -> Iterator[MigrationResult]:
+    """Migrate many records across a pool of worker processes, yielding one result per record,
+    in order. Records are consumed lazily, like validate.validate_many.
+    """
+    if target not in schemas.get_known_schemas_and_versions().get(schema_name, []):
+        raise ValueError(f"Schema {schema_name} version {target} not found")
+    if chunksize < 1:
+        raise ValueError(f"chunksize must be at least 1, got {chunksize}")
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if workers <= 1:
+        _warm_worker(schema_name, target)
+        for record in records:
+            yield migrate_record(record, schema_name, target, defaults)
+        return
+
+    yield from validate.map_chunks(
+        _migrate_chunk,
+        validate.chunked(records, chunksize),
+        (schema_name, target, defaults),
+        workers,
+        max_in_flight,
+        initializer=_warm_worker,
+        initargs=(schema_name, target),
+    )
+
+
+class MigrationSummary:
+    """Running counts of a bulk migration"""
+
+    def __init__(self):
+        self.total = 0
+        self.failures = 0
+        # source version -> records migrated from it
+        self.by_source: Counter = Counter()
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def add(self, result: MigrationResult) -> None:
+        self.total += 1
+        if result.is_migrated:
+            self.by_source[result.source_version] += 1
+        else:
+            self.failures += 1
+
+    def finish(self) -> None:
+        self.elapsed = time.perf_counter() - self.started
+
+    def render(self) -> str:
+        rate = self.total / self.elapsed if self.elapsed else 0.0
+        lines = [
+            f"Migrated {self.total - self.failures} of {self.total} records in "
+            f"{self.elapsed:.2f}s ({rate:.1f} records/s)"
+        ]
+        for version, count in sorted(self.by_source.items()):
+            lines.append(f"  from {version}: {count}")
+        lines.append(f"  failed: {self.failures}")
+        return "\n".join(lines)
+
+
+def migrate_stream(
+    raw_records: Iterable[Tuple[str, validate.Record]],
+    schema_name: str,
+    target: str,
+    output: IO[str],
+    failures: Optional[IO[str]] = None,
+    defaults: Optional[Defaults] = None,
+    workers: Optional[int] = None,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+) -> MigrationSummary:
+    """Migrate (record id, record) pairs in parallel, writing the migrated documents to output
+    one per line, in order. Records that can't be migrated are left out, and written to failures
+    with their id and error.
+    """
+    record_ids: Deque[str] = deque()
+
+    def records() -> Iterator[validate.Record]:
+        for record_id, record in raw_records:
+            record_ids.append(record_id)
+            yield record
+
+    dumps = json.JSONEncoder(separators=(",", ":")).encode
+    summary = MigrationSummary()
+    for result in migrate_many(
+        records(), schema_name, target, defaults, workers=workers, chunksize=chunksize
+    ):
+        record_id = record_ids.popleft()
+        summary.add(result)
+        if result.is_migrated:
+            output.write(dumps(result.document))
+            output.write("\n")
+        elif failures is not None:
+            failures.write(
+                dumps(
+                    {
+                        "record_id": record_id,
+                        "source_version": result.source_version,
+                        "error": result.error,
+                    }
+                )
+            )
+            failures.write("\n")
+    summary.finish()
+    return summary
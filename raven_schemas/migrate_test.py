@@ -0,0 +1,139 @@
+import copy
+import io
+import json
+
+import pytest
+
+from raven_schemas import generator
+from raven_schemas import migrate as module
+from raven_schemas import schemas, validate
+from raven_schemas.constants import PACKAGE_DIR
+
+VERSIONS = schemas.get_known_schemas_and_versions()["modeling_input"]
+MIGRATABLE = VERSIONS[VERSIONS.index("1.0.0") :]
+SOLAR_PANELS = {"/survey/structure/solar_panels": {"present": False}}
+COOKING = {"/survey/appliances/cooking/type": None}
+
+
+def _sample(version):
+    with open(
+        PACKAGE_DIR
+        / f"schemas/modeling_input_{version.replace('.', '_')}_sample_valid.json"
+    ) as modeling_input:
+        return json.load(modeling_input)
+
+
+@pytest.mark.parametrize("version", MIGRATABLE)
+def test_migrate__samples(version):
+    document = _sample(version)
+    original = copy.deepcopy(document)
+    migrated = module.migrate(document, "modeling_input", "2.0.0", SOLAR_PANELS)
+    assert document == original
+    assert validate.find_valid_versions(migrated, "modeling_input", VERSIONS) == [
+        "2.0.0"
+    ]
+    assert migrated["survey"]["survey_schema_version"] == "1.0.5"
+
+
+def test_migrate__steps():
+    document = _sample("1.1.1")
+    document["survey"]["structure"]["attic_type"] = {
+        "estimated_insulation_depth": "0-4 inches",
+        "insulation": None,
+        "insulation_material": "cellulose",
+        "type": "Vented",
+    }
+    document["survey"]["appliances"]["cooking"]["type"] = "Cooktop only"
+    # The value has no equivalent in 1.1.2, it's only replaced when asked to
+    with pytest.raises(
+        module.MigrationError,
+        match="/survey/appliances/cooking/type is 'Cooktop only', .* pass a default",
+    ):
+        module.migrate(document, "modeling_input", "1.1.4")
+    migrated = module.migrate(document, "modeling_input", "1.1.4", COOKING)
+    assert migrated["input_schema_version"] == "1.1.4"
+    assert migrated["survey"]["survey_schema_version"] == "1.0.2"
+    structure = migrated["survey"]["structure"]
+    assert structure["attic_type"]["estimated_insulation_depth"] == "<4 inches"
+    assert migrated["survey"]["appliances"]["cooking"]["type"] is None
+    assert "dist_type" not in migrated["survey"]["systems"]["primary_heating"]
+    assert migrated["survey"]["systems"]["cooling"]["type"] == "Condenser"
+
+    migrated = module.migrate(migrated, "modeling_input", "2.0.0", SOLAR_PANELS)
+    assert migrated["survey"]["systems"]["cooling"]["type"] == "Central AC"
+    structure = migrated["survey"]["structure"]
+    assert structure["solar_panels"] == {"present": False}
+    assert "most_windows" not in structure
+    assert "primary_siding_material" not in structure
+    assert "type" not in structure["foundation_under_main_floor_space"]
+
+
+def test_migrate__errors():
+    with pytest.raises(module.MigrationError, match="pass a default"):
+        module.migrate(_sample("1.1.5"), "modeling_input", "1.2.0")
+    with pytest.raises(module.MigrationError, match="no input_schema_version"):
+        module.migrate({}, "modeling_input", "2.0.0")
+    with pytest.raises(module.MigrationError, match="down to"):
+        module.migrate(_sample("1.2.0"), "modeling_input", "1.1.0")
+    with pytest.raises(module.MigrationError):
+        module.migrate(
+            _sample("0.0.0") | {"input_schema_version": "0.0.0"},
+            "modeling_input",
+            "2.0.0",
+        )
+    # The document is fully validated once, at the target version
+    document = _sample("1.1.4")
+    document["city"] = 1
+    with pytest.raises(module.MigrationError, match=r"not valid for 2.0.0: .*\$\.city"):
+        module.migrate(document, "modeling_input", "2.0.0", SOLAR_PANELS)
+
+
+@pytest.mark.parametrize("version", MIGRATABLE[MIGRATABLE.index("1.1.0") :])
+def test_migrate__generated_documents(version):
+    documents = generator.DocumentGenerator("modeling_input", version, seed=0)
+    for _ in range(20):
+        result = module.migrate_record(
+            documents.document(), "modeling_input", "2.0.0", SOLAR_PANELS | COOKING
+        )
+        assert result.is_migrated, result.error
+        assert result.source_version == version
+
+
+def test_migrate_record():
+    result = module.migrate_record(b"{", "modeling_input", "2.0.0")
+    assert not result.is_migrated
+    assert result.error.startswith("Invalid JSON")
+    result = module.migrate_record(
+        json.dumps(_sample("1.2.0")), "modeling_input", "2.0.0"
+    )
+    assert result.is_migrated
+    assert result.source_version == "1.2.0"
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_migrate_stream(workers):
+    records = [
+        (str(i), json.dumps(_sample(version)))
+        for i, version in enumerate(["1.1.0", "1.2.0", "1.1.5", "2.0.0"])
+    ]
+    output, failures = io.StringIO(), io.StringIO()
+    summary = module.migrate_stream(
+        records,
+        "modeling_input",
+        "2.0.0",
+        output,
+        failures,
+        workers=workers,
+        chunksize=1,
+    )
+    assert (summary.total, summary.failures) == (4, 2)
+    assert summary.by_source == {"1.2.0": 1, "2.0.0": 1}
+    assert [
+        json.loads(line)["input_schema_version"]
+        for line in output.getvalue().splitlines()
+    ] == ["2.0.0", "2.0.0"]
+    assert [
+        (failure["record_id"], failure["source_version"])
+        for failure in map(json.loads, failures.getvalue().splitlines())
+    ] == [("0", "1.1.0"), ("2", "1.1.5")]
+    assert "Migrated 2 of 4 records" in summary.render()
@@ -0,0 +1,87 @@
+"""Validate a document against every version of a schema in a single pass.
+
+All versions of a schema are compiled into one module (see codegen) in which identical
+subschemas share a function. The versions' entry points are then run against the document
+with one shared memo, so a subtree that several versions have in common (eg. the survey
+appliances of 1.1.x-2.0.0) is checked once per document, and every version reuses the result.
+"""
+import functools
+from typing import Dict, List, NamedTuple, Optional
+
+from raven_schemas import codegen, discriminators, schemas, validate
+
+
+class MultiVersionResult(NamedTuple):
+    valid_versions: List[str]
+    # version -> error message, for the versions that didn't validate
+    errors: Dict[str, str]
+
+
+class MultiVersionValidator:
+    def __init__(self, schema_name: str, versions: Optional[List[str]] = None):
+        if versions is None:
+            versions = schemas.get_known_schemas_and_versions()[schema_name]
+        self.schema_name = schema_name
+        self.versions = list(versions)
+        self._validators = codegen.load_validators(
+            schema_name, tuple(self.versions), memoize=True
+        )
+        self._index = discriminators.get_discriminator_index(schema_name)
+
+    def validate(
+        self,
+        data: dict,
+        versions: Optional[List[str]] = None,
+    ) -> MultiVersionResult:
+        """Return the versions that accept the document, and an error for each of the others.
+        Defaults to all the versions this validator was built for.
+        """
+        if versions is None:
+            versions = self.versions
+        candidates, errors = self._index.partition(data, versions)
+        # Keyed by the ids of the document's subtrees, so it can't outlive this call: once
+        # the document is freed, its ids can be reused by other objects
+        memo: dict = {}
+        valid_versions = []
+        for version in candidates:
+            try:
+                validator = self._validators[version]
+            except KeyError:
+                raise ValueError(
+                    f"Schema {self.schema_name} version {version} not found"
+                )
+            error = validator(data, memo)
+            if error is None:
+                valid_versions.append(version)
+            else:
+                errors[version] = error
+        # Keep the caller's version order
+        return MultiVersionResult(
+            valid_versions, {v: errors[v] for v in versions if v in errors}
+        )
+
+
+@functools.cache
+def get_validator(schema_name: str) -> MultiVersionValidator:
+    """Validator for every known version of the schema, built once"""
+    return MultiVersionValidator(schema_name)
+
+
+def find_valid_versions(
+    json_data: dict, schema_name: str, versions: List[str]
+) -> List[str]:
+    """Single-pass equivalent of validate.find_valid_versions
+    @raises validate.ValidationError if none of the versions validate.
+    """
+    if not versions:
+        raise ValueError(f"Errors validating {schema_name}: no versions provided")
+    result = get_validator(schema_name).validate(json_data, versions)
+    if result.valid_versions:
+        return result.valid_versions
+    raise validate.ValidationError(
+        f"Errors validating {schema_name}:\n"
+        + "\n  ".join(
+            f"Version {version}: {message}"
+            for version, message in result.errors.items()
+        )
+    )
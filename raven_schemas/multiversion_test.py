@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+from raven_schemas import multiversion as module
+from raven_schemas import schemas, validate
+from raven_schemas.codegen_test import _mutations
+from raven_schemas.constants import SCHEMA_DIR
+
+VERSIONS = schemas.get_known_schemas_and_versions()["modeling_input"]
+SAMPLE_FILES = sorted(SCHEMA_DIR.glob("modeling_input_*_sample_*.json"))
+
+
+def _expected_valid_versions(data):
+    try:
+        return validate.find_valid_versions(data, "modeling_input", VERSIONS)
+    except validate.ValidationError:
+        return []
+
+
+@pytest.mark.parametrize("sample_file", SAMPLE_FILES, ids=lambda f: f.name)
+def test_same_valid_versions_as_find_valid_versions(sample_file):
+    data = json.loads(sample_file.read_text())
+    result = module.get_validator("modeling_input").validate(data)
+    assert result.valid_versions == _expected_valid_versions(data)
+    assert set(result.errors) == set(VERSIONS) - set(result.valid_versions)
+
+
+def test_same_valid_versions_on_mutations():
+    validator = module.get_validator("modeling_input")
+    sample = json.loads(
+        (SCHEMA_DIR / "modeling_input_1_1_2_sample_valid.json").read_text()
+    )
+    # Make the document plausible for 1.1.3 too, so that several versions get a full check
+    for mutated in _mutations(sample):
+        for version in ("1.1.2", "1.1.3"):
+            mutated["input_schema_version"] = version
+            result = validator.validate(mutated, ["1.1.2", "1.1.3"])
+            assert result.valid_versions == [
+                v
+                for v in ("1.1.2", "1.1.3")
+                if validate.registry.get("modeling_input", v).is_valid(mutated)
+            ]
+
+
+def test_find_valid_versions__errors():
+    with pytest.raises(validate.ValidationError, match="Version 1.0.0"):
+        module.find_valid_versions({"invalid": "data"}, "modeling_input", ["1.0.0"])
+    with pytest.raises(ValueError):
+        module.find_valid_versions({}, "modeling_input", [])
+    with pytest.raises(ValueError):
+        module.find_valid_versions({}, "modeling_input", ["9.9.9"])
@@ -0,0 +1,249 @@
+"""Rewrite schemas into equivalent ones that are cheaper for jsonschema to check.
+
+Rewrites:
+- oneOf/anyOf whose branches only check disjoint types (eg. `oneOf: [{type: number}, {type: null}]`)
+  become a single type array: oneOf otherwise has to evaluate every branch to prove exclusivity
+- enums of only booleans and null (eg. `enum: [true, false, null]`) become a type array
+- duplicate enum values are dropped, and identical enums share a single list, so that the
+  hash set that optimized_validator builds for an enum is built once
+- allOf branches that are themselves only an allOf are flattened into their parent
+
+Validators from optimized_validator look strings up in a hash set built once per enum, instead
+of scanning the enum's list, and look the allOf rules of an object up in a decision table (see
+decision_tables.py) instead of evaluating each rule. Error messages can differ from the
+original schema's, and schema paths in errors point into the optimized schema; validity doesn't
+change (see check_equivalence).
+"""
+import functools
+import json
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import jsonschema
+
+from raven_schemas import codegen, decision_tables, schemas
+from raven_schemas.constants import SCHEMA_DIR
+
+# The standard enum keyword, for what optimized validators don't look up in a set
+_standard_enum = jsonschema.Draft202012Validator.VALIDATORS["enum"]
+# Pairs of types that share instances (JSON Schema integers are also numbers)
+_OVERLAPPING_TYPES = {frozenset(["integer", "number"])}
+# Keywords whose value is a subschema, a list of subschemas, or a map of them
+_SUBSCHEMA = {
+    "items",
+    "additionalProperties",
+    "not",
+    "if",
+    "then",
+    "else",
+    "contains",
+    "propertyNames",
+    "unevaluatedItems",
+    "unevaluatedProperties",
+}
+_SUBSCHEMA_LISTS = {"allOf", "anyOf", "oneOf", "prefixItems"}
+_SUBSCHEMA_MAPS = {"properties", "patternProperties", "$defs", "dependentSchemas"}
+
+
+def _types(schema: Any) -> Optional[List[str]]:
+    """The types of a branch that checks nothing but its type, else None"""
+    if not isinstance(schema, dict):
+        return None
+    if set(schema) - codegen.ANNOTATION_KEYWORDS != {"type"}:
+        return None
+    types = schema["type"]
+    return [types] if isinstance(types, str) else list(types)
+
+
+def _disjoint(branches: List[List[str]]) -> bool:
+    seen: List[str] = []
+    for types in branches:
+        for t in types:
+            if t in seen or any(frozenset([t, s]) in _OVERLAPPING_TYPES for s in seen):
+                return False
+        seen.extend(types)
+    return True
+
+
+def _dedupe(values: Iterable[Any]) -> List[Any]:
+    """Distinct enum values, in order. True/1 and False/0 are different in JSON Schema."""
+    seen = set()
+    result = []
+    for value in values:
+        key = json.dumps(value, sort_keys=True)
+        if key not in seen:
+            seen.add(key)
+            result.append(value)
+    return result
+
+
+class _Optimizer:
+    def __init__(self):
+        # canonical enum -> the list every identical enum shares
+        self._enums: Dict[str, List[Any]] = {}
+
+    def schema(self, schema: Any) -> Any:
+        if not isinstance(schema, dict):
+            return schema
+        result = {key: self._keyword(key, value) for key, value in schema.items()}
+
+        for keyword in ("oneOf", "anyOf"):
+            branches = result.get(keyword)
+            if not isinstance(branches, list) or "type" in result or not branches:
+                continue
+            branch_types = [_types(branch) for branch in branches]
+            if any(types is None for types in branch_types):
+                continue
+            # anyOf only needs one branch to match; oneOf needs exactly one, which disjoint
+            # types guarantee
+            if keyword == "oneOf" and not _disjoint(branch_types):
+                continue
+            del result[keyword]
+            result["type"] = _dedupe(t for types in branch_types for t in types)
+
+        enum = result.get("enum")
+        if isinstance(enum, list):
+            types = _enum_types(enum)
+            if types is not None:
+                del result["enum"]
+                result["type"] = _intersect(result.get("type"), types)
+            else:
+                result["enum"] = self._shared_enum(enum)
+
+        if isinstance(result.get("allOf"), list):
+            flattened = []
+            for branch in result["allOf"]:
+                if (
+                    isinstance(branch, dict)
+                    and set(branch) - codegen.ANNOTATION_KEYWORDS == {"allOf"}
+                    and isinstance(branch["allOf"], list)
+                ):
+                    flattened.extend(branch["allOf"])
+                else:
+                    flattened.append(branch)
+            result["allOf"] = flattened
+        return result
+
+    def _keyword(self, key: str, value: Any) -> Any:
+        if key in _SUBSCHEMA:
+            return self.schema(value)
+        if key in _SUBSCHEMA_LISTS and isinstance(value, list):
+            return [self.schema(sub) for sub in value]
+        if key in _SUBSCHEMA_MAPS and isinstance(value, dict):
+            return {name: self.schema(sub) for name, sub in value.items()}
+        return value
+
+    def _shared_enum(self, enum: List[Any]) -> List[Any]:
+        enum = _dedupe(enum)
+        return self._enums.setdefault(json.dumps(enum, sort_keys=True), enum)
+
+
+def _enum_types(enum: List[Any]) -> Optional[List[str]]:
+    """The types an enum of booleans and null is equivalent to, if it has every value of them"""
+    if not enum or not all(v is None or isinstance(v, bool) for v in enum):
+        return None
+    has_true = any(v is True for v in enum)
+    has_false = any(v is False for v in enum)
+    if has_true != has_false:
+        return None
+    return (["boolean"] if has_true else []) + (["null"] if None in enum else [])
+
+
+def _intersect(existing: Any, types: List[str]) -> Any:
+    if existing is None:
+        return types
+    existing = [existing] if isinstance(existing, str) else existing
+    return [t for t in types if t in existing]
+
+
+def iter_subschemas(
+    schema: Any, path: Tuple[str, ...] = ()
+) -> Iterator[Tuple[Tuple[str, ...], dict]]:
+    """Every object schema within a schema (itself included), with its path from the root"""
+    if not isinstance(schema, dict):
+        return
+    yield path, schema
+    for key, value in schema.items():
+        if key in _SUBSCHEMA:
+            yield from iter_subschemas(value, path + (key,))
+        elif key in _SUBSCHEMA_LISTS and isinstance(value, list):
+            for i, subschema in enumerate(value):
+                yield from iter_subschemas(subschema, path + (key, str(i)))
+        elif key in _SUBSCHEMA_MAPS and isinstance(value, dict):
+            for name, subschema in value.items():
+                yield from iter_subschemas(subschema, path + (key, name))
+
+
+def optimize_schema(schema: Any) -> Any:
+    """An equivalent copy of the schema that is cheaper to check. The original isn't modified."""
+    return _Optimizer().schema(schema)
+
+
+def optimized_validator(
+    schema: Any, cls: Optional[type] = None
+) -> "jsonschema.protocols.Validator":
+    """A validator of the schema that checks strings against enums with a hash lookup, and the
+    allOf rules of objects with decision tables (see decision_tables.py). Both are built here for
+    the schema's enums and allOfs, and kept by a validator class made for this validator only, so
+    they're freed with it. cls defaults to the class for the schema's $schema.
+    """
+    if cls is None:
+        cls = jsonschema.validators.validator_for(
+            schema, default=jsonschema.Draft202012Validator
+        )
+    # id(enum list) -> (the list, the hash set of its strings)
+    string_sets: Dict[int, Tuple[List[Any], frozenset]] = {}
+    tables: decision_tables.Tables = {}
+    for _, subschema in iter_subschemas(schema):
+        enums = subschema.get("enum")
+        if isinstance(enums, list):
+            strings = frozenset(v for v in enums if isinstance(v, str))
+            string_sets[id(enums)] = (enums, strings)
+        all_of = subschema.get("allOf")
+        if isinstance(all_of, list):
+            table = decision_tables.compile_table(subschema)
+            if table is not None:
+                tables[id(all_of)] = (all_of, table)
+
+    def enum(validator, enums, instance, schema):
+        entry = string_sets.get(id(enums))
+        # The entry keeps the list, so its id can't have been reused by another list
+        if entry is not None and entry[0] is enums and isinstance(instance, str):
+            # Strings only equal strings, so set membership is exact
+            if instance not in entry[1]:
+                yield jsonschema.ValidationError(
+                    f"{instance!r} is not one of {enums!r}"
+                )
+            return
+        yield from _standard_enum(validator, enums, instance, schema)
+
+    validator_class = jsonschema.validators.extend(
+        cls, {"enum": enum, "allOf": functools.partial(decision_tables.all_of, tables)}
+    )
+    return validator_class(schema)
+
+
+def check_equivalence(
+    schema_name: str, version: str, documents: Optional[Iterable[Any]] = None
+) -> List[str]:
+    """Validate documents (by default, every shipped sample of the schema) against the original
+    and the optimized schema of a version, describing each document they disagree on.
+    """
+    schema = schemas.load_schema(schema_name, version)
+    original = jsonschema.Draft202012Validator(schema)
+    optimized = optimized_validator(optimize_schema(schema))
+    if documents is None:
+        documents = (
+            (path.name, json.loads(path.read_text()))
+            for path in sorted(SCHEMA_DIR.glob(f"{schema_name}_*_sample_*.json"))
+        )
+    else:
+        documents = ((f"document {i}", doc) for i, doc in enumerate(documents))
+    disagreements = []
+    for name, document in documents:
+        expected, actual = original.is_valid(document), optimized.is_valid(document)
+        if expected != actual:
+            disagreements.append(
+                f"{schema_name} {version}: {name} is {'valid' if expected else 'invalid'}"
+                f" for the original schema but not for the optimized one"
+            )
+    return disagreements
@@ -0,0 +1,113 @@
+import copy
+import gc
+import json
+import weakref
+
+import jsonschema
+import pytest
+
+from raven_schemas import generator
+from raven_schemas import optimize as module
+from raven_schemas import schemas, validate
+from raven_schemas.constants import SCHEMA_DIR
+
+VERSIONS = schemas.get_known_schemas_and_versions()["modeling_input"]
+
+
+@pytest.mark.parametrize(
+    "schema, expected",
+    [
+        (
+            {"oneOf": [{"type": "number"}, {"type": "null", "$comment": "unknown"}]},
+            {"type": ["number", "null"]},
+        ),
+        # Integers are numbers, so exactly one branch matching isn't guaranteed
+        (
+            {"oneOf": [{"type": "integer"}, {"type": "number"}]},
+            {"oneOf": [{"type": "integer"}, {"type": "number"}]},
+        ),
+        (
+            {"anyOf": [{"type": "integer"}, {"type": ["number", "null"]}]},
+            {"type": ["integer", "number", "null"]},
+        ),
+        (
+            {"oneOf": [{"type": "string"}, {"enum": [1]}]},
+            {"oneOf": [{"type": "string"}, {"enum": [1]}]},
+        ),
+        ({"enum": [True, False, None]}, {"type": ["boolean", "null"]}),
+        ({"enum": [False, True]}, {"type": ["boolean"]}),
+        ({"type": "boolean", "enum": [True, False, None]}, {"type": ["boolean"]}),
+        ({"enum": [True, None]}, {"enum": [True, None]}),
+        # True isn't 1 and False isn't 0
+        ({"enum": ["a", 1, True, "a", 0, False]}, {"enum": ["a", 1, True, 0, False]}),
+        (
+            {"allOf": [{"allOf": [{"required": ["a"]}, {"required": ["b"]}]}, True]},
+            {"allOf": [{"required": ["a"]}, {"required": ["b"]}, True]},
+        ),
+        (
+            {"properties": {"a": {"enum": [True, False]}}, "default": {"enum": [True]}},
+            {"properties": {"a": {"type": ["boolean"]}}, "default": {"enum": [True]}},
+        ),
+    ],
+)
+def test_optimize_schema(schema, expected):
+    original = copy.deepcopy(schema)
+    assert module.optimize_schema(schema) == expected
+    assert schema == original
+
+
+def test_optimize_schema__shares_identical_enums():
+    optimized = module.optimize_schema(
+        {
+            "properties": {
+                "a": {"enum": ["x", "y"]},
+                "b": {"items": {"enum": ["x", "y", "x"]}},
+            }
+        }
+    )
+    properties = optimized["properties"]
+    assert properties["a"]["enum"] is properties["b"]["items"]["enum"]
+
+
+@pytest.mark.parametrize("instance", ["x", "z", 1, None, True, ["x"]])
+def test_optimized_validator__enum(instance):
+    schema = {"enum": ["x", "y", 1, None]}
+    expected = [
+        e.message for e in jsonschema.Draft202012Validator(schema).iter_errors(instance)
+    ]
+    assert [
+        e.message for e in module.optimized_validator(schema).iter_errors(instance)
+    ] == expected
+
+
+def test_optimized_validator__freed_with_its_schema():
+    registry = validate.ValidatorRegistry(prebuilt=False)
+    validator = registry.get("modeling_input", "2.0.0")
+    # The enum sets and decision tables are kept by the validator's own class
+    validator_class = weakref.ref(type(validator))
+    assert type(registry.get("modeling_input", "2.0.0")) is validator_class()
+    del validator
+    registry.clear()
+    gc.collect()
+    assert validator_class() is None
+    other = validate.ValidatorRegistry(prebuilt=False).get("modeling_input", "2.0.0")
+    assert other.is_valid(
+        json.loads((SCHEMA_DIR / "modeling_input_2_0_0_sample_valid.json").read_text())
+    )
+
+
+@pytest.mark.parametrize("version", VERSIONS)
+def test_check_equivalence(version):
+    assert module.check_equivalence("modeling_input", version) == []
+    documents = generator.DocumentGenerator("modeling_input", version, seed=0)
+    generated = [documents.document() for _ in range(20)]
+    generated += [documents.invalid_document()[1] for _ in range(20)]
+    assert module.check_equivalence("modeling_input", version, generated) == []
+
+
+def test_registry__optimize():
+    optimized = validate.ValidatorRegistry().get("modeling_input", "2.0.0")
+    plain = validate.ValidatorRegistry(optimize=False).get("modeling_input", "2.0.0")
+    assert plain.schema == schemas.load_schema("modeling_input", "2.0.0")
+    assert optimized.schema == module.optimize_schema(plain.schema)
+    assert optimized.schema != plain.schema
@@ -0,0 +1,168 @@
+"""Profile where jsonschema spends its time, per schema keyword.
+
+A profiled validator runs every keyword of its schema through a wrapper that counts calls and
+times them. Keywords are identified by their location in the schema (eg.
+'#/properties/survey/allOf' of modeling_input 2.0.0), found from the identity of the subschema
+they're called with. Nested keywords (eg. the rules under an allOf) run while their parent's
+timer is running, so each location gets a total time including them and a self time without.
+
+Timing adds overhead to every keyword call, so times are only meaningful relative to each
+other. Profilers aren't thread-safe. See validate.profiling to profile the registry's validators.
+"""
+import time
+from typing import IO, Any, Callable, Dict, List, NamedTuple, Tuple
+
+import jsonschema
+
+from raven_schemas import optimize
+
+# Frame names can't contain the separators of the collapsed stack format
+_COLLAPSED_ESCAPES = str.maketrans({";": ":", " ": "_"})
+
+
+class KeywordStats:
+    __slots__ = ("calls", "total_ns", "self_ns")
+
+    def __init__(self):
+        self.calls = 0
+        self.total_ns = 0
+        self.self_ns = 0
+
+
+class ProfileRow(NamedTuple):
+    schema: str  # eg. 'modeling_input 2.0.0'
+    location: str  # eg. '#/properties/survey/allOf'
+    calls: int
+    total_ns: int
+    self_ns: int
+
+
+class _Frame:
+    __slots__ = ("key", "stats", "started", "children_ns")
+
+    def __init__(self, key: Tuple[str, str], stats: KeywordStats):
+        self.key = key
+        self.stats = stats
+        self.started = time.perf_counter_ns()
+        self.children_ns = 0
+
+
+class ValidationProfiler:
+    def __init__(self):
+        # (schema, location) -> stats
+        self.stats: Dict[Tuple[str, str], KeywordStats] = {}
+        # Stack of (schema, location) keys -> self time spent with that stack
+        self.stacks: Dict[Tuple[Tuple[str, str], ...], int] = {}
+        # Time spent in keywords called directly by the validators, ie. total validation time
+        self.total_ns = 0
+        self._frames: List[_Frame] = []
+        # id(validator) -> (validator, its profiled copy)
+        self._profiled: Dict[int, Tuple[Any, Any]] = {}
+
+    def instrument(
+        self, validator: "jsonschema.protocols.Validator", name: str
+    ) -> "jsonschema.protocols.Validator":
+        """A copy of the validator that records its keyword calls under the given schema name"""
+        entry = self._profiled.get(id(validator))
+        if entry is not None and entry[0] is validator:
+            return entry[1]
+        locations = {
+            id(subschema): "#" + "".join(f"/{part}" for part in path)
+            for path, subschema in optimize.iter_subschemas(validator.schema)
+        }
+        cls = type(validator)
+        profiled_cls = jsonschema.validators.extend(
+            cls,
+            {
+                keyword: self._wrap(name, keyword, function, locations)
+                for keyword, function in cls.VALIDATORS.items()
+            },
+        )
+        profiled = profiled_cls(validator.schema)
+        self._profiled[id(validator)] = (validator, profiled)
+        return profiled
+
+    def _wrap(
+        self, name: str, keyword: str, function: Callable, locations: Dict[int, str]
+    ) -> Callable:
+        def profiled(validator, value, instance, schema):
+            location = locations.get(id(schema), "#?")
+            key = (name, f"{location}/{keyword}")
+            stats = self.stats.get(key)
+            if stats is None:
+                stats = self.stats[key] = KeywordStats()
+            stats.calls += 1
+            # Keywords are generators: time each step, while the caller asks for errors
+            self._enter(key, stats)
+            try:
+                errors = function(validator, value, instance, schema)
+            finally:
+                self._exit()
+            if errors is None:
+                return
+            errors = iter(errors)
+            while True:
+                self._enter(key, stats)
+                try:
+                    error = next(errors)
+                except StopIteration:
+                    return
+                finally:
+                    self._exit()
+                yield error
+
+        return profiled
+
+    def _enter(self, key: Tuple[str, str], stats: KeywordStats) -> None:
+        self._frames.append(_Frame(key, stats))
+
+    def _exit(self) -> None:
+        frame = self._frames[-1]
+        elapsed = time.perf_counter_ns() - frame.started
+        self_ns = elapsed - frame.children_ns
+        frame.stats.total_ns += elapsed
+        frame.stats.self_ns += self_ns
+        stack = tuple(f.key for f in self._frames)
+        self.stacks[stack] = self.stacks.get(stack, 0) + self_ns
+        self._frames.pop()
+        if self._frames:
+            self._frames[-1].children_ns += elapsed
+        else:
+            self.total_ns += elapsed
+
+    def rows(self) -> List[ProfileRow]:
+        """Stats per keyword location, most total time first"""
+        rows = [
+            ProfileRow(schema, location, stats.calls, stats.total_ns, stats.self_ns)
+            for (schema, location), stats in self.stats.items()
+        ]
+        rows.sort(key=lambda row: (-row.total_ns, row.schema, row.location))
+        return rows
+
+    def format_table(self, limit: int = 30) -> str:
+        """The keyword locations that took the most time, with their share of the total"""
+        total = self.total_ns or 1
+        lines = [
+            f"{'calls':>8} {'total ms':>10} {'self ms':>10} {'total %':>8}  location",
+        ]
+        for row in self.rows()[:limit]:
+            lines.append(
+                f"{row.calls:>8} {row.total_ns / 1e6:>10.3f} {row.self_ns / 1e6:>10.3f}"
+                f" {100 * row.total_ns / total:>7.1f}%  {row.schema} {row.location}"
+            )
+        return "\n".join(lines)
+
+    def write_collapsed(self, stream: IO[str]) -> None:
+        """Write the self time (in microseconds) of every keyword stack in the collapsed stack
+        format read by flamegraph.pl, speedscope and others:
+        'modeling_input_2.0.0;#/properties;#/properties/survey/allOf 1234'
+        """
+        for stack, self_ns in sorted(self.stacks.items()):
+            microseconds = round(self_ns / 1e3)
+            if not microseconds:
+                continue
+            frames = [stack[0][0]] + [location for _, location in stack]
+            stream.write(
+                ";".join(frame.translate(_COLLAPSED_ESCAPES) for frame in frames)
+                + f" {microseconds}\n"
+            )
@@ -0,0 +1,110 @@
+import io
+import json
+
+import jsonschema
+import pytest
+
+from raven_schemas import profiler as module
+from raven_schemas import schemas, validate
+from raven_schemas.constants import PACKAGE_DIR
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "a": {"type": "integer", "minimum": 0},
+        "b": {"allOf": [{"type": "string"}, {"enum": ["x", "y"]}]},
+    },
+}
+
+
+@pytest.fixture
+def valid_2_0_0_modeling_json():
+    with open(
+        PACKAGE_DIR / "schemas/modeling_input_2_0_0_sample_valid.json"
+    ) as modeling_input:
+        return json.load(modeling_input)
+
+
+def test_instrument__counts_keyword_calls():
+    profiler = module.ValidationProfiler()
+    validator = jsonschema.Draft202012Validator(SCHEMA)
+    profiled = profiler.instrument(validator, "test")
+    assert profiler.instrument(validator, "test") is profiled
+
+    assert profiled.is_valid({"a": 1, "b": "x"})
+    assert not profiled.is_valid({"a": -1, "b": "z"})
+    assert [e.message for e in profiled.iter_errors({"a": -1})] == [
+        e.message for e in validator.iter_errors({"a": -1})
+    ]
+    calls = {row.location: row.calls for row in profiler.rows()}
+    assert calls == {
+        "#/type": 3,
+        "#/properties": 3,
+        "#/properties/a/type": 3,
+        "#/properties/a/minimum": 3,
+        # is_valid stops at the first error, in a
+        "#/properties/b/allOf": 1,
+        "#/properties/b/allOf/0/type": 1,
+        "#/properties/b/allOf/1/enum": 1,
+    }
+
+
+def test_times_nest():
+    profiler = module.ValidationProfiler()
+    profiled = profiler.instrument(jsonschema.Draft202012Validator(SCHEMA), "test")
+    for _ in range(10):
+        profiled.is_valid({"a": 1, "b": "x"})
+    rows = {row.location: row for row in profiler.rows()}
+    assert profiler.rows()[0].location == "#/properties"
+    assert rows["#/properties"].total_ns >= (
+        rows["#/properties"].self_ns
+        + rows["#/properties/b/allOf"].total_ns
+        + rows["#/properties/a/type"].total_ns
+    )
+    assert rows["#/properties/b/allOf"].total_ns >= (
+        rows["#/properties/b/allOf/1/enum"].total_ns
+    )
+    # Every stack's self time adds up to the whole validation
+    assert sum(profiler.stacks.values()) == profiler.total_ns
+    assert profiler.total_ns == sum(
+        rows[location].total_ns for location in ["#/type", "#/properties"]
+    )
+    assert "#/properties/b/allOf" in profiler.format_table()
+    assert len(profiler.format_table(limit=2).splitlines()) == 3
+
+
+def test_write_collapsed():
+    profiler = module.ValidationProfiler()
+    profiled = profiler.instrument(jsonschema.Draft202012Validator(SCHEMA), "a;b c")
+    for _ in range(100):
+        profiled.is_valid({"a": 1, "b": "x"})
+    output = io.StringIO()
+    profiler.write_collapsed(output)
+    stacks = dict(line.rsplit(" ", 1) for line in output.getvalue().splitlines())
+    assert all(int(value) > 0 for value in stacks.values())
+    assert "a:b_c;#/properties;#/properties/b/allOf;#/properties/b/allOf/1/enum" in (
+        stacks
+    )
+
+
+def test_validate_profiling(valid_2_0_0_modeling_json):
+    versions = schemas.get_known_schemas_and_versions()["modeling_input"]
+    with validate.profiling() as profiler:
+        assert validate.find_valid_versions(
+            valid_2_0_0_modeling_json, "modeling_input", versions
+        ) == ["2.0.0"]
+        report = validate.check_versions(
+            {"input_schema_version": "2.0.0"},
+            "modeling_input",
+            ["2.0.0"],
+            max_errors=None,
+        )
+        assert not report.valid_versions
+    # Other versions are ruled out by their discriminators, without validating
+    assert {row.schema for row in profiler.rows()} == {"modeling_input 2.0.0"}
+    calls = {row.location: row.calls for row in profiler.rows()}
+    assert calls["#/properties"] == 2
+    assert calls["#/properties/survey/properties/systems/allOf"] == 1
+
+    validate.find_valid_versions(valid_2_0_0_modeling_json, "modeling_input", versions)
+    assert calls == {row.location: row.calls for row in profiler.rows()}
@@ -1,16 +1,25 @@
 import functools
+import hashlib
+import json
 import re
-from typing import Dict, List
+from pathlib import Path
+from typing import Dict, List, Tuple
 
-from raven_schemas.constants import SCHEMA_DIR
+from raven_schemas.constants import MANIFEST_PATH, PACKAGE_DIR, SCHEMA_DIR
 
-SCHEMA_DIR_FILES = list(SCHEMA_DIR.glob("*"))
 # Example: "schemas/modeling_input_1_2_3_schema.json"
 SCHEMA_FILE_REGEX = (
     r".*/(?P<schema_name>.*)_(?P<major>\d+)_(?P<minor>\d+)_(?P<patch>\d+)_schema.json"
 )
 
 
+def __getattr__(name: str):
+    # Only list the schemas directory when something actually asks for it
+    if name == "SCHEMA_DIR_FILES":
+        return list(SCHEMA_DIR.glob("*"))
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 def get_file_schema_and_version(file_path, regex):
     match = re.match(regex, str(file_path))
     if match is None:
@@ -24,21 +33,123 @@ def get_file_schema_and_version(file_path, regex):
     )
 
 
-@functools.cache
-def get_known_schemas_and_versions() -> Dict[str, List[str]]:
-    """All known schemas and versions supported in this library.
-    eg. {'modeling_input': ['1.0.0', '1.2.3'], ...}
+def build_manifest() -> Dict[str, Dict[str, Dict[str, str]]]:
+    """Scan the schemas directory for schema files.
+    eg. {'modeling_input': {'1.0.0': {'path': 'schemas/...json', 'sha256': '...'}, ...}, ...}
+    Versions are sorted by semver.
     """
-    schema_versions: Dict[str, List[str]] = {}
-    for file_path in SCHEMA_DIR_FILES:
+    found: Dict[str, List] = {}
+    for file_path in SCHEMA_DIR.glob("*"):
         try:
             schema_name, major, minor, patch = get_file_schema_and_version(
                 file_path, SCHEMA_FILE_REGEX
             )
         except ValueError:
             continue
-        else:
-            schema_versions.setdefault(schema_name, []).append(
-                f"{major}.{minor}.{patch}"
+        found.setdefault(schema_name, []).append(
+            ((int(major), int(minor), int(patch)), file_path)
+        )
+    return {
+        schema_name: {
+            ".".join(map(str, version)): {
+                "path": file_path.relative_to(PACKAGE_DIR).as_posix(),
+                "sha256": hashlib.sha256(file_path.read_bytes()).hexdigest(),
+            }
+            for version, file_path in sorted(files)
+        }
+        for schema_name, files in sorted(found.items())
+    }
+
+
+def write_manifest(path: Path = MANIFEST_PATH) -> Path:
+    """Write the manifest module that the schema lookups below read from"""
+    manifest = build_manifest()
+    lines = [
+        '"""Generated by `raven-schemas build-manifest`. Do not edit."""',
+        "",
+        "MANIFEST = {",
+    ]
+    for schema_name, versions in manifest.items():
+        lines.append(f"    {json.dumps(schema_name)}: {{")
+        for version, info in versions.items():
+            lines.append(f"        {json.dumps(version)}: {{")
+            lines.extend(
+                f"            {json.dumps(k)}: {json.dumps(v)},"
+                for k, v in info.items()
             )
-    return schema_versions
+            lines.append("        },")
+        lines.append("    },")
+    lines.append("}")
+    path.write_text("\n".join(lines) + "\n")
+    return path
+
+
+@functools.cache
+def get_manifest() -> Dict[str, Dict[str, Dict[str, str]]]:
+    """The precomputed manifest of schema files, see write_manifest"""
+    from raven_schemas.manifest import MANIFEST
+
+    return MANIFEST
+
+
+@functools.cache
+def get_known_schemas_and_versions() -> Dict[str, List[str]]:
+    """All known schemas and versions supported in this library.
+    eg. {'modeling_input': ['1.0.0', '1.2.3'], ...}
+    """
+    return {
+        schema_name: list(versions) for schema_name, versions in get_manifest().items()
+    }
+
+
+def _manifest_entry(schema_name: str, version: str) -> Dict[str, str]:
+    if "_" in version:
+        raise ValueError(
+            f"Version {version} should be in the form '1.0.0', not '1_0_0'"
+        )
+    try:
+        return get_manifest()[schema_name][version]
+    except KeyError:
+        raise ValueError(f"Schema {schema_name} version {version} not found")
+
+
+def get_schema_path(schema_name: str, version: str) -> Path:
+    """Path to the schema file for the given schema name at a specific version
+    @raises ValueError if the version is malformed or the schema isn't known.
+    """
+    return PACKAGE_DIR / _manifest_entry(schema_name, version)["path"]
+
+
+def get_schema_hash(schema_name: str, version: str) -> str:
+    """sha256 of the schema file's contents, as recorded in the manifest"""
+    return _manifest_entry(schema_name, version)["sha256"]
+
+
+def get_file_hash(schema_name: str, version: str) -> str:
+    """sha256 of the schema file's current contents. Unlike get_schema_hash, this changes as
+    soon as the file is edited, whether or not the manifest was rebuilt.
+    @raises ValueError if the version is malformed or the schema isn't known.
+    """
+    path = get_schema_path(schema_name, version)
+    stat = path.stat()
+    return _file_hash(path, stat.st_mtime_ns, stat.st_size)
+
+
+@functools.lru_cache(maxsize=None)
+def _file_hash(path: Path, mtime_ns: int, size: int) -> str:
+    # Keyed by the file's stat, so a file is only read again once it changes
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def load_schema(schema_name: str, version: str) -> dict:
+    """Read and parse the schema file for the given schema name at a specific version"""
+    with open(get_schema_path(schema_name, version)) as f:
+        return json.load(f)
+
+
+def load_schema_and_hash(schema_name: str, version: str) -> Tuple[dict, str]:
+    """Parse the schema file and hash the same bytes, so the hash is the one of the schema
+    returned even if the file is edited in between
+    """
+    raw = get_schema_path(schema_name, version).read_bytes()
+    return json.loads(raw), hashlib.sha256(raw).hexdigest()
@@ -197,3 +197,48 @@ def test_schemas_contain_correct_version():
             assert input_schema_version == f"{major}.{minor}.{patch}"
         else:
             pass
+
+
+def test_manifest_is_up_to_date():
+    """If this fails, run `raven-schemas build-manifest` and commit the result."""
+    assert module.get_manifest() == module.build_manifest()
+
+
+def test_known_versions_are_sorted():
+    versions = module.get_known_schemas_and_versions()["modeling_input"]
+    assert versions == sorted(versions, key=lambda v: tuple(map(int, v.split("."))))
+
+
+def test_get_schema_path():
+    assert module.get_schema_path("modeling_input", "1.0.0") == (
+        module.SCHEMA_DIR / "modeling_input_1_0_0_schema.json"
+    )
+    for schema_name, version in [("modeling_input", "1_0_0"), ("other", "1.0.0")]:
+        with pytest.raises(ValueError):
+            module.get_schema_path(schema_name, version)
+
+
+def test_get_file_hash(tmp_path, monkeypatch):
+    # The manifest is up to date (see above)
+    assert module.get_file_hash("modeling_input", "1.0.0") == module.get_schema_hash(
+        "modeling_input", "1.0.0"
+    )
+    path = tmp_path / "schema.json"
+    path.write_text("{}")
+    monkeypatch.setattr(module, "get_schema_path", lambda *args: path)
+    before = module.get_file_hash("modeling_input", "1.0.0")
+    path.write_text('{"type": "object"}')
+    assert module.get_file_hash("modeling_input", "1.0.0") != before
+
+
+def test_load_schema_and_hash():
+    schema, schema_hash = module.load_schema_and_hash("modeling_input", "1.0.0")
+    assert schema == module.load_schema("modeling_input", "1.0.0")
+    assert schema_hash == module.get_file_hash("modeling_input", "1.0.0")
+
+
+def test_write_manifest(tmp_path):
+    path = module.write_manifest(tmp_path / "manifest.py")
+    namespace: dict = {}
+    exec(path.read_text(), namespace)
+    assert namespace["MANIFEST"] == module.build_manifest()
@@ -0,0 +1,416 @@
+"""Local validation daemon: warm validators behind a Unix domain socket or a localhost HTTP port.
+
+Producers that can't import this package send documents over HTTP instead of starting the CLI
+for each one, so interpreter startup and schema loading are paid once, by the server.
+
+    POST /validate[?versions=1.2.0,2.0.0]   body: a document, or a JSON array of documents
+    GET /health
+
+A single document gets one verdict, `{"valid": ..., "valid_versions": [...], "error": ...}`, an
+array gets an array of verdicts in the same order. A Unix socket speaks the same HTTP
+(eg. `curl --unix-socket raven.sock http://localhost/validate -d @doc.json`).
+
+Documents of concurrent requests are validated together: while every worker is busy, MicroBatcher
+collects the documents that arrive, and sends them to the next free worker of the executor (see
+aio.make_executor) as one task, as validate_many does with chunks.
+"""
+import asyncio
+import contextlib
+import functools
+import json
+import os
+import signal
+import urllib.parse
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from raven_schemas import aio, schemas, validate
+from raven_schemas.constants import DEFAULT_CHUNKSIZE
+from raven_schemas.validate import Record, Verdict
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+MAX_BODY_SIZE = 64 << 20
+MAX_HEADERS = 100
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    413: "Payload Too Large",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error",
+}
+
+
+def validate_batch(
+    records: List[Record], schema_name: str, versions: List[str]
+) -> List[Verdict]:
+    """validate.validate_chunk, except that an unexpected error only fails the verdict of the
+    record it was raised for, not those of the other callers in the batch
+    """
+    verdicts = []
+    for record in records:
+        try:
+            verdicts.append(validate.validate_record(record, schema_name, versions))
+        except Exception as e:
+            verdicts.append(Verdict([], f"{e.__class__.__name__}: {e}"))
+    return verdicts
+
+
+def split_array(body: bytes) -> List[str]:
+    """Each document of a JSON array, as raw JSON for the worker that validates it
+    @raises ValueError or RecursionError if the body isn't valid JSON
+    """
+    # A string in the array is a document, not raw JSON to parse
+    return [json.dumps(document) for document in json.loads(body)]
+
+
+class MicroBatcher:
+    """Validates the records of concurrent callers in shared batches.
+
+    A batch of up to max_batch_size records is sent to the executor as soon as fewer than
+    max_in_flight batches are in it: an idle server validates each record right away, and
+    records only pile up into larger batches while every worker is busy.
+    """
+
+    def __init__(
+        self,
+        executor: Executor,
+        schema_name: str,
+        max_batch_size: int = DEFAULT_CHUNKSIZE,
+        max_in_flight: Optional[int] = None,
+    ):
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size must be at least 1, got {max_batch_size}")
+        self.executor = executor
+        self.schema_name = schema_name
+        self.max_batch_size = max_batch_size
+        self.max_in_flight = max_in_flight or os.cpu_count() or 1
+        # Records waiting for a batch, by the versions they're validated against
+        self._pending: Dict[Tuple[str, ...], List[Tuple[Record, asyncio.Future]]] = {}
+        self._in_flight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    async def validate(
+        self, records: List[Record], versions: Tuple[str, ...]
+    ) -> List[Verdict]:
+        """One Verdict per record, in order"""
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in records]
+        self._pending.setdefault(versions, []).extend(zip(records, futures))
+        self._send()
+        return list(await asyncio.gather(*futures))
+
+    def _send(self) -> None:
+        while self._pending and self._in_flight < self.max_in_flight:
+            versions = next(iter(self._pending))
+            waiting = self._pending.pop(versions)
+            if len(waiting) > self.max_batch_size:
+                self._pending[versions] = waiting[self.max_batch_size :]
+            # Records whose caller went away aren't validated
+            batch = [
+                (record, future)
+                for record, future in waiting[: self.max_batch_size]
+                if not future.done()
+            ]
+            if not batch:
+                continue
+            self._in_flight += 1
+            self._idle.clear()
+            validated = asyncio.get_running_loop().run_in_executor(
+                self.executor,
+                functools.partial(
+                    validate_batch,
+                    [record for record, _ in batch],
+                    self.schema_name,
+                    list(versions),
+                ),
+            )
+            validated.add_done_callback(functools.partial(self._done, batch))
+        if not self._pending and not self._in_flight:
+            self._idle.set()
+
+    def _done(
+        self, batch: List[Tuple[Record, asyncio.Future]], validated: asyncio.Future
+    ) -> None:
+        self._in_flight -= 1
+        for i, (_, future) in enumerate(batch):
+            if future.done():
+                continue
+            if validated.cancelled():
+                future.cancel()
+            elif validated.exception() is not None:
+                future.set_exception(validated.exception())
+            else:
+                future.set_result(validated.result()[i])
+        self._send()
+
+    async def aclose(self) -> None:
+        """Wait for every record to be validated"""
+        await self._idle.wait()
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(status, message)
+        self.status = status
+        self.message = message
+
+
+class Request(NamedTuple):
+    method: str
+    target: str
+    headers: Dict[str, str]
+    body: bytes
+    keep_alive: bool
+
+
+async def read_request(
+    reader: asyncio.StreamReader, max_body_size: int = MAX_BODY_SIZE
+) -> Optional[Request]:
+    """Read an HTTP/1.x request with a Content-Length body (if any)
+    @returns None if the connection was closed before a new request
+    @raises HttpError if the request is malformed or too large
+    """
+    try:
+        line = await reader.readline()
+        if not line.strip():
+            return None
+        parts = line.decode("latin-1").split()
+        if len(parts) != 3 or not parts[2].startswith("HTTP/1."):
+            raise HttpError(400, "Malformed request line")
+        method, target, http_version = parts
+        headers: Dict[str, str] = {}
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            name, separator, value = line.decode("latin-1").partition(":")
+            if not separator:
+                raise HttpError(400, "Malformed header")
+            headers[name.strip().lower()] = value.strip()
+            if len(headers) > MAX_HEADERS:
+                raise HttpError(431, f"More than {MAX_HEADERS} headers")
+    except ValueError:
+        # A line longer than the reader's limit
+        raise HttpError(431, "Request line or header too long") from None
+
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        raise HttpError(411, "Chunked bodies aren't supported, send a Content-Length")
+    try:
+        length = int(headers.get("content-length", "0"))
+    except ValueError:
+        raise HttpError(400, "Malformed Content-Length") from None
+    if not 0 <= length <= max_body_size:
+        raise HttpError(413, f"Bodies are limited to {max_body_size} bytes")
+    body = await reader.readexactly(length)
+    connection = headers.get("connection", "").lower()
+    keep_alive = (
+        connection != "close"
+        if http_version == "HTTP/1.1"
+        else connection == "keep-alive"
+    )
+    return Request(method, target, headers, body, keep_alive)
+
+
+def encode_response(status: int, body: Any, keep_alive: bool = True) -> bytes:
+    content = json.dumps(body).encode()
+    head = (
+        f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(content)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    return head.encode("latin-1") + content
+
+
+def verdict_json(verdict: Verdict) -> Dict[str, Any]:
+    return {
+        "valid": verdict.is_valid,
+        "valid_versions": verdict.valid_versions,
+        "error": verdict.error,
+    }
+
+
+class ValidationServer:
+    """Serves validation of one schema's documents over HTTP;
+    use as `async with ValidationServer(...) as server: await server.start(...)`
+    """
+
+    def __init__(
+        self,
+        schema_name: str,
+        versions: Optional[List[str]] = None,
+        executor: str = "process",
+        workers: Optional[int] = None,
+        max_batch_size: int = DEFAULT_CHUNKSIZE,
+        max_body_size: int = MAX_BODY_SIZE,
+    ):
+        if versions is None:
+            versions = schemas.get_known_schemas_and_versions()[schema_name]
+        self.schema_name = schema_name
+        self.versions = list(versions)
+        self.workers = workers or os.cpu_count() or 1
+        self.max_body_size = max_body_size
+        self.executor = aio.make_executor(
+            schema_name, self.versions, executor, self.workers
+        )
+        self.batcher = MicroBatcher(
+            self.executor,
+            schema_name,
+            max_batch_size,
+            # A batch is only sent once a worker can start on it
+            max_in_flight=self.workers,
+        )
+        self.unix_socket: Optional[str] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(
+        self,
+        host: str = DEFAULT_HOST,
+        port: int = DEFAULT_PORT,
+        unix_socket: Optional[str] = None,
+    ) -> str:
+        """Build the validators in every worker, then start listening
+        @returns the address the server listens on
+        """
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            *(
+                loop.run_in_executor(
+                    self.executor,
+                    validate.warm_worker,
+                    self.schema_name,
+                    self.versions,
+                )
+                for _ in range(self.workers)
+            )
+        )
+        if unix_socket is not None:
+            self._server = await asyncio.start_unix_server(
+                self._handle_connection, unix_socket
+            )
+            self.unix_socket = unix_socket
+            return f"unix:{unix_socket}"
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def __aenter__(self) -> "ValidationServer":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self.unix_socket is not None:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self.unix_socket)
+        await self.batcher.aclose()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            None,
+            functools.partial(self.executor.shutdown, wait=True, cancel_futures=True),
+        )
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                try:
+                    request = await read_request(reader, self.max_body_size)
+                except HttpError as e:
+                    # The rest of the request wasn't read, so the connection can't be reused
+                    writer.write(encode_response(e.status, {"error": e.message}, False))
+                    await writer.drain()
+                    return
+                if request is None:
+                    return
+                try:
+                    status, body = await self.handle(request)
+                except Exception as e:
+                    status, body = 500, {"error": f"{e.__class__.__name__}: {e}"}
+                writer.write(encode_response(status, body, request.keep_alive))
+                await writer.drain()
+                if not request.keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle(self, request: Request) -> Tuple[int, Any]:
+        """(HTTP status, JSON body) of the response to a request"""
+        url = urllib.parse.urlsplit(request.target)
+        if url.path == "/health":
+            if request.method != "GET":
+                return 405, {"error": "Use GET"}
+            return 200, {
+                "status": "ok",
+                "schema_name": self.schema_name,
+                "versions": self.versions,
+            }
+        if url.path != "/validate":
+            return 404, {"error": f"No such endpoint {url.path}, use /validate"}
+        if request.method != "POST":
+            return 405, {"error": "Use POST"}
+
+        versions = self.versions
+        query = urllib.parse.parse_qs(url.query)
+        if "versions" in query:
+            versions = [
+                version
+                for value in query["versions"]
+                for version in value.split(",")
+                if version
+            ]
+            unknown = [version for version in versions if version not in self.versions]
+            if unknown or not versions:
+                return 400, {
+                    "error": f"Versions {unknown} aren't served, expected some of {self.versions}"
+                }
+
+        if request.body.lstrip()[:1] != b"[":
+            # Parsed in the worker
+            [verdict] = await self.batcher.validate([request.body], tuple(versions))
+            return 200, verdict_json(verdict)
+        try:
+            # Bodies can be large, so they're parsed in the executor, not on the event loop
+            records: List[Record] = await asyncio.get_running_loop().run_in_executor(
+                self.executor, split_array, request.body
+            )
+        except (ValueError, RecursionError) as e:
+            return 400, {"error": f"Invalid JSON: {e}"}
+        verdicts = await self.batcher.validate(records, tuple(versions))
+        return 200, [verdict_json(verdict) for verdict in verdicts]
+
+
+def run(
+    schema_name: str,
+    versions: Optional[List[str]] = None,
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    unix_socket: Optional[str] = None,
+    on_ready: Callable[[str], None] = print,
+    **options,
+) -> None:
+    """Serve until SIGINT or SIGTERM. on_ready is called with the address once listening;
+    options are passed to ValidationServer.
+    """
+
+    async def serve():
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            with contextlib.suppress(NotImplementedError):
+                loop.add_signal_handler(signum, stop.set)
+        async with ValidationServer(schema_name, versions, **options) as server:
+            on_ready(await server.start(host, port, unix_socket))
+            await stop.wait()
+
+    asyncio.run(serve())
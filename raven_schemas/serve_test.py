@@ -0,0 +1,205 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from raven_schemas import aio
+from raven_schemas import serve as module
+from raven_schemas import validate
+from raven_schemas.constants import PACKAGE_DIR
+
+# Too deeply nested for json.loads
+DEEP = b'{"a": ' + b"[" * 100_000 + b"]" * 100_000 + b"}"
+
+
+@pytest.fixture
+def valid_1_0_0_modeling_json():
+    with open(
+        PACKAGE_DIR / "schemas/modeling_input_1_0_0_sample_valid.json"
+    ) as modeling_input:
+        return json.load(modeling_input)
+
+
+async def request(reader, writer, method, target, body=b"", headers=""):
+    writer.write(
+        f"{method} {target} HTTP/1.1\r\nHost: localhost\r\n{headers}"
+        f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while (line := await reader.readline()) != b"\r\n":
+        name, _, value = line.decode().partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+@pytest.mark.parametrize("executor", aio.EXECUTOR_KINDS)
+def test_server(valid_1_0_0_modeling_json, executor):
+    document = json.dumps(valid_1_0_0_modeling_json).encode()
+
+    async def main():
+        async with module.ValidationServer(
+            "modeling_input", ["1.0.0", "2.0.0"], executor=executor, workers=2
+        ) as server:
+            address = await server.start(port=0)
+            host, port = address.removeprefix("http://").split(":")
+            reader, writer = await asyncio.open_connection(host, int(port))
+            # Requests share the connection
+            responses = [
+                await request(reader, writer, "POST", "/validate", document),
+                await request(
+                    reader, writer, "POST", "/validate?versions=2.0.0", document
+                ),
+                await request(
+                    reader,
+                    writer,
+                    "POST",
+                    "/validate",
+                    b"[" + document + b', {"invalid": "data"}, "{}"]',
+                ),
+                await request(reader, writer, "POST", "/validate", b"{not json"),
+                await request(reader, writer, "GET", "/health"),
+            ]
+            errors = [
+                await request(reader, writer, "POST", "/validate", b"[1,"),
+                await request(reader, writer, "POST", "/validate", DEEP[5:-1]),
+                await request(reader, writer, "POST", "/validate?versions=3.0.0"),
+                await request(reader, writer, "GET", "/validate"),
+                await request(reader, writer, "GET", "/other"),
+            ]
+            writer.close()
+            return responses, errors
+
+    responses, errors = asyncio.run(main())
+    assert [status for status, _ in responses] == [200] * 5
+    single, other_version, batch, not_json, health = [body for _, body in responses]
+    assert single == {"valid": True, "valid_versions": ["1.0.0"], "error": None}
+    assert not other_version["valid"]
+    assert [verdict["valid"] for verdict in batch] == [True, False, False]
+    # A string is a document, not JSON to parse
+    assert "is not of type 'object'" in batch[2]["error"]
+    assert not_json["error"].startswith("Invalid JSON")
+    assert health["versions"] == ["1.0.0", "2.0.0"]
+    assert [status for status, _ in errors] == [400, 400, 400, 405, 404]
+
+
+def test_server__unix_socket(valid_1_0_0_modeling_json, tmp_path):
+    path = str(tmp_path / "raven.sock")
+
+    async def main():
+        async with module.ValidationServer(
+            "modeling_input", ["1.0.0"], executor="thread", workers=1
+        ) as server:
+            assert await server.start(unix_socket=path) == f"unix:{path}"
+            reader, writer = await asyncio.open_unix_connection(path)
+            response = await request(
+                reader,
+                writer,
+                "POST",
+                "/validate",
+                json.dumps(valid_1_0_0_modeling_json).encode(),
+                headers="Connection: close\r\n",
+            )
+            # The server closes the connection
+            assert await reader.read() == b""
+            writer.close()
+            return response
+
+    assert asyncio.run(main()) == (
+        200,
+        {"valid": True, "valid_versions": ["1.0.0"], "error": None},
+    )
+    assert not (tmp_path / "raven.sock").exists()
+
+
+@pytest.mark.parametrize(
+    "head, status",
+    [
+        (b"GET /\r\n", 400),
+        (b"POST /validate HTTP/1.1\r\nContent-Length: 100\r\n\r\n", 413),
+        (b"POST /validate HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n", 411),
+        (b"POST /validate HTTP/1.1\r\nContent-Length: ten\r\n\r\n", 400),
+    ],
+)
+def test_read_request__errors(head, status):
+    async def main():
+        reader = asyncio.StreamReader()
+        reader.feed_data(head)
+        reader.feed_eof()
+        with pytest.raises(module.HttpError) as error:
+            await module.read_request(reader, max_body_size=10)
+        return error.value.status
+
+    assert asyncio.run(main()) == status
+
+
+def test_micro_batcher(valid_1_0_0_modeling_json, monkeypatch):
+    batches = []
+    validate_batch = module.validate_batch
+
+    def record_batch(records, schema_name, versions):
+        batches.append(len(records))
+        return validate_batch(records, schema_name, versions)
+
+    monkeypatch.setattr(module, "validate_batch", record_batch)
+    records = [valid_1_0_0_modeling_json, {"invalid": "data"}] * 10
+
+    async def main():
+        with ThreadPoolExecutor(1) as executor:
+            batcher = module.MicroBatcher(
+                executor, "modeling_input", max_batch_size=8, max_in_flight=1
+            )
+            results = await asyncio.gather(
+                *(batcher.validate([record], ("1.0.0",)) for record in records)
+            )
+            await batcher.aclose()
+        return [verdict.is_valid for [verdict] in results]
+
+    assert asyncio.run(main()) == [True, False] * 10
+    # The first record is sent right away, the others wait for the worker to be free
+    assert batches == [1, 8, 8, 3]
+
+
+def test_micro_batcher__bad_record(valid_1_0_0_modeling_json):
+    records = [valid_1_0_0_modeling_json, DEEP, valid_1_0_0_modeling_json]
+
+    async def main():
+        with ThreadPoolExecutor(1) as executor:
+            batcher = module.MicroBatcher(
+                executor, "modeling_input", max_batch_size=8, max_in_flight=1
+            )
+            # The first record is sent alone, the others in one batch
+            results = await asyncio.gather(
+                *(batcher.validate([record], ("1.0.0",)) for record in records)
+            )
+            await batcher.aclose()
+        return [verdict for [verdict] in results]
+
+    good, bad, batched = asyncio.run(main())
+    assert good.is_valid and batched.is_valid
+    assert bad.error.startswith("Invalid JSON")
+
+
+def test_validate_batch__unexpected_error(valid_1_0_0_modeling_json, monkeypatch):
+    validate_record = validate.validate_record
+
+    def fail_on_lists(record, *args):
+        if isinstance(record, list):
+            raise KeyError("boom")
+        return validate_record(record, *args)
+
+    monkeypatch.setattr(validate, "validate_record", fail_on_lists)
+    good, bad = module.validate_batch(
+        [valid_1_0_0_modeling_json, []], "modeling_input", ["1.0.0"]
+    )
+    assert good.is_valid
+    assert not bad.is_valid and bad.error == "KeyError: 'boom'"
+
+
+def test_split_array():
+    assert module.split_array(b'[{"a": 1}, "{}"]') == ['{"a": 1}', '"{}"']
+    with pytest.raises(ValueError):
+        module.split_array(b"[1,")
@@ -0,0 +1,236 @@
+"""Parse and validate a raw JSON document in one pass over its top-level properties.
+
+The top-level object is read one property at a time with the json module's own (C) scanner,
+and every property is checked as soon as it has been parsed:
+- a key that a version doesn't allow (additionalProperties: false) rules the version out
+  before its value is parsed
+- discriminators (eg. input_schema_version) rule out versions that can't match
+- each value is validated against the version's subschema for that property
+Parsing stops as soon as no version is left, so an invalid document is usually rejected
+without building most of it. The remaining root keywords (required, ...) are checked at the end.
+
+A repeated top-level key falls back to parsing the whole document (json.loads keeps its last
+value); a document can still be rejected on an earlier value of the key before it's seen.
+"""
+import functools
+import json
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+
+import jsonschema
+
+from raven_schemas import codegen, discriminators, schemas, validate
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+_decoder = json.JSONDecoder()
+_scan_value = _decoder.scan_once
+_scan_string = json.decoder.scanstring
+_WHITESPACE = json.decoder.WHITESPACE.match
+# Key of the root keywords in _RootPlan.validators, can't clash with a property
+ROOT = ""
+
+
+class _RootPlan(NamedTuple):
+    """The root schema of a version, split into the checks made while parsing and after.
+    Checks are compiled (see codegen); jsonschema only runs to describe a failure.
+    """
+
+    # property -> compiled check of its subschema
+    checks: Dict[str, Callable[[Any], Optional[str]]]
+    # Whether properties other than the declared ones are rejected
+    closed: bool
+    # The root keywords other than the properties' subschemas
+    rest: Callable[[Any], Optional[str]]
+    # The same checks as jsonschema validators, for error messages
+    validators: Dict[str, "jsonschema.protocols.Validator"]
+
+
+@functools.cache
+def _root_plans(schema_name: str, versions: Tuple[str, ...]) -> Dict[str, _RootPlan]:
+    split: Dict[str, Tuple[dict, dict]] = {}
+    named_schemas: Dict[str, Any] = {}
+    for version in versions:
+        schema = validate.registry.get(schema_name, version).schema
+        properties = schema.get("properties", {})
+        rest = {key: value for key, value in schema.items() if key != "properties"}
+        if properties:
+            # additionalProperties needs to know the declared properties, not their schemas
+            rest["properties"] = {key: True for key in properties}
+        split[version] = (properties, rest)
+        named_schemas[f"{version} {ROOT}"] = rest
+        for key, subschema in properties.items():
+            named_schemas[f"{version} /{key}"] = subschema
+    # One module for every version, so that identical subschemas share a check
+    functions = codegen.compile_functions(named_schemas)
+
+    plans = {}
+    for version, (properties, rest) in split.items():
+        validator = validate.registry.get(schema_name, version)
+        schema = validator.schema
+        plans[version] = _RootPlan(
+            {key: functions[f"{version} /{key}"] for key in properties},
+            schema.get("additionalProperties", True) is False
+            and "patternProperties" not in schema,
+            functions[f"{version} {ROOT}"],
+            {
+                ROOT: validator.evolve(schema=rest),
+                **{
+                    key: validator.evolve(schema=subschema)
+                    for key, subschema in properties.items()
+                },
+            },
+        )
+    return plans
+
+
+def _decode(buf: Buffer) -> str:
+    data = bytes(buf) if isinstance(buf, memoryview) else buf
+    return data.decode(json.detect_encoding(data))
+
+
+def _error(message: str, doc: str, index: int) -> validate.ValidationError:
+    return validate.ValidationError(
+        f"Invalid JSON: {json.JSONDecodeError(message, doc, index)}"
+    )
+
+
+def _message(validator: "jsonschema.protocols.Validator", value: Any) -> str:
+    """The message find_valid_versions would give for a failed check"""
+    return jsonschema.exceptions.best_match(validator.iter_errors(value)).message
+
+
+def _raise(schema_name: str, versions: List[str], errors: Dict[str, str]):
+    raise validate.ValidationError(
+        f"Errors validating {schema_name}:\n"
+        + "\n  ".join(
+            f"Version {version}: {errors[version]}"
+            for version in versions
+            if version in errors
+        )
+    )
+
+
+def _parse_and_validate(
+    doc: str, schema_name: str, versions: List[str]
+) -> Tuple[Any, List[str]]:
+    try:
+        data = json.loads(doc)
+    except json.JSONDecodeError as e:
+        raise validate.ValidationError(f"Invalid JSON: {e}")
+    return data, validate.find_valid_versions(data, schema_name, versions)
+
+
+def validate_bytes(
+    buf: Buffer, schema_name: str, versions: List[str]
+) -> Tuple[Any, List[str]]:
+    """Parse and validate a raw JSON document, giving up as soon as no version can accept it.
+    @returns (the parsed document, the versions that accept it)
+    @raises validate.ValidationError if the JSON is malformed or none of the versions validate.
+    """
+    if not versions:
+        raise ValueError(f"Errors validating {schema_name}: no versions provided")
+    versions = list(versions)
+    try:
+        doc = _decode(buf)
+    except UnicodeDecodeError as e:
+        raise validate.ValidationError(f"Invalid JSON: {e}")
+    index = _WHITESPACE(doc, 0).end()
+    if not doc.startswith("{", index):
+        # Not an object, nothing to stream
+        return _parse_and_validate(doc, schema_name, versions)
+
+    known = schemas.get_known_schemas_and_versions().get(schema_name, [])
+    unknown = [version for version in versions if version not in known]
+    if unknown:
+        raise ValueError(f"Schema {schema_name} version {unknown[0]} not found")
+    plans = _root_plans(schema_name, tuple(known))
+    discriminator_index = discriminators.get_discriminator_index(schema_name)
+    discriminator_paths: Dict[str, List[Tuple[str, ...]]] = {}
+    for path in discriminators.DISCRIMINATOR_PATHS:
+        discriminator_paths.setdefault(path[0], []).append(path)
+    candidates = list(versions)
+    errors: Dict[str, str] = {}
+    data: Dict[str, Any] = {}
+
+    index = _WHITESPACE(doc, index + 1).end()
+    if doc.startswith("}", index):
+        index += 1
+    else:
+        while True:
+            if not doc.startswith('"', index):
+                raise _error(
+                    "Expecting property name enclosed in double quotes", doc, index
+                )
+            key, index = _scan_string(doc, index + 1)
+            for version in candidates:
+                plan = plans[version]
+                if plan.closed and key not in plan.checks:
+                    errors[
+                        version
+                    ] = f"Additional properties are not allowed ({key!r} was unexpected)"
+            candidates = [v for v in candidates if v not in errors]
+            if not candidates:
+                _raise(schema_name, versions, errors)
+
+            index = _WHITESPACE(doc, index).end()
+            if not doc.startswith(":", index):
+                raise _error("Expecting ':' delimiter", doc, index)
+            index = _WHITESPACE(doc, index + 1).end()
+            try:
+                value, index = _scan_value(doc, index)
+            except StopIteration as e:
+                raise _error("Expecting value", doc, e.value)
+            if key in data:
+                # json.loads keeps the last value of a repeated key, check the final document
+                return _parse_and_validate(doc, schema_name, versions)
+            data[key] = value
+
+            partial = {key: value}
+            for path in discriminator_paths.get(key, []):
+                accepted = discriminator_index.accepting_versions(partial, path)
+                for version in candidates:
+                    if (
+                        version in discriminator_index.versions
+                        and version not in accepted
+                    ):
+                        errors[version] = discriminator_index.message(
+                            partial, path, version
+                        )
+                candidates = [v for v in candidates if v not in errors]
+            results: Dict[Callable, Optional[str]] = {}
+            for version in candidates:
+                check = plans[version].checks.get(key)
+                if check is None:
+                    continue
+                if check not in results:
+                    results[check] = check(value)
+                if results[check] is not None:
+                    errors[version] = _message(plans[version].validators[key], value)
+            candidates = [v for v in candidates if v not in errors]
+            if not candidates:
+                _raise(schema_name, versions, errors)
+
+            index = _WHITESPACE(doc, index).end()
+            if doc.startswith(",", index):
+                index = _WHITESPACE(doc, index + 1).end()
+                continue
+            if doc.startswith("}", index):
+                index += 1
+                break
+            raise _error("Expecting ',' delimiter", doc, index)
+
+    if _WHITESPACE(doc, index).end() != len(doc):
+        raise _error("Extra data", doc, index)
+
+    # Discriminators that are missing from the document
+    candidates, rejected = discriminator_index.partition(data, candidates)
+    errors.update(rejected)
+    valid_versions = []
+    for version in candidates:
+        if plans[version].rest(data) is None:
+            valid_versions.append(version)
+        else:
+            errors[version] = _message(plans[version].validators[ROOT], data)
+    if not valid_versions:
+        _raise(schema_name, versions, errors)
+    return data, valid_versions
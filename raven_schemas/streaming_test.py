@@ -0,0 +1,100 @@
+import json
+
+import pytest
+
+from raven_schemas import schemas
+from raven_schemas import streaming as module
+from raven_schemas import validate
+from raven_schemas.constants import PACKAGE_DIR, SCHEMA_DIR
+
+ALL_VERSIONS = schemas.get_known_schemas_and_versions()["modeling_input"]
+
+
+@pytest.fixture
+def valid_2_0_0_bytes():
+    return (PACKAGE_DIR / "schemas/modeling_input_2_0_0_sample_valid.json").read_bytes()
+
+
+@pytest.mark.parametrize(
+    "path", sorted(SCHEMA_DIR.glob("modeling_input_*_sample_*.json")), ids=str
+)
+def test_validate_bytes__agrees_with_find_valid_versions(path):
+    raw = path.read_bytes()
+    try:
+        expected = validate.find_valid_versions(
+            json.loads(raw), "modeling_input", ALL_VERSIONS
+        )
+    except validate.ValidationError:
+        with pytest.raises(validate.ValidationError):
+            module.validate_bytes(raw, "modeling_input", ALL_VERSIONS)
+    else:
+        data, versions = module.validate_bytes(
+            memoryview(raw), "modeling_input", ALL_VERSIONS
+        )
+        assert versions == expected
+        assert data == json.loads(raw)
+
+
+def test_validate_bytes__rejects_unknown_key_before_parsing_its_value(
+    valid_2_0_0_bytes,
+):
+    # The value is malformed, but the key alone rules every version out
+    raw = b'{"unexpected": [1, 2' + valid_2_0_0_bytes
+    with pytest.raises(validate.ValidationError, match="'unexpected' was unexpected"):
+        module.validate_bytes(raw, "modeling_input", ["1.2.0", "2.0.0"])
+
+
+def test_validate_bytes__rejects_on_discriminator():
+    # The rest of the document is malformed, but the version alone rules 2.0.0 out
+    raw = b'{"input_schema_version": "1.0.0", "city": [[['
+    with pytest.raises(validate.ValidationError, match="Version 2.0.0: '1.0.0'"):
+        module.validate_bytes(raw, "modeling_input", ["2.0.0"])
+
+
+def test_validate_bytes__messages(valid_2_0_0_bytes):
+    document = json.loads(valid_2_0_0_bytes)
+    document["roofMaterial"] = "bogus"
+    del document["city"]
+    with pytest.raises(validate.ValidationError) as streamed:
+        module.validate_bytes(
+            json.dumps(document).encode(), "modeling_input", ["2.0.0"]
+        )
+    # The first error found, which isn't necessarily the one jsonschema's best_match picks
+    validator = validate.registry.get("modeling_input", "2.0.0")
+    assert str(streamed.value).startswith("Errors validating modeling_input:\n")
+    assert str(streamed.value).split("Version 2.0.0: ")[1] in {
+        error.message for error in validator.iter_errors(document)
+    }
+
+
+def test_validate_bytes__repeated_key_keeps_the_last_value(valid_2_0_0_bytes):
+    raw = valid_2_0_0_bytes.rstrip()[:-1] + b', "city": "Oakland"}'
+    data, versions = module.validate_bytes(raw, "modeling_input", ["2.0.0"])
+    assert versions == ["2.0.0"]
+    assert data["city"] == "Oakland"
+
+
+@pytest.mark.parametrize(
+    "raw",
+    [
+        b"",
+        b"{",
+        b'{"city" 1}',
+        b'{"city": }',
+        b'{"city": "x",}',
+        b'{"city": "x"} x',
+        b"\xff\xfe\xfd",
+    ],
+)
+def test_validate_bytes__invalid_json(raw):
+    with pytest.raises(validate.ValidationError, match="Invalid JSON"):
+        module.validate_bytes(raw, "modeling_input", ["2.0.0"])
+
+
+def test_validate_bytes__not_an_object():
+    with pytest.raises(validate.ValidationError):
+        module.validate_bytes(b"[1, 2]", "modeling_input", ["2.0.0"])
+    with pytest.raises(ValueError):
+        module.validate_bytes(b"{}", "modeling_input", [])
+    with pytest.raises(ValueError):
+        module.validate_bytes(b"{}", "modeling_input", ["9.9.9"])
@@ -1,49 +1,295 @@
+import contextlib
+import functools
+import itertools
 import json
-from typing import List
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
 
 import jsonschema
 
-from raven_schemas.constants import PACKAGE_DIR
+from raven_schemas import artifact, discriminators, metrics, optimize, schemas
+from raven_schemas.cache import CachedVerdict, VerdictCache, canonical_hash
+from raven_schemas.constants import DEFAULT_CHUNKSIZE, PACKAGE_DIR  # noqa: F401
+from raven_schemas.profiler import ValidationProfiler
+
+DEFAULT_REGISTRY_SIZE = 32
+
+# A record is either a parsed document or its raw JSON text
+Record = Union[dict, str, bytes]
 
 
 class ValidationError(ValueError):
     pass
 
 
-def validate_json_single_version(data: dict, schema_name: str, version: str):
-    """Validate the JSON schema for the given schema name at a specific version"""
-    if "_" in version:
-        raise ValueError(
-            f"Version {version} should be in the form '1.0.0', not '1_0_0'"
+# A validator and the sha256 of the schema file it was built from
+_RegistryEntry = Tuple["jsonschema.protocols.Validator", str]
+
+
+class ValidatorRegistry:
+    """Process-wide LRU cache of ready-to-use validators, keyed by (schema_name, version).
+
+    Each schema is read from disk and checked against its metaschema once, when its
+    validator is first built; later lookups are a dict hit. With optimize=True, validators
+    check an equivalent schema rewritten to be cheaper (see optimize.py), so schema paths in
+    their errors point into the rewritten schema. With prebuilt=True, schemas that are up to
+    date in the validator artifact (see artifact.py) are taken from it, already checked.
+
+    A validator keeps the schema it was built from until it's evicted or the registry is
+    cleared, even if the schema file is edited meanwhile; schema_hash() identifies that schema.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = DEFAULT_REGISTRY_SIZE,
+        optimize: bool = True,
+        prebuilt: bool = True,
+    ):
+        if maxsize < 1:
+            raise ValueError(f"maxsize must be at least 1, got {maxsize}")
+        self.maxsize = maxsize
+        self.optimize = optimize
+        self.prebuilt = prebuilt
+        self.hits = 0
+        self.misses = 0
+        self._validators: "OrderedDict[Tuple[str, str], _RegistryEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._validators)
+
+    def __contains__(self, key: Tuple[str, str]) -> bool:
+        return key in self._validators
+
+    def get(self, schema_name: str, version: str) -> "jsonschema.protocols.Validator":
+        """Return the validator for the given schema name and version, building it on a miss
+        @raises ValueError if the schema doesn't exist.
+        """
+        return self._entry(schema_name, version)[0]
+
+    def schema_hash(self, schema_name: str, version: str) -> str:
+        """sha256 of the schema file that get()'s validator was built from, building it on a
+        miss. Unlike schemas.get_file_hash, it doesn't change when the file is edited.
+        @raises ValueError if the schema doesn't exist.
+        """
+        return self._entry(schema_name, version)[1]
+
+    def _entry(self, schema_name: str, version: str) -> _RegistryEntry:
+        key = (schema_name, version)
+        recorder = metrics.current()
+        with self._lock:
+            entry = self._validators.get(key)
+            if entry is not None:
+                self.hits += 1
+                self._validators.move_to_end(key)
+            else:
+                self.misses += 1
+        if entry is not None:
+            if recorder is not None:
+                recorder.increment(
+                    "raven_schemas_registry_total",
+                    schema=schema_name,
+                    version=version,
+                    result="hit",
+                )
+            return entry
+        started = time.perf_counter()
+        entry = self._build(schema_name, version)
+        if recorder is not None:
+            recorder.increment(
+                "raven_schemas_registry_total",
+                schema=schema_name,
+                version=version,
+                result="miss",
+            )
+            recorder.observe(
+                "raven_schemas_validator_build_seconds",
+                time.perf_counter() - started,
+                schema=schema_name,
+                version=version,
+            )
+        with self._lock:
+            self._insert(key, entry)
+        return entry
+
+    def preload(
+        self, schema_name: str, versions: Optional[Iterable[str]] = None
+    ) -> None:
+        """Build validators ahead of time. Defaults to all known versions of the schema."""
+        if versions is None:
+            versions = schemas.get_known_schemas_and_versions()[schema_name]
+        for version in versions:
+            key = (schema_name, version)
+            if key in self._validators:
+                continue
+            entry = self._build(schema_name, version)
+            with self._lock:
+                self._insert(key, entry)
+
+    def clear(self) -> None:
+        """Drop every cached validator and reset the hit/miss counters."""
+        with self._lock:
+            self._validators.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._validators),
+            "maxsize": self.maxsize,
+        }
+
+    def _insert(self, key: Tuple[str, str], entry: _RegistryEntry) -> None:
+        self._validators[key] = entry
+        self._validators.move_to_end(key)
+        while len(self._validators) > self.maxsize:
+            self._validators.popitem(last=False)
+
+    def _build(self, schema_name: str, version: str) -> _RegistryEntry:
+        prebuilt = artifact.default_artifact() if self.prebuilt else None
+        schema = (
+            prebuilt.schema(schema_name, version, self.optimize) if prebuilt else None
         )
-    version_for_filename = version.replace(".", "_")
-    schema_path = (
-        PACKAGE_DIR / "schemas" / f"{schema_name}_{version_for_filename}_schema.json"
-    )
+        schema_hash = prebuilt.schema_hash(schema_name, version) if prebuilt else None
+        if schema is not None and schema_hash is not None:
+            cls = jsonschema.validators.validator_for(
+                schema, default=jsonschema.Draft202012Validator
+            )
+        else:
+            schema, schema_hash = schemas.load_schema_and_hash(schema_name, version)
+            cls = jsonschema.validators.validator_for(
+                schema, default=jsonschema.Draft202012Validator
+            )
+            cls.check_schema(schema)
+            if self.optimize:
+                schema = optimize.optimize_schema(schema)
+        if self.optimize:
+            return optimize.optimized_validator(schema, cls), schema_hash
+        return cls(schema), schema_hash
+
+
+registry = ValidatorRegistry()
+# Set while a profiling() block runs
+_profiler: Optional[ValidationProfiler] = None
+
+
+@contextlib.contextmanager
+def profiling() -> Iterator[ValidationProfiler]:
+    """Profile the schema keywords of the validations made in the block (in this process) by
+    validate_json_single_version, find_valid_versions and check_versions. See profiler.py.
+    """
+    global _profiler
+    previous, _profiler = _profiler, ValidationProfiler()
     try:
-        with open(schema_path) as f:
-            schema = json.load(f)
-    except FileNotFoundError:
-        raise ValueError(f"Schema {schema_name} version {version} not found")
-    return jsonschema.validate(schema=schema, instance=data)
+        yield _profiler
+    finally:
+        _profiler = previous
+
+
+def _validator(schema_name: str, version: str) -> "jsonschema.protocols.Validator":
+    validator = registry.get(schema_name, version)
+    if _profiler is not None:
+        return _profiler.instrument(validator, f"{schema_name} {version}")
+    return validator
+
+
+def validate_json_single_version(data: dict, schema_name: str, version: str):
+    """Validate the JSON schema for the given schema name at a specific version"""
+    validator = _validator(schema_name, version)
+    # Same error selection as jsonschema.validate, minus the per-call schema checks
+    error = jsonschema.exceptions.best_match(validator.iter_errors(data))
+    if error is not None:
+        raise error
 
 
 def find_valid_versions(
-    json_data: dict, schema_name: str, versions: List[str]
+    json_data: dict,
+    schema_name: str,
+    versions: List[str],
+    cache: Optional["VerdictCache"] = None,
 ) -> List[str]:
     """Find the first version in the list of versions that successfully validates
+    With a cache, verdicts of documents with the same content are reused (see raven_schemas.cache).
     @raises ValidationError if none of the versions validate.
     """
     errors = []  # dicts with versions and error messages
     valid_versions = []
+    recorder = metrics.current()
+    _, rejected = discriminators.get_discriminator_index(schema_name).partition(
+        json_data, versions
+    )
+    document_hash = None
     for version in versions:
-        try:
-            validate_json_single_version(json_data, schema_name, version)
-        except jsonschema.exceptions.ValidationError as e:
-            errors.append({"version": version, "message": e.message})
+        if version in rejected:
+            # Can't match this version's discriminators, skip the full validation
+            errors.append({"version": version, "message": rejected[version]})
+            if recorder is not None:
+                recorder.increment(
+                    "raven_schemas_validations_total",
+                    schema=schema_name,
+                    version=version,
+                    outcome="rejected",
+                )
+            continue
+        if cache is not None:
+            if document_hash is None:
+                document_hash = canonical_hash(json_data)
+            # The hash of the schema the verdict comes from, which may not be the file's
+            # current contents if it was edited after the validator was built
+            key = cache.key(
+                document_hash,
+                schema_name,
+                version,
+                registry.schema_hash(schema_name, version),
+            )
+            verdict = cache.get(key)
+            if recorder is not None:
+                recorder.increment(
+                    "raven_schemas_verdict_cache_total",
+                    schema=schema_name,
+                    version=version,
+                    result="miss" if verdict is None else "hit",
+                )
+            if verdict is None:
+                verdict = _verdict(json_data, schema_name, version, recorder)
+                cache.put(key, verdict)
         else:
-            # Successfully validated
+            verdict = _verdict(json_data, schema_name, version, recorder)
+        if verdict.is_valid:
             valid_versions.append(version)
+        else:
+            errors.append({"version": version, "message": verdict.message})
+        if recorder is not None:
+            recorder.increment(
+                "raven_schemas_validations_total",
+                schema=schema_name,
+                version=version,
+                outcome="valid" if verdict.is_valid else "invalid",
+            )
+    if recorder is not None:
+        recorder.increment(
+            "raven_schemas_documents_total",
+            schema=schema_name,
+            outcome="valid" if valid_versions else "invalid",
+        )
     if valid_versions:
         return valid_versions
     if errors:
@@ -55,3 +301,294 @@ def find_valid_versions(
     raise ValueError(
         f"Errors validating {schema_name}: we should have encountered a valid version or an error"
     )
+
+
+def _verdict(
+    json_data: dict,
+    schema_name: str,
+    version: str,
+    recorder: Optional[metrics.Metrics] = None,
+) -> CachedVerdict:
+    started = time.perf_counter() if recorder is not None else 0.0
+    try:
+        validate_json_single_version(json_data, schema_name, version)
+    except jsonschema.exceptions.ValidationError as e:
+        verdict = CachedVerdict(False, e.message)
+    else:
+        verdict = CachedVerdict(True)
+    if recorder is not None:
+        recorder.observe(
+            "raven_schemas_validation_seconds",
+            time.perf_counter() - started,
+            schema=schema_name,
+            version=version,
+        )
+    return verdict
+
+
+class ErrorDetail:
+    """One reason a document doesn't validate against a schema version.
+
+    Built from a jsonschema error (or a discriminator rejection) without formatting anything:
+    the paths and message are only rendered when they are read.
+    """
+
+    __slots__ = ("version", "keyword", "_error", "_path", "_message")
+
+    def __init__(
+        self,
+        version: str,
+        keyword: str,
+        error: Optional["jsonschema.exceptions.ValidationError"] = None,
+        path: Tuple[str, ...] = (),
+        message: Optional[Callable[[], str]] = None,
+    ):
+        self.version = version
+        self.keyword = keyword
+        self._error = error
+        # Document path and message factory, for errors that don't come from jsonschema
+        self._path = path
+        self._message = message
+
+    @classmethod
+    def from_error(
+        cls, version: str, error: "jsonschema.exceptions.ValidationError"
+    ) -> "ErrorDetail":
+        return cls(version, error.validator, error=error)
+
+    @property
+    def json_path(self) -> str:
+        """eg. '$.survey.systems.heating'"""
+        if self._error is not None:
+            return self._error.json_path
+        return "$" + "".join(f".{key}" for key in self._path)
+
+    @property
+    def schema_path(self) -> str:
+        """JSON pointer to the failing keyword in the schema, eg. '#/properties/survey/allOf/0/then'"""
+        if self._error is not None:
+            parts = self._error.absolute_schema_path
+        else:
+            parts = [part for key in self._path for part in ("properties", key)]
+            parts.append(self.keyword)
+        return "#/" + "/".join(str(part) for part in parts)
+
+    @property
+    def message(self) -> str:
+        if self._error is not None:
+            return self._error.message
+        return self._message()
+
+    def to_dict(self) -> Dict[str, str]:
+        return {
+            "version": self.version,
+            "json_path": self.json_path,
+            "schema_path": self.schema_path,
+            "keyword": self.keyword,
+            "message": self.message,
+        }
+
+    def __str__(self) -> str:
+        return f"Version {self.version}: {self.json_path}: {self.message}"
+
+    def __repr__(self) -> str:
+        return f"<ErrorDetail {self.version} {self.keyword} at {self.json_path}>"
+
+
+class ErrorReport(NamedTuple):
+    valid_versions: List[str]
+    # version -> errors, for the versions that didn't validate
+    errors: Dict[str, List[ErrorDetail]]
+
+
+def iter_error_details(
+    data: dict, schema_name: str, version: str
+) -> Iterator[ErrorDetail]:
+    """Lazily yield every error of the document against a schema version.
+    Stop iterating early to skip the rest of the validation.
+    """
+    validator = _validator(schema_name, version)
+    for error in validator.iter_errors(data):
+        yield ErrorDetail.from_error(version, error)
+
+
+def check_versions(
+    json_data: dict,
+    schema_name: str,
+    versions: List[str],
+    max_errors: Optional[int] = 1,
+) -> ErrorReport:
+    """Structured alternative to find_valid_versions, that doesn't raise or build error strings.
+    max_errors bounds the errors collected per failing version: 1 (the default) stops validating a
+    version at its first error, None collects all of them.
+    """
+    if max_errors is not None and max_errors < 1:
+        raise ValueError(f"max_errors must be at least 1 or None, got {max_errors}")
+    if not versions:
+        raise ValueError(f"Errors validating {schema_name}: no versions provided")
+    index = discriminators.get_discriminator_index(schema_name)
+    _, rejected = index.rejected_paths(json_data, versions)
+    valid_versions = []
+    errors: Dict[str, List[ErrorDetail]] = {}
+    for version in versions:
+        if version in rejected:
+            path = rejected[version]
+            keyword = index.keyword(json_data, path, version)
+            errors[version] = [
+                ErrorDetail(
+                    version,
+                    keyword,
+                    # Like jsonschema, missing and unexpected properties are errors of their parent
+                    path=path if keyword in ("const", "enum") else path[:-1],
+                    message=functools.partial(index.message, json_data, path, version),
+                )
+            ]
+            continue
+        found = list(
+            itertools.islice(
+                iter_error_details(json_data, schema_name, version), max_errors
+            )
+        )
+        if found:
+            errors[version] = found
+        else:
+            valid_versions.append(version)
+    return ErrorReport(valid_versions, errors)
+
+
+class Verdict(NamedTuple):
+    """Outcome of validating one record against a list of versions"""
+
+    valid_versions: List[str]
+    error: Optional[str] = None
+    # aggregate.ErrorKey of every error of an invalid record, when asked for
+    errors: Tuple[Any, ...] = ()
+
+    @property
+    def is_valid(self) -> bool:
+        return bool(self.valid_versions)
+
+
+def validate_record(
+    record: Record, schema_name: str, versions: List[str], details: bool = False
+) -> Verdict:
+    """find_valid_versions for a single record, reporting failures in the verdict instead of raising.
+    Raw JSON records are parsed first; parse errors are reported as failures too, as are
+    records nested too deeply to parse or validate.
+    With details, the verdict of an invalid record holds the keys of all its errors (see aggregate).
+    """
+    from raven_schemas import aggregate
+
+    if isinstance(record, (str, bytes, bytearray)):
+        try:
+            record = json.loads(record)
+        except (ValueError, RecursionError) as e:
+            errors = (aggregate.INVALID_JSON,) if details else ()
+            return Verdict([], f"Invalid JSON: {e}", errors)
+    try:
+        try:
+            return Verdict(find_valid_versions(record, schema_name, versions))
+        except ValidationError as e:
+            if not details:
+                return Verdict([], str(e))
+            return Verdict(
+                [], str(e), tuple(aggregate.error_keys(record, schema_name, versions))
+            )
+    except RecursionError as e:
+        errors = (aggregate.TOO_DEEP,) if details else ()
+        return Verdict([], f"Nested too deeply to validate: {e}", errors)
+
+
+def warm_worker(schema_name: str, versions: List[str]) -> None:
+    """Build what validating records of these versions needs, eg. in a new worker process"""
+    registry.preload(schema_name, versions)
+    discriminators.get_discriminator_index(schema_name)
+
+
+def validate_chunk(
+    records: List[Record], schema_name: str, versions: List[str], details: bool = False
+) -> List[Verdict]:
+    """validate_record for each of a chunk of records, the unit of work of a worker process"""
+    return [
+        validate_record(record, schema_name, versions, details) for record in records
+    ]
+
+
+def chunked(items: Iterable[Any], chunksize: int) -> Iterator[List[Any]]:
+    """Lists of up to chunksize consecutive items, taken from the iterable as they're needed"""
+    iterator = iter(items)
+    while chunk := list(itertools.islice(iterator, chunksize)):
+        yield chunk
+
+
+def map_chunks(
+    function: Callable[..., List[Any]],
+    chunks: Iterable[Any],
+    args: Tuple[Any, ...],
+    workers: int,
+    max_in_flight: Optional[int] = None,
+    initializer: Optional[Callable[..., None]] = None,
+    initargs: Tuple[Any, ...] = (),
+) -> Iterator[Any]:
+    """Call function(chunk, *args) for each chunk across a pool of worker processes, yielding
+    the items of the lists it returns, in order.
+
+    Chunks are consumed lazily: at most `max_in_flight` of them (default: two per worker) are
+    submitted at once. initializer(*initargs) runs once in each worker process.
+    """
+    if max_in_flight is None:
+        max_in_flight = 2 * workers
+    pool = ProcessPoolExecutor(
+        max_workers=workers, initializer=initializer, initargs=initargs
+    )
+    pending: Deque[Future] = deque()
+    try:
+        for chunk in chunks:
+            pending.append(pool.submit(function, chunk, *args))
+            if len(pending) >= max_in_flight:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def validate_many(
+    records: Iterable[Record],
+    schema_name: str,
+    versions: Optional[List[str]] = None,
+    workers: Optional[int] = None,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    max_in_flight: Optional[int] = None,
+    details: bool = False,
+) -> Iterator[Verdict]:
+    """Validate many records across a pool of worker processes, yielding one Verdict per record, in order.
+
+    Records are consumed lazily: at most `max_in_flight` chunks of `chunksize` records
+    (default: two chunks per worker) are submitted at once, so memory stays flat on unbounded input.
+    workers defaults to the number of CPUs; with workers <= 1 everything runs in this process.
+    details is passed on to validate_record.
+    """
+    if versions is None:
+        versions = schemas.get_known_schemas_and_versions()[schema_name]
+    versions = list(versions)
+    if chunksize < 1:
+        raise ValueError(f"chunksize must be at least 1, got {chunksize}")
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if workers <= 1:
+        warm_worker(schema_name, versions)
+        for record in records:
+            yield validate_record(record, schema_name, versions, details)
+        return
+
+    yield from map_chunks(
+        validate_chunk,
+        chunked(records, chunksize),
+        (schema_name, versions, details),
+        workers,
+        max_in_flight,
+        initializer=warm_worker,
+        initargs=(schema_name, versions),
+    )
@@ -2,6 +2,7 @@ import json
 
 import pytest
 
+from raven_schemas import aggregate
 from raven_schemas import validate as module
 
 
@@ -51,3 +52,176 @@ def test_find_valid_versions__no_versions_provided():
 def test_find_valid_versions__no_versions_validated():
     with pytest.raises(module.ValidationError):
         module.find_valid_versions({"invalid": "data"}, "modeling_input", ["1.0.0"])
+
+
+def test_validator_registry__hits_and_misses():
+    registry = module.ValidatorRegistry(maxsize=4)
+    first = registry.get("modeling_input", "1.0.0")
+    assert registry.get("modeling_input", "1.0.0") is first
+    assert registry.stats() == {"hits": 1, "misses": 1, "size": 1, "maxsize": 4}
+
+
+def test_validator_registry__evicts_least_recently_used():
+    registry = module.ValidatorRegistry(maxsize=2)
+    registry.get("modeling_input", "1.0.0")
+    registry.get("modeling_input", "1.0.1")
+    registry.get("modeling_input", "1.0.0")
+    registry.get("modeling_input", "1.1.0")
+    assert ("modeling_input", "1.0.0") in registry
+    assert ("modeling_input", "1.0.1") not in registry
+    assert len(registry) == 2
+
+
+def test_validator_registry__preload_and_clear():
+    registry = module.ValidatorRegistry()
+    registry.preload("modeling_input", ["1.0.0", "2.0.0"])
+    assert len(registry) == 2
+    registry.get("modeling_input", "2.0.0")
+    assert registry.hits == 1
+    registry.clear()
+    assert len(registry) == 0
+    assert registry.hits == registry.misses == 0
+
+
+def test_validator_registry__schema_hash(tmp_path, monkeypatch):
+    registry = module.ValidatorRegistry(prebuilt=False)
+    schema_hash = registry.schema_hash("modeling_input", "1.0.0")
+    assert schema_hash == module.schemas.get_file_hash("modeling_input", "1.0.0")
+    # Still the hash of the schema the cached validator was built from once the file changes
+    edited = tmp_path / "modeling_input_1_0_0_schema.json"
+    edited.write_text("{}")
+    monkeypatch.setattr(module.schemas, "get_schema_path", lambda *args: edited)
+    assert registry.schema_hash("modeling_input", "1.0.0") == schema_hash
+    registry.clear()
+    assert registry.schema_hash("modeling_input", "1.0.0") != schema_hash
+
+
+def test_validator_registry__unknown_version():
+    registry = module.ValidatorRegistry()
+    with pytest.raises(ValueError):
+        registry.get("modeling_input", "9.9.9")
+    assert len(registry) == 0
+
+
+def test_find_valid_versions__all_versions(valid_1_0_0_modeling_json):
+    versions = module.schemas.get_known_schemas_and_versions()["modeling_input"]
+    assert module.find_valid_versions(
+        valid_1_0_0_modeling_json, "modeling_input", versions
+    ) == ["1.0.0"]
+
+
+def test_find_valid_versions__rejected_by_discriminator(valid_1_0_0_modeling_json):
+    with pytest.raises(module.ValidationError, match="Version 2.0.0: '1.0.0'"):
+        module.find_valid_versions(
+            valid_1_0_0_modeling_json, "modeling_input", ["2.0.0"]
+        )
+
+
+def test_validate_record__invalid_json():
+    verdict = module.validate_record("{not json", "modeling_input", ["1.0.0"])
+    assert not verdict.is_valid
+    assert verdict.error.startswith("Invalid JSON")
+
+
+def test_validate_record__too_deep(valid_1_0_0_modeling_json):
+    verdict = module.validate_record(
+        '{"a": ' + "[" * 100_000 + "]" * 100_000 + "}", "modeling_input", ["1.0.0"]
+    )
+    assert not verdict.is_valid
+    assert verdict.error.startswith("Invalid JSON")
+    # Parsed documents can be deeper than the validator can recurse
+    deepest = valid_1_0_0_modeling_json["roofMaterial"] = []
+    for _ in range(100_000):
+        deepest.append([])
+        deepest = deepest[0]
+    verdict = module.validate_record(
+        valid_1_0_0_modeling_json, "modeling_input", ["1.0.0"], details=True
+    )
+    assert verdict.error.startswith("Nested too deeply")
+    assert verdict.errors == (aggregate.TOO_DEEP,)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_validate_many__ordered_verdicts(valid_1_0_0_modeling_json, workers):
+    records = [valid_1_0_0_modeling_json, {"invalid": "data"}] * 5 + [
+        json.dumps(valid_1_0_0_modeling_json)
+    ]
+    verdicts = list(
+        module.validate_many(
+            records,
+            "modeling_input",
+            ["1.0.0", "2.0.0"],
+            workers=workers,
+            chunksize=3,
+            max_in_flight=2,
+        )
+    )
+    assert [v.valid_versions for v in verdicts] == [["1.0.0"], []] * 5 + [["1.0.0"]]
+    assert all(v.error is None for v in verdicts[::2])
+    assert "Version 2.0.0" in verdicts[1].error
+
+
+def test_validate_many__lazy_input(valid_1_0_0_modeling_json):
+    consumed = []
+
+    def records():
+        for i in range(1000):
+            consumed.append(i)
+            yield valid_1_0_0_modeling_json
+
+    verdicts = module.validate_many(
+        records(), "modeling_input", ["1.0.0"], workers=2, chunksize=10
+    )
+    assert next(verdicts).is_valid
+    assert len(consumed) < 1000
+    verdicts.close()
+
+
+def test_map_chunks():
+    chunks = module.chunked([3, 1, 2, 5, 4], 2)
+    results = module.map_chunks(sorted, chunks, (), workers=2, max_in_flight=1)
+    assert list(results) == [1, 3, 2, 5, 4]
+
+
+def test_check_versions__structured_errors(valid_1_0_0_modeling_json):
+    valid_1_0_0_modeling_json["roofMaterial"] = "bogus"
+    del valid_1_0_0_modeling_json["city"]
+    report = module.check_versions(
+        valid_1_0_0_modeling_json, "modeling_input", ["1.0.0"], max_errors=None
+    )
+    assert report.valid_versions == []
+    errors = {(e.keyword, e.json_path) for e in report.errors["1.0.0"]}
+    assert errors == {("required", "$"), ("enum", "$.roofMaterial")}
+    enum_error = next(e for e in report.errors["1.0.0"] if e.keyword == "enum")
+    assert enum_error.schema_path == "#/properties/roofMaterial/enum"
+    assert "'bogus' is not one of" in enum_error.message
+    assert enum_error.to_dict()["version"] == "1.0.0"
+
+
+def test_check_versions__fail_fast(valid_1_0_0_modeling_json):
+    valid_1_0_0_modeling_json["roofMaterial"] = "bogus"
+    del valid_1_0_0_modeling_json["city"]
+    for max_errors, expected in [(1, 1), (2, 2), (10, 2)]:
+        report = module.check_versions(
+            valid_1_0_0_modeling_json,
+            "modeling_input",
+            ["1.0.0"],
+            max_errors=max_errors,
+        )
+        assert len(report.errors["1.0.0"]) == expected
+    with pytest.raises(ValueError):
+        module.check_versions(
+            valid_1_0_0_modeling_json, "modeling_input", ["1.0.0"], max_errors=0
+        )
+
+
+def test_check_versions__rejected_by_discriminator(valid_1_0_0_modeling_json):
+    report = module.check_versions(
+        valid_1_0_0_modeling_json, "modeling_input", ["1.0.0", "2.0.0"]
+    )
+    assert report.valid_versions == ["1.0.0"]
+    (error,) = report.errors["2.0.0"]
+    assert (error.keyword, error.json_path) == ("const", "$.input_schema_version")
+    assert error.schema_path == "#/properties/input_schema_version/const"
+    assert error.message.startswith("'1.0.0' at 'input_schema_version'")
+    assert str(error).startswith("Version 2.0.0: $.input_schema_version: ")